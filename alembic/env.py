@@ -66,7 +66,10 @@ def run_migrations_online():
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            # commit each revision before the next starts, so a backfill (which runs on its own
+            # connections) sees the schema changes of the revisions before it
+            transaction_per_migration=True
         )
 
         with context.begin_transaction():
@@ -0,0 +1,27 @@
+"""Pack vote rankings
+
+Revision ID: 4c6b0e8a1f52
+Revises: e18a4f7c9b20
+Create Date: 2026-10-19 17:26:09.318604
+
+Adds votes.packed_ranking. Revision 7a1f3c5d9e62 fills it in for votes cast before it existed;
+until then the app reads their rankings rows.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c6b0e8a1f52'
+down_revision = 'e18a4f7c9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('votes', sa.Column('packed_ranking', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('votes', 'packed_ranking')
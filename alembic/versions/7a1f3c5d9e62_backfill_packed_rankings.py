@@ -0,0 +1,60 @@
+"""Backfill packed rankings
+
+Revision ID: 7a1f3c5d9e62
+Revises: b5d3e9a27c14
+Create Date: 2026-10-19 19:12:55.804117
+
+Packs the rankings of votes cast before votes.packed_ranking existed, a chunk of votes per
+transaction. The rankings rows are left in place. If it is interrupted, running the upgrade again
+only packs the votes that are still unpacked.
+
+"""
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+from membership.database.util import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1f3c5d9e62'
+down_revision = 'b5d3e9a27c14'
+branch_labels = None
+depends_on = None
+
+votes = sa.table('votes', sa.column('id', sa.Integer), sa.column('packed_ranking', sa.LargeBinary))
+rankings = sa.table('rankings', sa.column('id', sa.Integer), sa.column('vote_id', sa.Integer),
+                    sa.column('rank', sa.Integer), sa.column('candidate_id', sa.Integer))
+
+
+def pack_ranking(candidate_ids):
+    # same format as membership.database.models.pack_ranking, copied so the migration does not
+    # change if the model does
+    return struct.pack('<{}I'.format(len(candidate_ids)), *candidate_ids)
+
+
+def pack_votes(connection, vote_ids):
+    ranked = {}
+    for vote_id, candidate_id in connection.execute(
+            sa.select([rankings.c.vote_id, rankings.c.candidate_id])
+            .where(rankings.c.vote_id.in_(vote_ids))
+            .order_by(rankings.c.vote_id, rankings.c.rank, rankings.c.id)):
+        ranked.setdefault(vote_id, []).append(candidate_id)
+    connection.execute(
+        votes.update().where(votes.c.id == sa.bindparam('vote_id'))
+        .values(packed_ranking=sa.bindparam('packed')),
+        [{'vote_id': vote_id, 'packed': pack_ranking(candidate_ids)}
+         for vote_id, candidate_ids in ranked.items()])
+
+
+def upgrade():
+    # votes without rankings are ballots that were never filled in, and stay unpacked
+    backfill(op.get_bind().engine, votes.c.id, pack_votes,
+             where=sa.and_(votes.c.packed_ranking.is_(None),
+                           sa.exists().where(rankings.c.vote_id == votes.c.id)))
+
+
+def downgrade():
+    # packed_ranking is dropped by the downgrade of 4c6b0e8a1f52
+    pass
@@ -0,0 +1,42 @@
+"""Add attendance summaries
+
+Revision ID: a3d91c6e02b4
+Revises: 5b2e8c1f4a7d
+Create Date: 2026-10-19 13:40:02.551370
+
+Run `flask rebuild-attendance` after upgrading to fill the table from existing attendees.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d91c6e02b4'
+down_revision = '5b2e8c1f4a7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attendance_summaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('member_id', sa.Integer(), nullable=False),
+    sa.Column('committee_id', sa.Integer(), nullable=True),
+    sa.Column('period', sa.String(length=7), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['committee_id'], ['committees.id'], ),
+    sa.ForeignKeyConstraint(['member_id'], ['members.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('id')
+    )
+    op.create_index('ix_attendance_summaries_member', 'attendance_summaries',
+                    ['member_id', 'committee_id', 'period'], unique=False)
+    op.create_index('ix_attendance_summaries_committee', 'attendance_summaries',
+                    ['committee_id', 'period'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_attendance_summaries_committee', table_name='attendance_summaries')
+    op.drop_index('ix_attendance_summaries_member', table_name='attendance_summaries')
+    op.drop_table('attendance_summaries')
@@ -0,0 +1,34 @@
+"""Unique attendee per meeting
+
+Revision ID: c7f04be9d315
+Revises: a3d91c6e02b4
+Create Date: 2026-10-19 15:02:31.084112
+
+Duplicate check-ins are deleted before the constraint is added, so run
+`flask rebuild-attendance` afterwards to drop them from the attendance summaries.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f04be9d315'
+down_revision = 'a3d91c6e02b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep the first check-in of every member at every meeting; the derived table lets MySQL
+    # delete from the table it is selecting from
+    op.execute(
+        'DELETE FROM attendees WHERE id NOT IN (SELECT id FROM ('
+        'SELECT MIN(id) AS id FROM attendees GROUP BY meeting_id, member_id) AS keep)'
+    )
+    op.create_unique_constraint('uq_attendees_meeting_member', 'attendees',
+                                ['meeting_id', 'member_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_attendees_meeting_member', 'attendees', type_='unique')
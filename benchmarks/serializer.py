@@ -0,0 +1,86 @@
+"""Compares the mapper-driven model serializer against the dir()-based encoder it replaced.
+
+    python -m benchmarks.serializer [members] [roles per member]
+
+Members are loaded together with their roles and committees, then dumped with roles expanded.
+"""
+import json
+import os
+import sys
+import time
+from enum import Enum
+from typing import List
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from membership.database.base import create_engine_from_settings, metadata  # NOQA
+from membership.database.models import Committee, Member, Role  # NOQA
+from membership.web.util import new_alchemy_encoder  # NOQA
+from sqlalchemy.ext.declarative import DeclarativeMeta  # NOQA
+from sqlalchemy.orm import joinedload, sessionmaker  # NOQA
+
+
+def legacy_alchemy_encoder(fields_to_expand: List[str]=[]):
+    """ The encoder as it was before it was driven by the mapper. """
+    _visited_objs = []  # type: List[DeclarativeMeta]
+
+    class AlchemyEncoder(json.JSONEncoder):
+        def default(self, obj):
+            if isinstance(obj.__class__, DeclarativeMeta):
+                if obj in _visited_objs:
+                    return None
+                _visited_objs.append(obj)
+                fields = {}
+                for field in [x for x in dir(obj) if not x.startswith('_') and x != 'metadata']:
+                    val = obj.__getattribute__(field)
+                    if callable(val):
+                        continue
+                    if isinstance(val, Enum):
+                        val = val.name
+                    elif isinstance(val.__class__, DeclarativeMeta) \
+                            or (isinstance(val, list) and len(val) > 0  # NOQA
+                                and isinstance(val[0].__class__, DeclarativeMeta)):  # NOQA
+                        if field not in fields_to_expand:
+                            continue
+                    fields[field] = val
+                return fields
+            return json.JSONEncoder.default(self, obj)
+
+    return AlchemyEncoder
+
+
+def load(members: int, roles: int):
+    engine = create_engine_from_settings({'name_or_url': 'sqlite://'})
+    metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    committees = [Committee(name='Committee {}'.format(i)) for i in range(roles)]
+    for i in range(members):
+        member = Member(first_name='Member', last_name=str(i),
+                        email_address='{}@example.com'.format(i), biography='bio')
+        session.add(member)
+        session.add_all(Role(member=member, committee=committee, role='member')
+                        for committee in committees)
+    session.commit()
+    session.close()
+    session = sessionmaker(bind=engine)()
+    return session.query(Member) \
+        .options(joinedload(Member.roles).joinedload(Role.committee)).all()
+
+
+def timed(encoder, objects) -> float:
+    start = time.perf_counter()
+    json.dumps(objects, cls=encoder)
+    return time.perf_counter() - start
+
+
+def main(members: int=2000, roles: int=3) -> None:
+    objects = load(members, roles)
+    # the legacy encoder lazily loads every unexpanded relationship; warm both up identically
+    json.dumps(objects, cls=legacy_alchemy_encoder(['roles']))
+    for name, factory in (('legacy', legacy_alchemy_encoder), ('mapper', new_alchemy_encoder)):
+        seconds = timed(factory(['roles']), objects)
+        print('{:>8}: {} members x {} roles in {:.3f}s'.format(name, members, roles, seconds))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,36 @@
+"""Measures how long a fresh process takes to import the app, create it and serve a request.
+
+    python -m benchmarks.startup [runs]
+
+Each run is a new interpreter, so nothing is cached between runs; the median is reported.
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = '''
+import json, os, time
+os.environ.setdefault('USE_AUTH', 'FALSE')
+start = time.perf_counter()
+from membership.web.base_app import create_app
+imported = time.perf_counter()
+app = create_app({'DATABASE': {'name_or_url': 'sqlite://'}})
+created = time.perf_counter()
+app.test_client().get('/health')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': served - created}))
+'''
+
+
+def main(runs: int=10) -> None:
+    samples = [json.loads(subprocess.check_output([sys.executable, '-c', PROBE]).decode('utf-8'))
+               for _ in range(runs)]
+    for phase in ('import', 'create_app', 'first_request'):
+        print('{:>14}: {:.1f} ms'.format(
+            phase, statistics.median(sample[phase] for sample in samples) * 1000))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
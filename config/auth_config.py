@@ -15,3 +15,5 @@ AUTH_CONNECTION = os.environ.get('AUTH_CONNECTION', 'DSASF-Dev')
 ADMIN_CLIENT_ID = os.environ.get('ADMIN_CLIENT_ID', None)
 ADMIN_CLIENT_SECRET = os.environ.get('ADMIN_CLIENT_SECRET', None)
 
+# how many Auth0 accounts are created in parallel when onboarding members in bulk
+AUTH0_PROVISION_CONCURRENCY = int(os.environ.get('AUTH0_PROVISION_CONCURRENCY', '4'))
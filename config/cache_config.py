@@ -0,0 +1,13 @@
+import os
+
+# seconds a cached response body is kept in-process; it is only served while the versions of the
+# tables it was built from are unchanged
+RESPONSE_CACHE_SECONDS = float(os.environ.get('RESPONSE_CACHE_SECONDS', '300'))
+
+# most response bodies kept in-process
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+
+# seconds a ballot definition (GET /election) is kept in-process and may be cached by clients;
+# ballot definitions of final elections never change and may be cached by clients for a day
+BALLOT_CACHE_SECONDS = float(os.environ.get('BALLOT_CACHE_SECONDS', '60'))
+FINAL_BALLOT_MAX_AGE = 24 * 60 * 60
@@ -1,7 +1,37 @@
 import os
 
 DATABASE_URL = os.environ.get('DATABASE_URL', 'mysql://root@localhost:3306/dsa')
-settings = {'name_or_url': DATABASE_URL, 'pool_size': 10, 'pool_recycle': 3600}
+
+# connection pool tuning, ignored for sqlite which does not use a QueuePool
+POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '10'))
+MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', '30'))
+POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', '3600'))
+
+# connections the database allows all web workers together, 0 for no limit; `make serve` splits
+# it between worker processes
+MAX_CONNECTIONS = int(os.environ.get('DATABASE_MAX_CONNECTIONS', '0'))
+
+# how pooled connections are checked before use:
+#   checkout   - ping on every checkout
+#   idle       - ping only when the connection has been idle for LIVENESS_IDLE_SECONDS
+#   optimistic - never ping, drop the pool when a query fails with a disconnect error
+LIVENESS_CHECK = os.environ.get('DATABASE_LIVENESS_CHECK', 'checkout')
+LIVENESS_IDLE_SECONDS = float(os.environ.get('DATABASE_LIVENESS_IDLE_SECONDS', '30'))
+
+# data migrations (see membership.database.util.backfill) update this many rows per transaction
+# and sleep this long between transactions, so a backfill never holds locks for long and leaves
+# the database room to serve requests while it runs
+BACKFILL_CHUNK_SIZE = int(os.environ.get('DATABASE_BACKFILL_CHUNK_SIZE', '1000'))
+BACKFILL_PAUSE_SECONDS = float(os.environ.get('DATABASE_BACKFILL_PAUSE_SECONDS', '0.1'))
+
+# an optional read replica of DATABASE_URL that GET requests read from
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+settings = {'name_or_url': DATABASE_URL, 'pool_size': POOL_SIZE, 'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT, 'pool_recycle': POOL_RECYCLE}
+replica_settings = dict(settings, name_or_url=DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL \
+    else None
 SUPER_USER_FIRST_NAME = os.environ.get('SUPER_USER_FIRST_NAME', 'Joe')
 SUPER_USER_LAST_NAME = os.environ.get('SUPER_USER_LAST_NAME', 'Schmoe')
 SUPER_USER_EMAIL = os.environ.get('SUPER_USER_EMAIL', 'joe.schmoe@example.com')
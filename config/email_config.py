@@ -3,3 +3,11 @@ import os
 USE_EMAIL = os.environ.get('USE_EMAIL', 'TRUE') != 'FALSE'
 EMAIL_DOMAIN = os.environ.get('EMAIL_DOMAIN', 'dsasf.org')
 EMAIL_API_KEY = os.environ.get('EMAIL_API_KEY', None)
+
+# maximum number of Mailgun API calls per second, 0 disables rate limiting
+EMAIL_RATE_LIMIT = float(os.environ.get('EMAIL_RATE_LIMIT', '5'))
+# how often a failed send is retried before giving up, and the base delay between retries
+EMAIL_MAX_RETRIES = int(os.environ.get('EMAIL_MAX_RETRIES', '3'))
+EMAIL_RETRY_BACKOFF = float(os.environ.get('EMAIL_RETRY_BACKOFF', '1'))
+# seconds to wait for Mailgun to respond
+EMAIL_TIMEOUT = float(os.environ.get('EMAIL_TIMEOUT', '10'))
@@ -0,0 +1,25 @@
+"""Settings for serving the app with gunicorn, see `make serve`.
+
+The app is imported once in the master process and each worker is forked from it. The engine is
+created lazily, so nothing has connected before the fork; `post_fork` still gives every worker a
+fresh engine with a pool sized for its threads.
+"""
+import multiprocessing
+import os
+
+from config.database_config import MAX_CONNECTIONS, replica_settings, settings
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '8080'))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+
+
+def post_fork(server, worker):
+    from membership.database.base import engine_registry, replica_registry, worker_pool_settings
+    engine_registry.after_fork(worker_pool_settings(settings, workers, threads, MAX_CONNECTIONS))
+    if replica_settings is not None:
+        replica_registry.after_fork(worker_pool_settings(replica_settings, workers, threads,
+                                                         MAX_CONNECTIONS))
@@ -0,0 +1,8 @@
+import os
+
+# hours an Idempotency-Key is remembered; a retry after that runs the request again
+IDEMPOTENCY_KEY_HOURS = float(os.environ.get('IDEMPOTENCY_KEY_HOURS', '24'))
+
+# seconds a key stays reserved for the request that sent it first; a retry after that takes it
+# over, in case the worker was killed mid-request. Keep it above gunicorn's WEB_TIMEOUT
+IDEMPOTENCY_RESERVATION_SECONDS = float(os.environ.get('IDEMPOTENCY_RESERVATION_SECONDS', '60'))
@@ -0,0 +1,16 @@
+import os
+
+# number of threads a single `flask worker` process uses to run jobs
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', '4'))
+
+# seconds an idle worker thread waits before polling the jobs table again
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+
+# how many times a job is attempted before it is marked as failed
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+
+# base delay in seconds between retries, doubled after every failed attempt
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', '30'))
+
+# seconds a claimed job stays locked before another worker may pick it up again
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
@@ -0,0 +1,7 @@
+import os
+
+# seconds a meeting looked up by short id is cached for check-ins
+MEETING_CACHE_SECONDS = float(os.environ.get('MEETING_CACHE_SECONDS', '60'))
+
+# minutes before a meeting's start_time and after its end_time (both UTC) that check-in is open
+CHECK_IN_GRACE_MINUTES = int(os.environ.get('CHECK_IN_GRACE_MINUTES', '60'))
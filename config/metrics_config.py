@@ -0,0 +1,4 @@
+import os
+
+# log a warning for every request that runs more than this many SQL statements, 0 disables it
+METRICS_QUERY_COUNT_THRESHOLD = int(os.environ.get('METRICS_QUERY_COUNT_THRESHOLD', '0'))
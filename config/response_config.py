@@ -0,0 +1,11 @@
+import os
+
+# 'orjson' or 'json'; by default orjson is used when it is installed
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+
+# responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# gzip level (1-9) and brotli quality (0-11); the defaults favour speed over size
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
@@ -1,5 +1,7 @@
 from config import dotenv
-from membership.web.base_app import app
+from membership.web.base_app import create_app
+
+app = create_app()
 
 
 # For running as script
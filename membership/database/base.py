@@ -1,40 +1,256 @@
 import json
-from datetime import datetime
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
 
 import sqlalchemy.types as types
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import DisconnectionError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session as OrmSession
+from sqlalchemy.sql import Select
 
-from config.database_config import settings
+from config.database_config import LIVENESS_CHECK, LIVENESS_IDLE_SECONDS, replica_settings, \
+    settings
+from membership.util.metrics import TimedQueuePool, forget_engine, instrument_engine
 
+POOL_SETTINGS = ('pool_size', 'max_overflow', 'pool_timeout')
 
-def checkout_listener(dbapi_con, con_record, con_proxy):
+
+def ping_connection(dbapi_con) -> None:
     """
-    Ensures that connections in the pool are still valid before returning them
+    Makes a round-trip to the database on a raw DBAPI connection
     :param dbapi_con:
-    :param con_record:
-    :param con_proxy:
     :return:
     """
-    try:
+    ping = getattr(dbapi_con, 'ping', None)
+    if ping is not None:
+        # MySQL drivers can ping without running a statement
         try:
-            dbapi_con.ping(False)
+            ping(False)
         except TypeError:
-            dbapi_con.ping()
-    except dbapi_con.OperationalError as exc:
-        if exc.args[0] in (2006, 2013, 2014, 2045, 2055):
-            raise DisconnectionError()
-        else:
+            ping()
+    else:
+        cursor = dbapi_con.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+
+def install_liveness_check(engine: Engine, strategy: str, idle_seconds: float) -> None:
+    """
+    Ensures that connections in the pool are still valid before returning them
+    :param engine:
+    :param strategy: 'checkout' pings on every checkout, 'idle' only pings connections that have
+        not been used for idle_seconds, and 'optimistic' never pings and relies on SQLAlchemy
+        invalidating the pool when a statement fails with a disconnect error
+    :param idle_seconds:
+    :return:
+    """
+    def check(dbapi_con):
+        try:
+            ping_connection(dbapi_con)
+        except Exception as e:
+            if engine.dialect.is_disconnect(e, dbapi_con, None):
+                # the pool retries the checkout with a fresh connection
+                raise DisconnectionError()
             raise
 
+    def mark_used(dbapi_con, con_record):
+        con_record.info['last_used'] = time.monotonic()
+
+    def checkout_listener(dbapi_con, con_record, con_proxy):
+        check(dbapi_con)
+
+    def idle_checkout_listener(dbapi_con, con_record, con_proxy):
+        if time.monotonic() - con_record.info.get('last_used', 0) > idle_seconds:
+            check(dbapi_con)
+
+    if strategy == 'checkout':
+        event.listen(engine, 'checkout', checkout_listener)
+    elif strategy == 'idle':
+        event.listen(engine, 'connect', mark_used)
+        event.listen(engine, 'checkin', mark_used)
+        event.listen(engine, 'checkout', idle_checkout_listener)
+    elif strategy != 'optimistic':
+        raise ValueError('Unknown liveness check {}'.format(strategy))
+
+
+def install_fork_guard(engine: Engine) -> None:
+    """
+    Keeps a process that was forked from the one that opened a pooled connection from using it;
+    such a connection is replaced rather than shared, since two processes talking over one socket
+    corrupt each other's results
+    :param engine:
+    :return:
+    """
+    @event.listens_for(engine, 'connect')
+    def record_pid(dbapi_con, con_record):
+        con_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def check_pid(dbapi_con, con_record, con_proxy):
+        if con_record.info['pid'] != os.getpid():
+            # detach without closing, closing would also end the parent's session
+            con_record.connection = con_proxy.connection = None
+            raise DisconnectionError(
+                'Connection record belongs to pid {}, attempting to check out in pid {}'.format(
+                    con_record.info['pid'], os.getpid()))
+
+
+def create_engine_from_settings(engine_settings: dict, liveness_check: str=LIVENESS_CHECK,
+                                idle_seconds: float=LIVENESS_IDLE_SECONDS) -> Engine:
+    kwargs = dict(engine_settings)
+    if make_url(kwargs['name_or_url']).drivername.startswith('sqlite'):
+        # sqlite uses a SingletonThreadPool or NullPool, which don't take QueuePool settings
+        for key in POOL_SETTINGS:
+            kwargs.pop(key, None)
+    else:
+        kwargs.setdefault('poolclass', TimedQueuePool)
+    engine = create_engine(**kwargs)
+    install_fork_guard(engine)
+    install_liveness_check(engine, liveness_check, idle_seconds)
+    instrument_engine(engine)
+    return engine
+
+
+class EngineRegistry:
+    """ Holds the settings for the application's engine and creates it the first time it is
+    needed, so importing the models or the app never connects to (or even loads the driver for)
+    the database. Each process gets its own engine: one inherited through a fork is set aside
+    and replaced on first use in the child. """
+
+    def __init__(self, engine_settings: Optional[dict]) -> None:
+        self.settings = dict(engine_settings) if engine_settings is not None else None
+        self._engine: Optional[Engine] = None
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        # engines inherited from a parent process; they are kept referenced so that garbage
+        # collection never closes connections the parent is still using
+        self.inherited = []
+
+    @property
+    def engine(self) -> Optional[Engine]:
+        """ The engine, or None if the registry has no settings. """
+        if self.pid != os.getpid():
+            self.after_fork()
+        if self._engine is None and self.settings is not None:
+            with self.lock:
+                if self._engine is None:
+                    self._engine = create_engine_from_settings(self.settings)
+        return self._engine
+
+    def after_fork(self, engine_settings: Optional[dict]=None) -> None:
+        """ Call in a freshly forked process (it also happens on the first use of the engine
+        there) to stop using the parent's engine, optionally with new settings. """
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        if self._engine is not None:
+            forget_engine(self._engine)
+            self.inherited.append(self._engine)
+            self._engine = None
+        if engine_settings is not None:
+            self.settings = dict(engine_settings)
+
+    def configure(self, engine_settings: Optional[dict]) -> None:
+        """ Replaces the settings; the next use of the engine creates one from them. """
+        with self.lock:
+            self._dispose()
+            self.settings = dict(engine_settings) if engine_settings is not None else None
+
+    def dispose(self) -> None:
+        """ Closes the pooled connections and forgets the engine, so a new one is created on
+        next use. """
+        with self.lock:
+            self._dispose()
+
+    def _dispose(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+            forget_engine(self._engine)
+            self._engine = None
+
+
+def worker_pool_settings(engine_settings: dict, workers: int, threads: int,
+                         max_connections: int=0) -> dict:
+    """
+    Sizes the pool of each of `workers` processes serving requests on `threads` threads
+    :param engine_settings:
+    :param workers:
+    :param threads:
+    :param max_connections: if set, the pools of all workers together never open more
+    :return: the engine settings with pool_size and max_overflow for one worker
+    """
+    worker_settings = dict(engine_settings)
+    # a request holds at most one connection, so a connection per thread never makes one wait
+    worker_settings['pool_size'] = threads
+    if max_connections:
+        per_worker = max(1, max_connections // workers)
+        worker_settings['pool_size'] = min(threads, per_worker)
+        worker_settings['max_overflow'] = per_worker - worker_settings['pool_size']
+    return worker_settings
+
+
+def is_read(clause) -> bool:
+    """ Whether a statement only reads, and so can run on a replica. """
+    return clause is None or (isinstance(clause, Select) and clause._for_update_arg is None)
+
+
+class RoutingSession(OrmSession):
+    """ A session that runs plain SELECTs on `replica_bind` when one is given. Flushes, other
+    statements and SELECT ... FOR UPDATE go to the primary, and once anything has, so does
+    everything after it, so the session always reads its own writes. """
+
+    def __init__(self, replica_bind: Optional[Engine]=None, **kw) -> None:
+        super(RoutingSession, self).__init__(**kw)
+        self.replica_bind = replica_bind
+        self.used_primary = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica_bind is not None and not self.used_primary:
+            if not self._flushing and is_read(clause):
+                return self.replica_bind
+            self.used_primary = True
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RegistrySessionmaker(sessionmaker):
+    """ A sessionmaker that binds each new session to the registry's current engine, and to the
+    replica registry's engine as well when called with `use_replica=True`. """
+
+    def __init__(self, registry: EngineRegistry, replica_registry: EngineRegistry, **kw) -> None:
+        kw.setdefault('class_', RoutingSession)
+        super(RegistrySessionmaker, self).__init__(**kw)
+        self.registry = registry
+        self.replica_registry = replica_registry
+
+    def __call__(self, use_replica: bool=False, **local_kw):
+        local_kw.setdefault('bind', self.registry.engine)
+        if use_replica:
+            local_kw.setdefault('replica_bind', self.replica_registry.engine)
+        return super(RegistrySessionmaker, self).__call__(**local_kw)
+
 
 Base = declarative_base()
 metadata = Base.metadata
-engine = create_engine(**settings)
-Session = sessionmaker(bind=engine)
-event.listen(engine, 'checkout', checkout_listener)
+engine_registry = EngineRegistry(settings)
+replica_registry = EngineRegistry(replica_settings)
+Session = RegistrySessionmaker(engine_registry, replica_registry)
+
+
+def get_engine() -> Engine:
+    return engine_registry.engine
+
+
+def configure_engine(engine_settings: dict, replica_engine_settings: Optional[dict]=None) -> None:
+    """ Replaces the settings of the primary engine and of the read replica (None for none). """
+    engine_registry.configure(engine_settings)
+    replica_registry.configure(replica_engine_settings)
 
 
 def date_parser(date_str):
@@ -56,6 +272,19 @@ class StringyJSON(types.TypeDecorator):
             value = json.loads(value)
         return value
 
+
+class UTCDateTime(types.TypeDecorator):
+    """Stores a naive DATETIME in UTC. Timezone-aware values are converted to UTC on the way in,
+    and naive ones are taken to be UTC already, so compare what comes out with
+    `datetime.utcnow()`."""
+
+    impl = types.DateTime
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
 # TypeEngine.with_variant says "use StringyJSON instead when
 # connecting to 'sqlite'"
 JSON = types.JSON().with_variant(StringyJSON, 'sqlite')
\ No newline at end of file
@@ -1,11 +1,21 @@
+import struct
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, LargeBinary, String
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import Index, UniqueConstraint
 
-from membership.database.base import Base
+from membership.database.base import Base, JSON, UTCDateTime
+
+
+def format_name(first_name: str, last_name: str) -> str:
+    n = ''
+    if first_name:
+        n = first_name
+    if last_name:
+        n += ' ' + last_name
+    return n
 
 
 class Member(Base):
@@ -16,6 +26,10 @@ class Member(Base):
     last_name: str = Column(String(45))
     email_address: str = Column(String(254), unique=True)
     biography: str = Column(String(10000))
+    # set on every insert and update, so each process's search index can pick up changes made
+    # by the others
+    updated_at: datetime = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                                  index=True)
 
     eligible_votes: List['EligibleVoter'] = relationship('EligibleVoter', back_populates='member')
     meetings_attended: List['Attendee'] = relationship('Attendee', back_populates='member')
@@ -23,12 +37,7 @@ class Member(Base):
 
     @property
     def name(self) -> str:
-        n = ''
-        if self.first_name:
-            n = self.first_name
-        if self.last_name:
-            n += ' ' + self.last_name
-        return n
+        return format_name(self.first_name, self.last_name)
 
 
 class Committee(Base):
@@ -57,14 +66,18 @@ class Meeting(Base):
     short_id: int = Column(Integer, nullable=False, unique=True)
     name: str = Column(String(255), nullable=False)
     committee_id: int = Column(ForeignKey('committees.id'))
-    start_time: datetime = Column(DateTime)
-    end_time: datetime = Column(DateTime)
+    # naive UTC; aware datetimes are converted when written
+    start_time: datetime = Column(UTCDateTime)
+    end_time: datetime = Column(UTCDateTime)
 
     attendees: List['Attendee'] = relationship('Attendee', back_populates='meeting')
 
 
 class Attendee(Base):
     __tablename__ = 'attendees'
+    __table_args__ = (
+        UniqueConstraint('meeting_id', 'member_id', name='uq_attendees_meeting_member'),
+    )
 
     id: int = Column(Integer, primary_key=True, unique=True)
     meeting_id: int = Column(ForeignKey('meetings.id'))
@@ -74,6 +87,23 @@ class Attendee(Base):
     meeting: 'Meeting' = relationship('Meeting', back_populates='attendees')
 
 
+class AttendanceSummary(Base):
+    """ How many meetings of a committee (None for general meetings) a member attended in a month
+    (None for meetings without a start time). A key may be split across several rows, so always
+    sum `count`. """
+    __tablename__ = 'attendance_summaries'
+    __table_args__ = (
+        Index('ix_attendance_summaries_member', 'member_id', 'committee_id', 'period'),
+        Index('ix_attendance_summaries_committee', 'committee_id', 'period'),
+    )
+
+    id: int = Column(Integer, primary_key=True, unique=True)
+    member_id: int = Column(ForeignKey('members.id'), nullable=False)
+    committee_id: int = Column(ForeignKey('committees.id'))
+    period: str = Column(String(7))
+    count: int = Column(Integer, nullable=False, default=0)
+
+
 class Election(Base):
     __tablename__ = 'elections'
 
@@ -98,6 +128,15 @@ class Candidate(Base):
     election: 'Election' = relationship('Election', back_populates='candidates')
 
 
+def pack_ranking(candidate_ids: List[int]) -> bytes:
+    """ Packs ranked candidate ids as consecutive little-endian unsigned 32-bit integers. """
+    return struct.pack('<{}I'.format(len(candidate_ids)), *candidate_ids)
+
+
+def unpack_ranking(packed: bytes) -> List[int]:
+    return list(struct.unpack('<{}I'.format(len(packed) // 4), packed))
+
+
 class Vote(Base):
     __tablename__ = 'votes'
     __table_args__ = (UniqueConstraint('vote_key', 'election_id'),)
@@ -105,10 +144,19 @@ class Vote(Base):
     id: int = Column(Integer, primary_key=True, unique=True)
     vote_key: int = Column(Integer)
     election_id: int = Column(ForeignKey('elections.id'))
+    # the ranked candidate ids, see pack_ranking; NULL for ballots that are not filled in yet and
+    # for ballots cast before this column existed, which are ranked by their `ranking` rows
+    packed_ranking: bytes = Column(LargeBinary)
 
     election: 'Election' = relationship('Election', back_populates='votes')
     ranking: List['Ranking'] = relationship('Ranking', back_populates='vote', order_by='Ranking.rank')
 
+    @property
+    def candidate_ids(self) -> List[int]:
+        if self.packed_ranking is not None:
+            return unpack_ranking(self.packed_ranking)
+        return [rank.candidate_id for rank in self.ranking]
+
 
 class Ranking(Base):
     __tablename__ = 'rankings'
@@ -132,3 +180,63 @@ class EligibleVoter(Base):
 
     member: 'Member' = relationship('Member', back_populates='eligible_votes')
     election: 'Election' = relationship('Election', back_populates='voters')
+
+
+class ElectionArchive(Base):
+    """ The ballots and voter roll of a finalized election, moved out of `votes`, `rankings` and
+    `eligible_voters` into one compressed snapshot (see membership.util.archive), together with
+    the count that was run before archiving. """
+    __tablename__ = 'election_archives'
+
+    election_id: int = Column(ForeignKey('elections.id'), primary_key=True)
+    # MEDIUMBLOB on MySQL, whose plain BLOB stops at 64KB
+    snapshot: bytes = Column(LargeBinary(2 ** 24 - 1), nullable=False)
+    checksum: str = Column(String(64), nullable=False)
+    ballot_count: int = Column(Integer, nullable=False)
+    voter_count: int = Column(Integer, nullable=False)
+    result: dict = Column(JSON, nullable=False)
+    created_at: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id: int = Column(Integer, primary_key=True, unique=True)
+    kind: str = Column(String(45), nullable=False)
+    payload: dict = Column(JSON)
+    status: str = Column(String(20), nullable=False, default='pending', index=True)
+    attempts: int = Column(Integer, nullable=False, default=0)
+    max_attempts: int = Column(Integer, nullable=False, default=5)
+    last_error: str = Column(String(1000))
+    result: dict = Column(JSON)
+    run_after: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until: datetime = Column(DateTime)
+    created_at: datetime = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: datetime = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """ A key a member sent in an Idempotency-Key header, reserved while the request runs, and the
+    response to it, replayed when they retry it with the same key. """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (UniqueConstraint('member_id', 'key', name='uq_idempotency_keys_member_key'),)
+
+    id: int = Column(Integer, primary_key=True, unique=True)
+    member_id: int = Column(ForeignKey('members.id'), nullable=False)
+    key: str = Column(String(255), nullable=False)
+    # digest of the method, path and body, so a key reused for another request is refused
+    fingerprint: str = Column(String(64), nullable=False)
+    # NULL while the request that reserved the key is running
+    status_code: int = Column(Integer)
+    mimetype: str = Column(String(255))
+    body: bytes = Column(LargeBinary)
+    created_at: datetime = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class TableVersion(Base):
+    """ A counter bumped in the same transaction as every write to a table whose reads are cached,
+    so readers can tell whether anything changed with a single primary key lookup. """
+    __tablename__ = 'table_versions'
+
+    table_name: str = Column(String(64), primary_key=True)
+    version: int = Column(Integer, nullable=False, default=0)
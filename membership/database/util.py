@@ -0,0 +1,115 @@
+import logging
+import time
+from typing import Callable, Iterator, List, Optional, Union
+
+from sqlalchemy import Column, Table, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection, Engine, RowProxy
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert, Select, func
+
+from config.database_config import BACKFILL_CHUNK_SIZE, BACKFILL_PAUSE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# rows fetched from a server-side cursor per round-trip
+STREAM_BATCH_SIZE = 1000
+
+
+def stream_rows(engine: Engine, statement: Select, batch_size: int=STREAM_BATCH_SIZE) \
+        -> Iterator[RowProxy]:
+    """ Yields the rows of a statement from a server-side cursor on a dedicated connection, so
+    result sets of any size are read in constant memory. The connection is returned to the pool
+    once the generator is exhausted or closed. """
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement)
+        try:
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            result.close()
+
+
+def ignoring_insert(table: Table, dialect_name: str) -> Optional[Insert]:
+    """ An INSERT that silently skips rows violating a unique constraint, so the result's rowcount
+    tells whether the row was new, or None if the dialect has no such statement. """
+    if dialect_name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    statement = table.insert()
+    if dialect_name == 'mysql':
+        return statement.prefix_with('IGNORE', dialect='mysql')
+    if dialect_name == 'sqlite':
+        return statement.prefix_with('OR IGNORE', dialect='sqlite')
+    return None
+
+
+def insert_ignore(session: Session, table: Table, rows: Union[dict, List[dict]]) -> int:
+    """ Inserts a row, or many, skipping those that violate a unique constraint, and returns the
+    number inserted. On MySQL, INSERT IGNORE skips rows that violate a foreign key too, so check
+    that the rows they refer to exist first. Dialects without an ignoring INSERT insert a row at a
+    time in a savepoint and skip the rows that raise an IntegrityError, which also covers foreign
+    keys. """
+    statement = ignoring_insert(table, session.get_bind().dialect.name)
+    if statement is not None:
+        return session.execute(statement, rows).rowcount
+    inserted = 0
+    for row in rows if isinstance(rows, list) else [rows]:
+        try:
+            with session.begin_nested():
+                session.execute(table.insert(), row)
+        except IntegrityError:
+            continue
+        inserted += 1
+    return inserted
+
+
+def backfill(engine: Engine, key: Column, apply: Callable[[Connection, List], None], where=None,
+             chunk_size: int=BACKFILL_CHUNK_SIZE, pause: float=BACKFILL_PAUSE_SECONDS) -> int:
+    """
+    Runs a data migration over a table in chunks of rows ordered by `key`, each chunk in its own
+    short transaction, so a backfill of a large table never locks it for long. Committed chunks
+    stay committed if the backfill is interrupted; give a `where` that excludes rows already
+    done (`new_column.is_(None)`, say) and running it again picks up where it stopped.
+
+    In a migration, put the backfill in its own revision after the one that changes the schema,
+    and pass `op.get_bind().engine`: the chunks run on their own connections and need the schema
+    change committed to see it.
+    :param engine:
+    :param key: a unique, indexed column of the table, usually the primary key
+    :param apply: called with a connection and the keys of each chunk to update those rows
+    :param where: selects the rows that still need updating
+    :param chunk_size: rows per transaction
+    :param pause: seconds to sleep between transactions, to leave the database room to serve
+        requests
+    :return: the number of rows passed to `apply`
+    """
+    count = select([func.count()]).select_from(key.table)
+    chunk = select([key]).order_by(key).limit(chunk_size)
+    if where is not None:
+        count, chunk = count.where(where), chunk.where(where)
+    with engine.connect() as connection:
+        total = connection.scalar(count)
+    done = 0
+    last_key = None
+    started = time.monotonic()
+    while True:
+        query = chunk
+        if last_key is not None:
+            query = query.where(key > last_key)
+        with engine.begin() as connection:
+            keys = [row[0] for row in connection.execute(query)]
+            if not keys:
+                break
+            apply(connection, keys)
+        done += len(keys)
+        last_key = keys[-1]
+        logger.info('Backfilled %s of %s rows of %s (up to %s=%s) in %.1fs', done, total,
+                    key.table.name, key.name, last_key, time.monotonic() - started)
+        if pause:
+            time.sleep(pause)
+    return done
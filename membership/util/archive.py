@@ -0,0 +1,78 @@
+"""Reads and writes the snapshots that finalized elections are archived into.
+
+A snapshot is a zlib-compressed binary file: a header with the number of ballots and voters,
+then each ballot as its key, its length and its ranked candidate ids, then each eligible voter as
+a member id and whether they voted. All integers are little-endian and unsigned. The SHA-256 of
+the compressed bytes is stored next to it so a damaged or edited archive is never read.
+"""
+import hashlib
+import struct
+import zlib
+from typing import List, NamedTuple, Tuple
+
+from membership.database.models import ElectionArchive
+
+MAGIC = b'MBAL'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+BALLOT = struct.Struct('<IH')
+VOTER = struct.Struct('<I?')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class Snapshot(NamedTuple):
+    # (ballot key, ranked candidate ids) in the order the ballots were claimed; ballots that were
+    # never filled in have no candidates
+    ballots: List[Tuple[int, List[int]]]
+    # (member id, voted)
+    voters: List[Tuple[int, bool]]
+
+
+def checksum(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def pack_snapshot(snapshot: Snapshot) -> bytes:
+    parts = [HEADER.pack(MAGIC, VERSION, len(snapshot.ballots), len(snapshot.voters))]
+    for vote_key, candidate_ids in snapshot.ballots:
+        parts.append(BALLOT.pack(vote_key, len(candidate_ids)))
+        parts.append(struct.pack('<{}I'.format(len(candidate_ids)), *candidate_ids))
+    parts.extend(VOTER.pack(member_id, voted) for member_id, voted in snapshot.voters)
+    return zlib.compress(b''.join(parts), 9)
+
+
+def unpack_snapshot(data: bytes) -> Snapshot:
+    raw = zlib.decompress(data)
+    magic, version, ballot_count, voter_count = HEADER.unpack_from(raw)
+    if magic != MAGIC or version != VERSION:
+        raise ArchiveError('Unknown snapshot format {!r} version {}'.format(magic, version))
+    offset = HEADER.size
+    ballots = []
+    for _ in range(ballot_count):
+        vote_key, length = BALLOT.unpack_from(raw, offset)
+        offset += BALLOT.size
+        ballots.append((vote_key, list(struct.unpack_from('<{}I'.format(length), raw, offset))))
+        offset += 4 * length
+    voters = [VOTER.unpack_from(raw, offset + i * VOTER.size) for i in range(voter_count)]
+    if offset + voter_count * VOTER.size != len(raw):
+        raise ArchiveError('Snapshot has {} trailing bytes'.format(
+            len(raw) - offset - voter_count * VOTER.size))
+    return Snapshot(ballots, voters)
+
+
+def build_archive(election_id: int, snapshot: Snapshot, result: dict) -> ElectionArchive:
+    data = pack_snapshot(snapshot)
+    return ElectionArchive(election_id=election_id, snapshot=data, checksum=checksum(data),
+                           ballot_count=len(snapshot.ballots), voter_count=len(snapshot.voters),
+                           result=result)
+
+
+def read_archive(archive: ElectionArchive) -> Snapshot:
+    """ The archive's snapshot, after checking it against its checksum. """
+    if checksum(archive.snapshot) != archive.checksum:
+        raise ArchiveError('Archive of election {} does not match its checksum'.format(
+            archive.election_id))
+    return unpack_snapshot(archive.snapshot)
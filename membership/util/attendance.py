@@ -0,0 +1,81 @@
+"""Maintains `attendance_summaries`, the per member, committee and month attendance counts that
+eligibility checks and dashboards read instead of scanning `attendees`.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from membership.database.base import Session
+from membership.database.models import Attendee, AttendanceSummary, Meeting
+from sqlalchemy import func
+
+# rows inserted per statement when rebuilding the summaries
+REBUILD_CHUNK_SIZE = 1000
+
+
+def period_for(start_time: Optional[datetime]) -> Optional[str]:
+    return start_time.strftime('%Y-%m') if start_time else None
+
+
+def summary_key_filter(member_id: int, committee_id: Optional[int], period: Optional[str]):
+    def matches(column, value):
+        return column.is_(None) if value is None else column == value
+    return (AttendanceSummary.member_id == member_id,
+            matches(AttendanceSummary.committee_id, committee_id),
+            matches(AttendanceSummary.period, period))
+
+
+def record_attendance(session: Session, meeting: Meeting, member_id: int, count: int=1) -> None:
+    """ Adds `count` attendances of the meeting by the member to the summary, as part of the
+    caller's transaction. """
+    key = (member_id, meeting.committee_id, period_for(meeting.start_time))
+    updated = session.query(AttendanceSummary).filter(*summary_key_filter(*key)) \
+        .update({AttendanceSummary.count: AttendanceSummary.count + count},
+                synchronize_session=False)
+    if not updated:
+        session.add(AttendanceSummary(member_id=key[0], committee_id=key[1], period=key[2],
+                                      count=count))
+
+
+def rebuild_attendance_summary(session: Session) -> int:
+    """ Recomputes every summary row from `attendees` and returns how many rows were written. """
+    meetings = {meeting_id: (committee_id, period_for(start_time))
+                for meeting_id, committee_id, start_time in
+                session.query(Meeting.id, Meeting.committee_id, Meeting.start_time)}
+    counts: Dict[Tuple[int, Optional[int], Optional[str]], int] = defaultdict(int)
+    attendance = session.query(Attendee.member_id, Attendee.meeting_id, func.count(Attendee.id)) \
+        .filter(Attendee.member_id.isnot(None), Attendee.meeting_id.isnot(None)) \
+        .group_by(Attendee.member_id, Attendee.meeting_id)
+    for member_id, meeting_id, count in attendance:
+        committee_id, period = meetings[meeting_id]
+        counts[(member_id, committee_id, period)] += count
+
+    session.query(AttendanceSummary).delete(synchronize_session=False)
+    rows = [{'member_id': member_id, 'committee_id': committee_id, 'period': period,
+             'count': count} for (member_id, committee_id, period), count in counts.items()]
+    for i in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        session.execute(AttendanceSummary.__table__.insert(), rows[i:i + REBUILD_CHUNK_SIZE])
+    session.commit()
+    return len(rows)
+
+
+def attendance_query(session: Session, *group_by, member_id: Optional[int]=None,
+                     committee_id: Optional[int]=None, since: Optional[str]=None,
+                     until: Optional[str]=None):
+    """ Sums attendance over the summary table, grouped by the given columns and limited to the
+    member, committee (0 for general meetings) and inclusive 'YYYY-MM' period range when they are
+    given. """
+    query = session.query(*group_by, func.sum(AttendanceSummary.count).label('count'))
+    if member_id is not None:
+        query = query.filter(AttendanceSummary.member_id == member_id)
+    if committee_id == 0:
+        query = query.filter(AttendanceSummary.committee_id.is_(None))
+    elif committee_id is not None:
+        query = query.filter(AttendanceSummary.committee_id == committee_id)
+    if since is not None:
+        query = query.filter(AttendanceSummary.period >= since)
+    if until is not None:
+        query = query.filter(AttendanceSummary.period <= until)
+    if group_by:
+        query = query.group_by(*group_by)
+    return query
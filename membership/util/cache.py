@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """ A thread-safe in-process cache whose entries expire after `ttl` seconds. Once it holds
+    `max_size` entries the least recently stored one is evicted. Entries may be stored with
+    `tags`, naming what they were built from, so that `evict` can drop just those. """
+
+    def __init__(self, ttl: float, max_size: int=1024, clock=time.monotonic) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        # incremented by every clear() and evict()
+        self.generation = 0
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        with self.lock:
+            expires, value, _ = self.entries.get(key, (None, _MISSING, None))
+            if value is _MISSING:
+                return default
+            if expires <= self.clock():
+                del self.entries[key]
+                return default
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float]=None,
+            generation: Optional[int]=None, tags: Iterable[Hashable]=()) -> None:
+        """ Stores a value; given the `generation` read before the value was computed, only if
+        nothing was cleared or evicted in the meantime, since the value may predate the change
+        that was for. """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value,
+                                 frozenset(tags))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def evict(self, tags: Iterable[Hashable]) -> None:
+        """ Drops the entries stored with any of `tags`. """
+        tags = frozenset(tags)
+        with self.lock:
+            for key in [key for key, (_, _, entry_tags) in self.entries.items()
+                        if entry_tags & tags]:
+                del self.entries[key]
+            self.generation += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
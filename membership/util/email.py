@@ -1,29 +1,192 @@
-from config.email_config import EMAIL_API_KEY, EMAIL_DOMAIN, USE_EMAIL
+from config.email_config import EMAIL_API_KEY, EMAIL_DOMAIN, EMAIL_MAX_RETRIES, \
+    EMAIL_RATE_LIMIT, EMAIL_RETRY_BACKOFF, EMAIL_TIMEOUT, USE_EMAIL
+from functools import lru_cache
 import json
 import logging
 import membership
-import pkg_resources
+import pkgutil
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
+logger = logging.getLogger(__name__)
 
-def send_emails(sender, subject, email_template, recipient_variables):
-    url = 'https://api.mailgun.net/v3/' + EMAIL_DOMAIN + '/messages'
-    payload = [
-        ('from', sender),
-        ('recipient-variables', json.dumps(recipient_variables)),
-        ('subject', subject),
-        ('html', email_template)
-    ]
-    payload.extend([('to', email) for email in recipient_variables.keys()])
-    if USE_EMAIL:
-        r = requests.post(url, data=payload, auth=('api', EMAIL_API_KEY))
+# Mailgun accepts at most this many recipients in a single batch send
+MAX_RECIPIENTS_PER_MESSAGE = 1000
+
+Payload = List[Tuple[str, str]]
+
+
+class EmailError(Exception):
+    def __init__(self, message: str, retryable: bool=False,
+                 failed_recipients: Optional[List[str]]=None) -> None:
+        super(EmailError, self).__init__(message)
+        self.retryable = retryable
+        self.failed_recipients = failed_recipients or []
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> str:
+    """ Reads a template from membership/templates once per process. """
+    return pkgutil.get_data(membership.__name__, 'templates/' + name).decode('utf-8')
+
+
+class MailgunTransport:
+    """ Posts messages to the Mailgun API over a pooled, keep-alive HTTP session. """
+
+    def __init__(self, domain: str=EMAIL_DOMAIN, api_key: str=EMAIL_API_KEY,
+                 timeout: float=EMAIL_TIMEOUT) -> None:
+        self.url = 'https://api.mailgun.net/v3/' + domain + '/messages'
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = ('api', api_key)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
+
+    def send(self, payload: Payload) -> None:
+        try:
+            r = self.session.post(self.url, data=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise EmailError(str(e), retryable=True)
         if r.status_code > 299:
-            logging.error(r.text)
+            raise EmailError(r.text, retryable=r.status_code == 429 or r.status_code >= 500)
+
+
+class FakeTransport:
+    """ Records messages instead of sending them. Set `failures` to make the next sends fail. """
+
+    def __init__(self, failures: int=0, retryable: bool=True) -> None:
+        self.sent: List[Payload] = []
+        self.failures = failures
+        self.retryable = retryable
+
+    def send(self, payload: Payload) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise EmailError('Fake failure', retryable=self.retryable)
+        self.sent.append(payload)
+
+
+class NullTransport:
+    """ Drops every message, used when USE_EMAIL is off. """
+
+    def send(self, payload: Payload) -> None:
+        logger.debug('Email disabled, dropping message to %s',
+                     [value for key, value in payload if key == 'to'])
+
+
+class RateLimiter:
+    """ Spaces out calls so that no more than `rate` happen per second across all threads. """
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = self.clock()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Mailer:
+    """ Sends templated batch emails through a transport, splitting recipients into Mailgun
+    sized batches, rate limiting API calls and retrying retryable failures with backoff.
+    """
+
+    def __init__(self, transport, rate_limit: float=EMAIL_RATE_LIMIT,
+                 max_retries: int=EMAIL_MAX_RETRIES, retry_backoff: float=EMAIL_RETRY_BACKOFF,
+                 batch_size: int=MAX_RECIPIENTS_PER_MESSAGE, sleep=time.sleep) -> None:
+        self.transport = transport
+        self.rate_limiter = RateLimiter(rate_limit, sleep=sleep)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.batch_size = batch_size
+        self.sleep = sleep
+
+    def send(self, sender: str, subject: str, html: str,
+             recipient_variables: Dict[str, dict]) -> int:
+        """ Sends the message to every recipient and returns how many API calls were made. Raises
+        EmailError listing the recipients of every batch that could not be delivered. """
+        emails = list(recipient_variables.keys())
+        failed = []
+        errors = []
+        calls = 0
+        for i in range(0, len(emails), self.batch_size):
+            batch = emails[i:i + self.batch_size]
+            payload = [
+                ('from', sender),
+                ('recipient-variables', json.dumps({e: recipient_variables[e] for e in batch})),
+                ('subject', subject),
+                ('html', html)
+            ]
+            payload.extend([('to', email) for email in batch])
+            try:
+                self._send_with_retries(payload)
+                calls += 1
+            except EmailError as e:
+                logger.error('Failed to send %r to %s recipients: %s', subject, len(batch), e)
+                failed.extend(batch)
+                errors.append(str(e))
+        if failed:
+            raise EmailError('; '.join(errors), failed_recipients=failed)
+        return calls
+
+    def send_template(self, sender: str, subject: str, template_name: str,
+                      recipient_variables: Dict[str, dict]) -> int:
+        return self.send(sender, subject, load_template(template_name), recipient_variables)
+
+    def _send_with_retries(self, payload: Payload) -> None:
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                self.transport.send(payload)
+                return
+            except EmailError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                self.sleep(self.retry_backoff * 2 ** attempt)
+                attempt += 1
+
+
+_mailer: Optional[Mailer] = None
+
+
+def get_mailer() -> Mailer:
+    global _mailer
+    if _mailer is None:
+        _mailer = Mailer(MailgunTransport() if USE_EMAIL else NullTransport())
+    return _mailer
+
+
+def set_mailer(mailer: Optional[Mailer]) -> None:
+    """ Replaces the process wide mailer, e.g. with one using a FakeTransport in tests. """
+    global _mailer
+    _mailer = mailer
+
+
+def send_emails(sender, subject, email_template, recipient_variables):
+    get_mailer().send(sender, subject, email_template, recipient_variables)
 
 
 def send_welcome_email(email, name, verify_url):
-    # now send email with this link
+    send_welcome_emails({email: (name, verify_url)})
+
+
+def send_welcome_emails(recipients):
+    """ Sends the welcome email to many members at once. `recipients` maps each email address to
+    a (name, verify_url) pair, and is sent in as few Mailgun batch calls as possible. """
     sender = 'New Member Outreach <members@' + EMAIL_DOMAIN + '>'
-    template = pkg_resources.resource_string(membership.__name__, 'templates/welcome_email.html')
-    recipient_variables = {email: {'name': name, 'link': verify_url}}
-    send_emails(sender, 'Welcome %recipient.name%', template, recipient_variables)
+    recipient_variables = {email: {'name': name, 'link': link}
+                           for email, (name, link) in recipients.items()}
+    get_mailer().send_template(sender, 'Welcome %recipient.name%', 'welcome_email.html',
+                               recipient_variables)
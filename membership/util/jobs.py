@@ -0,0 +1,178 @@
+"""A small durable job queue backed by the `jobs` table.
+
+Work that talks to slow upstream services (Auth0, Mailgun) is enqueued in the same transaction
+as the rows it belongs to and is executed later by `flask worker`, so a request never waits on
+those services and a failing upstream never loses the data that was submitted.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from config.jobs_config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, \
+    JOB_RETRY_BACKOFF, JOB_WORKER_CONCURRENCY
+from membership.database.base import Session
+from membership.database.models import Job
+from sqlalchemy import and_, or_
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+JobHandler = Callable[[Session, dict], Optional[dict]]
+
+handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """ Registers the decorated function as the handler for jobs of the given kind. The handler
+    is called with a fresh session and the job payload, and may return a JSON-encodable result
+    that is stored on the job. Each kind has one handler; registering another raises.
+    """
+    def decorator(f: JobHandler) -> JobHandler:
+        if kind in handlers:
+            raise ValueError('A handler for job kind {} is already registered: {}.{}'.format(
+                kind, handlers[kind].__module__, handlers[kind].__qualname__))
+        handlers[kind] = f
+        return f
+    return decorator
+
+
+def enqueue(session: Session, kind: str, payload: dict, max_attempts: int=JOB_MAX_ATTEMPTS) -> Job:
+    """ Adds a job to the session. It is only visible to workers once the caller commits, which
+    keeps the job and the data it refers to in a single transaction.
+    """
+    job = Job(kind=kind, payload=payload, status=PENDING, attempts=0, max_attempts=max_attempts,
+              run_after=datetime.utcnow())
+    session.add(job)
+    return job
+
+
+def claim_next(session: Session) -> Optional[Job]:
+    """ Claims the oldest runnable job, or returns None if there is nothing to do. A job is
+    runnable if it is pending and due, or if the worker running it has let its lease expire and it
+    has attempts left; an expired job without any is marked failed instead. Claiming is a
+    conditional update, so two workers racing for the same job cannot both win.
+    """
+    now = datetime.utcnow()
+    expired = and_(Job.status == RUNNING, Job.locked_until < now)
+    runnable = or_(and_(Job.status == PENDING, Job.run_after <= now),
+                   and_(expired, Job.attempts < Job.max_attempts))
+    candidates = session.query(Job.id, Job.status, Job.attempts, Job.max_attempts) \
+        .filter(or_(runnable, expired)).order_by(Job.id).limit(10).all()
+    for job_id, status, attempts, max_attempts in candidates:
+        if status == RUNNING and attempts >= max_attempts:
+            # the worker died (or timed out) on the last attempt
+            session.query(Job).filter(Job.id == job_id, expired) \
+                .update({Job.status: FAILED,
+                         Job.last_error: 'Lease expired on the last attempt',
+                         Job.locked_until: None,
+                         Job.updated_at: now},
+                        synchronize_session=False)
+            session.commit()
+            continue
+        claimed = session.query(Job).filter(Job.id == job_id, Job.status == status) \
+            .filter(runnable) \
+            .update({Job.status: RUNNING,
+                     Job.attempts: Job.attempts + 1,
+                     Job.locked_until: now + timedelta(seconds=JOB_LEASE_SECONDS),
+                     Job.updated_at: now},
+                    synchronize_session=False)
+        session.commit()
+        if claimed:
+            return session.query(Job).get(job_id)
+    return None
+
+
+def run_job(session: Session, job: Job) -> None:
+    """ Runs a claimed job and records the outcome. Failed jobs are rescheduled with exponential
+    backoff until they run out of attempts.
+    """
+    handler = handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError('No handler registered for job kind {}'.format(job.kind))
+        result = handler(session, dict(job.payload or {}))
+    except Exception as e:
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.kind, job.attempts)
+        session.rollback()
+        job.last_error = str(e)[:1000]
+        job.locked_until = None
+        if job.attempts >= job.max_attempts:
+            job.status = FAILED
+        else:
+            job.status = PENDING
+            delay = JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        session.commit()
+        return
+    job.status = SUCCEEDED
+    job.result = result
+    job.last_error = None
+    job.locked_until = None
+    session.commit()
+
+
+def run_pending(limit: Optional[int]=None) -> int:
+    """ Runs jobs in the current thread until the queue is drained (or `limit` jobs have run)
+    and returns how many jobs were run.
+    """
+    count = 0
+    while limit is None or count < limit:
+        session = Session()
+        try:
+            job = claim_next(session)
+            if job is None:
+                break
+            run_job(session, job)
+            count += 1
+        finally:
+            session.close()
+    return count
+
+
+class Worker:
+    """ Runs jobs from the queue on a fixed number of threads until stopped. """
+
+    def __init__(self, concurrency: int=JOB_WORKER_CONCURRENCY,
+                 poll_interval: float=JOB_POLL_INTERVAL) -> None:
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self) -> None:
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, name='job-worker-{}'.format(i),
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def run_forever(self) -> None:
+        self.start()
+        try:
+            while not self.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info('Shutting down job worker')
+        finally:
+            self.stop()
+
+    def _loop(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                ran = run_pending(limit=1)
+            except Exception:
+                logger.exception('Job worker failed to poll the queue')
+                ran = 0
+            if not ran:
+                self.stopping.wait(self.poll_interval)
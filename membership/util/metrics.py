@@ -0,0 +1,207 @@
+"""In-process metrics for the connection pool, SQL statements and request latency.
+
+Everything is kept in memory per process and exposed as JSON to admins by the /metrics endpoint.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from config.metrics_config import METRICS_QUERY_COUNT_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Dict[str, Histogram]] = {}
+        self.counters: Dict[str, int] = {}
+        self.engines: List[Engine] = []
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, label: str='', buckets=LATENCY_BUCKETS) -> Histogram:
+        with self.lock:
+            by_label = self.histograms.setdefault(name, {})
+            if label not in by_label:
+                by_label[label] = Histogram(buckets)
+            return by_label[label]
+
+    def increment(self, name: str, value: int=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            histograms = {name: dict(by_label) for name, by_label in self.histograms.items()}
+            counters = dict(self.counters)
+            engines = list(self.engines)
+        return {
+            'counters': counters,
+            'pools': [pool_status(engine) for engine in engines],
+            'histograms': {name: {label: h.snapshot() for label, h in by_label.items()}
+                           for name, by_label in histograms.items()},
+        }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+registry = Registry()
+
+
+class QueryStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: List[str] = []
+
+
+_local = threading.local()
+
+
+def _active_stats() -> List[QueryStats]:
+    if not hasattr(_local, 'stats'):
+        _local.stats = []
+    return _local.stats
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """ Counts the SQL statements run by the current thread inside the block. """
+    stats = QueryStats()
+    active = _active_stats()
+    active.append(stats)
+    try:
+        yield stats
+    finally:
+        active.remove(stats)
+
+
+class TimedQueuePool(QueuePool):
+    """ A QueuePool that records how long callers wait for a connection. """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            registry.histogram('pool_checkout_wait_seconds').observe(time.perf_counter() - start)
+
+
+def pool_status(engine: Engine) -> dict:
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({'size': pool.size(),
+                       'checked_in': pool.checkedin(),
+                       'checked_out': pool.checkedout(),
+                       'overflow': pool.overflow(),
+                       'timeout': pool.timeout()})
+    return status
+
+
+def forget_engine(engine: Engine) -> None:
+    """ Stops reporting the pool of an engine that has been disposed of. """
+    with registry.lock:
+        if engine in registry.engines:
+            registry.engines.remove(engine)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """ Hooks the engine's pool and cursor events into the metrics registry. """
+    with registry.lock:
+        registry.engines.append(engine)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_con, con_record):
+        registry.increment('pool_connections_opened')
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_con, con_record, con_proxy):
+        registry.increment('pool_checkouts')
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        registry.histogram('sql_statement_seconds').observe(elapsed)
+        for stats in _active_stats():
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.statements.append(statement)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # after_cursor_execute doesn't run for a failed statement
+        start_times = context.connection.info.get('query_start_time') \
+            if context.connection is not None else None
+        if start_times:
+            start_times.pop()
+        registry.increment('sql_errors')
+
+
+def init_app(app, query_count_threshold: int=METRICS_QUERY_COUNT_THRESHOLD) -> None:
+    """ Records latency and SQL usage for every request the app serves. """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.request_queries = QueryStats()
+        _active_stats().append(g.request_queries)
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        stats: Optional[QueryStats] = g.pop('request_queries', None)
+        if stats is None:
+            return
+        _active_stats().remove(stats)
+        elapsed = time.perf_counter() - g.pop('request_start')
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        endpoint = '{} {}'.format(request.method, rule)
+        registry.histogram('request_seconds', endpoint).observe(elapsed)
+        registry.histogram('request_sql_statements', endpoint, COUNT_BUCKETS).observe(stats.count)
+        registry.histogram('request_sql_seconds', endpoint).observe(stats.seconds)
+        if query_count_threshold and stats.count > query_count_threshold:
+            logger.warning('%s ran %s SQL statements (%.1f ms) in %.1f ms', endpoint, stats.count,
+                           stats.seconds * 1000, elapsed * 1000)
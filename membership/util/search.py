@@ -0,0 +1,190 @@
+"""An in-process trigram index for finding members by name or email.
+
+The index is filled from the members table on first use and is then kept current by loading the
+members created or changed since the last refresh, by this or any other process, on every search,
+and by `add` calls from the routes that create or rename members, so the process that made the
+change sees it at once. Prefix matches on names, email and the words in them come from a sorted
+token list; substring matches come from trigram posting lists and are only consulted when there
+are not enough prefix matches. Both are append-only, so entries left behind by a rename are
+filtered out by checking the member's current text.
+"""
+import heapq
+import threading
+from array import array
+from datetime import datetime, timedelta
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from membership.database.base import Session
+from membership.database.models import Member, format_name
+
+# default and maximum number of results returned by a search
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# a refresh re-reads members updated this long before the previous one started, to cover
+# transactions that were still open then and clock skew between hosts
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+# ranks, lower is better
+EXACT = 0
+PREFIX = 1
+WORD_PREFIX = 2
+SUBSTRING = 3
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class IndexedMember:
+    __slots__ = ('id', 'first_name', 'last_name', 'email_address', 'name', 'fields', 'words',
+                 'text')
+
+    def __init__(self, member_id: int, first_name: Optional[str], last_name: Optional[str],
+                 email_address: Optional[str]) -> None:
+        self.id = member_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email_address = email_address
+        self.name = format_name(first_name, last_name)
+        self.fields = [f.lower() for f in (first_name, last_name, email_address) if f]
+        if first_name and last_name:
+            self.fields.append(self.name.lower())
+        self.text = '\n'.join(self.fields)
+        words = set(self.text.replace('@', ' ').replace('.', ' ').split())
+        self.words = sorted(words.difference(self.fields))
+
+    def tokens(self) -> List[Tuple[str, int, int]]:
+        """ The (token, rank of a prefix match, member id) entries for the prefix list. """
+        return [(field, PREFIX, self.id) for field in self.fields] + \
+            [(word, WORD_PREFIX, self.id) for word in self.words]
+
+    def rank(self, query: str) -> Optional[int]:
+        if query not in self.text:
+            return None
+        if query in self.fields:
+            return EXACT
+        for field in self.fields:
+            if field.startswith(query):
+                return PREFIX
+        for word in self.words:
+            if word.startswith(query):
+                return WORD_PREFIX
+        return SUBSTRING
+
+
+class MemberSearchIndex:
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        """ Forgets every member; the next refresh loads them all again. """
+        with self.lock:
+            self.members: Dict[int, IndexedMember] = {}
+            self.postings: Dict[str, array] = {}
+            self.prefixes: List[Tuple[str, int, int]] = []
+            self.reindexed: Set[int] = set()
+            # when the last refresh started, by this process's clock
+            self.refreshed_at: Optional[datetime] = None
+            self.loaded = False
+
+    def add(self, member_id: int, first_name: Optional[str], last_name: Optional[str],
+            email_address: Optional[str]) -> None:
+        """ Indexes a new member, or re-indexes one whose name or email changed. """
+        entry = IndexedMember(member_id, first_name, last_name, email_address)
+        with self.lock:
+            if not self.loaded:
+                # the first refresh will pick this member up
+                return
+            current = self.members.get(member_id)
+            if current is not None:
+                if current.text == entry.text:
+                    return
+                self.reindexed.add(member_id)
+            self.members[member_id] = entry
+            for trigram in trigrams(entry.text):
+                self.postings.setdefault(trigram, array('L')).append(member_id)
+            for token in entry.tokens():
+                insort(self.prefixes, token)
+
+    def refresh(self, session: Session) -> None:
+        """ Indexes members created or changed since the last refresh, by this or any other
+        process. The query runs outside the lock, so searches aren't held up by it. """
+        with self.lock:
+            refreshed_at = self.refreshed_at
+        started = datetime.utcnow()
+        query = session.query(Member.id, Member.first_name, Member.last_name, Member.email_address)
+        if refreshed_at is not None:
+            query = query.filter(Member.updated_at > refreshed_at - REFRESH_OVERLAP)
+        rows = query.order_by(Member.id).all()
+        with self.lock:
+            if not self.loaded:
+                self._bulk_add(rows)
+                self.loaded = True
+            elif self.refreshed_at is not None and self.refreshed_at >= started:
+                # a refresh that started later has already applied newer rows
+                return
+            else:
+                for row in rows:
+                    self.add(*row)
+            self.refreshed_at = max(started, self.refreshed_at or started)
+
+    def _bulk_add(self, rows) -> None:
+        for row in rows:
+            entry = IndexedMember(*row)
+            self.members[entry.id] = entry
+            for trigram in trigrams(entry.text):
+                self.postings.setdefault(trigram, array('L')).append(entry.id)
+            self.prefixes.extend(entry.tokens())
+        self.prefixes.sort()
+
+    def search(self, query: str, limit: int=DEFAULT_LIMIT) -> List[IndexedMember]:
+        """ Returns up to `limit` members whose first name, last name, full name or email contains
+        the query, best matches first. """
+        query = ' '.join(query.lower().split())
+        if not query:
+            return []
+        with self.lock:
+            matches = self._prefix_matches(query)
+            if len(matches) < limit and len(query) >= 3:
+                # not enough prefix matches, so look for the query anywhere in the text
+                for member_id in self._trigram_candidates(query):
+                    if member_id not in matches:
+                        rank = self.members[member_id].rank(query)
+                        if rank is not None:
+                            matches[member_id] = rank
+            best = heapq.nsmallest(limit, ((rank, len(self.members[member_id].name), member_id)
+                                           for member_id, rank in matches.items()))
+            return [self.members[member_id] for _, _, member_id in best]
+
+    def _prefix_matches(self, query: str) -> Dict[int, int]:
+        matches: Dict[int, int] = {}
+        i = bisect_left(self.prefixes, (query,))
+        while i < len(self.prefixes) and self.prefixes[i][0].startswith(query):
+            token, rank, member_id = self.prefixes[i]
+            i += 1
+            if member_id in self.reindexed:
+                # the token may belong to the member's old name
+                rank = self.members[member_id].rank(query)
+                if rank is None or rank == SUBSTRING:
+                    continue
+            elif rank == PREFIX and token == query:
+                rank = EXACT
+            if rank < matches.get(member_id, SUBSTRING + 1):
+                matches[member_id] = rank
+        return matches
+
+    def _trigram_candidates(self, query: str):
+        postings = []
+        for trigram in trigrams(query):
+            posting = self.postings.get(trigram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        # every match contains all of the query's trigrams, so the rarest one bounds the candidates
+        return set(min(postings, key=len))
+
+
+member_index = MemberSearchIndex()
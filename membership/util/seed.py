@@ -0,0 +1,212 @@
+"""Fills a database with a deterministic, realistic synthetic dataset, so performance work has
+production-sized tables to measure against.
+
+The same member count, election count and seed always produce the same rows. Everything is
+written with multi-row INSERTs of explicit ids, a chunk per transaction, starting after the
+highest id already in each table, so it scales to millions of rows and can be run against a
+database that already has data. The shape roughly follows a real chapter:
+
+- members, about a third of them with a biography
+- committees with a couple of admins each, and most members in no committee or one or two
+- general and committee meetings every few days over two years, where how many meetings a member
+  attends follows a power law: most come to none or a few, a handful to almost all of them
+- elections whose voters are the members who attended a meeting, with online ballots, paper
+  ballots (some claimed and never filled in) and rankings of only the first few candidates
+"""
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, func, select
+from sqlalchemy.engine import Engine
+
+from membership.database.models import Attendee, AttendanceSummary, Candidate, Committee, \
+    Election, EligibleVoter, Meeting, Member, Role, Vote, pack_ranking
+from membership.util.attendance import period_for
+
+# rows inserted per statement and transaction
+SEED_CHUNK_SIZE = 5000
+
+# shape of the dataset, see the module docstring
+MEMBERS_PER_COMMITTEE = 2000
+MEMBERS_PER_MEETING = 100
+BIOGRAPHY_RATE = 0.3
+# Pareto shape of meetings attended per member; 1.16 puts 80% of check-ins on 20% of members
+ATTENDANCE_SHAPE = 1.16
+TURNOUT = 0.6
+PAPER_RATE = 0.15
+BLANK_PAPER_RATE = 0.1
+FIRST_MEETING = datetime(2016, 1, 5, 19)
+
+FIRST_NAMES = ('Alex', 'Ana', 'Ben', 'Carmen', 'Chen', 'Dana', 'David', 'Elena', 'Emma', 'Fatima',
+               'Gabriel', 'Hannah', 'Ibrahim', 'Isabel', 'Jamal', 'Jordan', 'Kai', 'Laura',
+               'Lucia', 'Malik', 'Maria', 'Mei', 'Michael', 'Nadia', 'Noah', 'Olivia', 'Omar',
+               'Priya', 'Rosa', 'Sam', 'Sofia', 'Taylor', 'Tomas', 'Wei', 'Yusuf', 'Zoe')
+LAST_NAMES = ('Adams', 'Ahmed', 'Brown', 'Chen', 'Cohen', 'Davis', 'Diaz', 'Garcia', 'Gonzalez',
+              'Hernandez', 'Jackson', 'Johnson', 'Kim', 'Lee', 'Lopez', 'Martin', 'Martinez',
+              'Miller', 'Moore', 'Nguyen', 'Okafor', 'Patel', 'Perez', 'Robinson', 'Rodriguez',
+              'Sanchez', 'Singh', 'Smith', 'Taylor', 'Thomas', 'Walker', 'Wang', 'White',
+              'Williams', 'Wilson', 'Wright', 'Young')
+BIOGRAPHY_SENTENCES = (
+    'I joined after my landlord tripled the rent.',
+    'I am a nurse and a member of my union.',
+    'I have been organizing tenants in my building for three years.',
+    'I teach at a public high school.',
+    'I care most about transit and housing.',
+    'I moved here for graduate school and stayed.',
+    'I help run our canvassing trainings.',
+    'I work in a warehouse and drive for a delivery app on weekends.',
+    'I want a city where everyone can afford to live.',
+    'I edit the chapter newsletter.',
+    'I was a shop steward for ten years.',
+    'I bike everywhere and want safer streets.',
+)
+COMMITTEE_NAMES = ('Housing', 'Labor', 'Healthcare', 'Electoral', 'Political Education',
+                   'Communications', 'Ecosocialism', 'Immigrant Rights', 'Tech', 'Mutual Aid',
+                   'Transit', 'Membership')
+ELECTION_NAMES = ('Co-Chair', 'Secretary', 'Treasurer', 'Steering Committee', 'Delegates',
+                  'At-Large')
+
+
+class Inserter:
+    """ Buffers rows for one table, giving each the next free id, and inserts them a chunk at
+    a time. """
+
+    def __init__(self, engine: Engine, table: Table, chunk_size: int) -> None:
+        self.engine = engine
+        self.table = table
+        self.chunk_size = chunk_size
+        with engine.connect() as connection:
+            self.next_id = (connection.scalar(select([func.max(table.c.id)])) or 0) + 1
+        self.rows: List[dict] = []
+        self.count = 0
+
+    def add(self, **row) -> int:
+        row['id'] = self.next_id
+        self.next_id += 1
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+        return row['id']
+
+    def flush(self) -> None:
+        if self.rows:
+            with self.engine.begin() as connection:
+                connection.execute(self.table.insert(), self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def vote_keys(rng: random.Random, count: int) -> List[int]:
+    """ `count` distinct random ballot keys of at least six digits, like create_vote's. """
+    digits = max(6, len(str(count * 10)))
+    return rng.sample(range(10 ** (digits - 1), 10 ** digits), count)
+
+
+def seed_dataset(engine: Engine, members: int, elections: int=4, seed: int=0,
+                 chunk_size: int=SEED_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Adds a synthetic dataset to the database
+    :param engine:
+    :param members: the number of members; every other table is sized from it
+    :param elections:
+    :param seed: the random seed
+    :param chunk_size: rows per INSERT
+    :return: the number of rows added to each table
+    """
+    rng = random.Random(seed)
+    tables = {model.__tablename__: Inserter(engine, model.__table__, chunk_size)
+              for model in (Member, Committee, Role, Meeting, Attendee, AttendanceSummary,
+                            Election, Candidate, EligibleVoter, Vote)}
+
+    member_ids = []
+    for _ in range(members):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        member_id = tables['members'].next_id
+        biography = ' '.join(rng.sample(BIOGRAPHY_SENTENCES, rng.randint(1, 4))) \
+            if rng.random() < BIOGRAPHY_RATE else None
+        member_ids.append(tables['members'].add(
+            first_name=first_name, last_name=last_name, biography=biography,
+            email_address='{}.{}.{}@example.org'.format(first_name, last_name, member_id).lower()))
+    # parents are flushed before their children's rows, which may already fill a chunk
+    tables['members'].flush()
+
+    committee_ids = []
+    for i in range(max(len(COMMITTEE_NAMES), members // MEMBERS_PER_COMMITTEE)):
+        name = COMMITTEE_NAMES[i % len(COMMITTEE_NAMES)]
+        if i >= len(COMMITTEE_NAMES):
+            name = '{} {}'.format(name, i // len(COMMITTEE_NAMES) + 1)
+        committee_ids.append(tables['committees'].add(name=name))
+    tables['committees'].flush()
+    for committee_id in committee_ids:
+        for member_id in rng.sample(member_ids, min(2, members)):
+            tables['roles'].add(member_id=member_id, committee_id=committee_id, role='admin')
+    for member_id in member_ids:
+        joined = rng.choices((0, 1, 2), weights=(70, 20, 10))[0]
+        for committee_id in rng.sample(committee_ids, joined):
+            tables['roles'].add(member_id=member_id, committee_id=committee_id, role='member')
+
+    meetings: List[Tuple[int, Optional[int], datetime]] = []
+    meeting_count = max(20, members // MEMBERS_PER_MEETING)
+    with engine.connect() as connection:
+        first_short_id = max(1000, (connection.scalar(select([func.max(Meeting.short_id)])) or 0)
+                             + 1)
+    short_ids = rng.sample(range(first_short_id, first_short_id + meeting_count * 10),
+                           meeting_count)
+    interval = timedelta(days=730) / meeting_count
+    for i, short_id in enumerate(short_ids):
+        committee_id = rng.choice(committee_ids) if rng.random() < 0.75 else None
+        start_time = FIRST_MEETING + interval * i
+        name = '{} meeting'.format('General' if committee_id is None else 'Committee')
+        meetings.append((tables['meetings'].add(
+            short_id=short_id, name=name, committee_id=committee_id, start_time=start_time,
+            end_time=start_time + timedelta(hours=2)), committee_id, start_time))
+    tables['meetings'].flush()
+
+    attended = set()
+    for member_id in member_ids:
+        count = min(meeting_count, int(rng.paretovariate(ATTENDANCE_SHAPE)) - 1)
+        if not count:
+            continue
+        attended.add(member_id)
+        summary: Dict[Tuple[Optional[int], str], int] = defaultdict(int)
+        for meeting_id, committee_id, start_time in sorted(rng.sample(meetings, count)):
+            tables['attendees'].add(member_id=member_id, meeting_id=meeting_id)
+            summary[(committee_id, period_for(start_time))] += 1
+        for (committee_id, period), attendances in sorted(
+                summary.items(), key=lambda item: (item[0][0] or 0, item[0][1])):
+            tables['attendance_summaries'].add(member_id=member_id, committee_id=committee_id,
+                                               period=period, count=attendances)
+
+    voters = [member_id for member_id in member_ids if member_id in attended]
+    for number in range(elections):
+        status = 'polls open' if number == elections - 1 else 'final'
+        name = '{} {}'.format(ELECTION_NAMES[number % len(ELECTION_NAMES)], 2016 + number)
+        election_id = tables['elections'].add(name=name, status=status,
+                                              number_winners=rng.randint(1, 3))
+        candidate_ids = [tables['candidates'].add(member_id=member_id, election_id=election_id)
+                         for member_id in rng.sample(member_ids, min(members, rng.randint(3, 8)))]
+        popularity = {candidate_id: rng.random() for candidate_id in candidate_ids}
+        tables['elections'].flush()
+        tables['candidates'].flush()
+
+        ballots = []
+        for member_id in voters:
+            voted = rng.random() < TURNOUT
+            tables['eligible_voters'].add(member_id=member_id, election_id=election_id,
+                                          voted=voted)
+            if voted:
+                ballots.append(None if rng.random() < PAPER_RATE * BLANK_PAPER_RATE else
+                               rng.randint(1, len(candidate_ids)))
+        for vote_key, ranked in zip(vote_keys(rng, len(ballots)), ballots):
+            packed = None
+            if ranked is not None:
+                packed = pack_ranking(sorted(
+                    candidate_ids, key=lambda c: -popularity[c] * rng.random())[:ranked])
+            tables['votes'].add(vote_key=vote_key, election_id=election_id,
+                                packed_ranking=packed)
+
+    for inserter in tables.values():
+        inserter.flush()
+    return {name: inserter.count for name, inserter in tables.items()}
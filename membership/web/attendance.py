@@ -0,0 +1,81 @@
+import re
+
+from flask import Blueprint, jsonify, request
+from membership.database.base import Session
+from membership.database.models import AttendanceSummary, Committee, Member, format_name
+from membership.util.attendance import attendance_query
+from membership.web.auth import requires_auth
+from membership.web.util import BadRequest
+
+attendance_api = Blueprint('attendance_api', __name__)
+
+PERIOD = re.compile(r'^\d{4}-\d{2}$')
+
+
+def window_args():
+    """ Reads the optional since/until 'YYYY-MM' arguments, raising ValueError if malformed. """
+    since = request.args.get('since')
+    until = request.args.get('until')
+    for value in (since, until):
+        if value is not None and not PERIOD.match(value):
+            raise ValueError('since and until must look like YYYY-MM')
+    return {'since': since, 'until': until}
+
+
+def int_arg(name):
+    return int(request.args[name]) if name in request.args else None
+
+
+@attendance_api.route('/attendance/summary', methods=['GET'])
+@requires_auth(admin=True)
+def get_attendance_summary(requester: Member, session: Session):
+    try:
+        filters = window_args()
+        filters['member_id'] = int_arg('member_id')
+        filters['committee_id'] = int_arg('committee_id')
+    except ValueError as e:
+        return BadRequest(str(e))
+    rows = attendance_query(session, AttendanceSummary.member_id, AttendanceSummary.committee_id,
+                            AttendanceSummary.period, **filters) \
+        .order_by(AttendanceSummary.member_id, AttendanceSummary.committee_id,
+                  AttendanceSummary.period)
+    return jsonify([{'member_id': row.member_id,
+                     'committee_id': row.committee_id,
+                     'period': row.period,
+                     'count': int(row.count)} for row in rows])
+
+
+@attendance_api.route('/attendance/committee', methods=['GET'])
+@requires_auth(admin=True)
+def get_committee_attendance(requester: Member, session: Session):
+    """ Total attendance per member for a committee (0 for general meetings), most active first. """
+    try:
+        filters = window_args()
+        committee_id = int(request.args.get('committee_id', ''))
+    except ValueError:
+        return BadRequest('committee_id is required, and since and until must look like YYYY-MM')
+    totals = attendance_query(session, AttendanceSummary.member_id, committee_id=committee_id,
+                              **filters).all()
+    names = {m.id: format_name(m.first_name, m.last_name) for m in
+             session.query(Member.id, Member.first_name, Member.last_name)
+             .filter(Member.id.in_([row.member_id for row in totals]))} if totals else {}
+    results = [{'member_id': row.member_id, 'name': names.get(row.member_id),
+                'count': int(row.count)} for row in totals]
+    results.sort(key=lambda r: (-r['count'], r['member_id']))
+    return jsonify(results)
+
+
+@attendance_api.route('/member/attendance', methods=['GET'])
+@requires_auth(admin=False)
+def get_member_attendance(requester: Member, session: Session):
+    """ The requester's attendance per committee, to show whether they are in good standing. """
+    try:
+        filters = window_args()
+    except ValueError as e:
+        return BadRequest(str(e))
+    totals = attendance_query(session, AttendanceSummary.committee_id, member_id=requester.id,
+                              **filters).all()
+    committees = {c.id: c.name for c in session.query(Committee.id, Committee.name)}
+    return jsonify([{'committee_id': row.committee_id,
+                     'committee': committees.get(row.committee_id, 'general'),
+                     'count': int(row.count)} for row in totals])
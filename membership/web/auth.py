@@ -7,10 +7,10 @@ from flask import request, Response, jsonify
 import jwt
 import logging
 from membership.database.base import Session
-from membership.database.models import Member
-import pkg_resources
+from membership.database.models import Member, Role
 import random
 import requests
+from sqlalchemy.orm import joinedload
 import string
 
 PASSWORD_CHARS = string.ascii_letters + string.digits
@@ -27,9 +27,11 @@ def deny(reason: str= '') -> Response:
     return response
 
 
-def requires_auth(admin=False):
+def requires_auth(admin=False, replica=True):
     """ This defines a decorator which when added to a route function in flask requires authorization to
     view the route.
+    GET requests read from the read replica, if one is configured, unless `replica` is False; use
+    that for routes that must see writes made moments ago.
     """
     def decorator(f):
         @wraps(f)
@@ -46,9 +48,10 @@ def requires_auth(admin=False):
                 email = token.get('email')
             else:
                 email = NO_AUTH_EMAIL
-            session = Session()
+            session = Session(use_replica=replica and request.method == 'GET')
             try:
-                member = session.query(Member).filter_by(email_address=email).one()
+                member = session.query(Member).filter_by(email_address=email) \
+                    .options(joinedload(Member.roles).joinedload(Role.committee)).one()
                 authenticated = False
                 if admin:
                     for role in member.roles:
@@ -101,10 +104,14 @@ def create_auth0_user(email):
     }
     headers = {'Authorization': 'Bearer ' + get_auth0_token()}
     r = requests.post(AUTH_URL + 'api/v2/users', json=payload, headers=headers)
-    if r.status_code > 299:
+    if r.status_code == 409:
+        # the user was created by an earlier attempt that failed later on, so pick it up again
+        user_id = get_auth0_user_id(email, headers)
+    elif r.status_code > 299:
         logging.error(r.json())
         raise Exception('Failed to create user')
-    user_id = r.json()['user_id']
+    else:
+        user_id = r.json()['user_id']
 
     # get a password change URL
     payload = {
@@ -129,3 +136,10 @@ def create_auth0_user(email):
     validate_url = r.json()['ticket']
     return validate_url
 
+
+def get_auth0_user_id(email, headers):
+    r = requests.get(AUTH_URL + 'api/v2/users-by-email', params={'email': email}, headers=headers)
+    if r.status_code > 299 or not r.json():
+        logging.error(r.text)
+        raise Exception('Failed to find existing user')
+    return r.json()[0]['user_id']
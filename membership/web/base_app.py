@@ -1,17 +1,133 @@
+import time
+from typing import Optional
+
+import click
+
+from config.metrics_config import METRICS_QUERY_COUNT_THRESHOLD
 from flask import jsonify
 from flask import Flask
 from flask_cors import CORS
+from membership.web.attendance import attendance_api
+from membership.web.auth import requires_auth
 from membership.web.members import member_api
-from membership.web.elections import election_api
-from raven.contrib.flask import Sentry
+from membership.web.elections import archive_election, election_api
+from membership.web.exports import export_api
+from membership.web.idempotency import purge_expired_keys
+from membership.web.jobs import job_api
+from membership.web.kiosk import kiosk_api
+from membership.web.onboarding import onboarding_api
+from membership.util import metrics
+from membership.database.base import configure_engine, get_engine, Session
+from membership.database.models import Candidate, Committee, Election, ElectionArchive, \
+    Meeting, Member
+from membership.util.attendance import rebuild_attendance_summary
+from membership.util.jobs import Worker
+from membership.util.seed import seed_dataset
+from membership.web.caching import bump_versions
+
+
+def create_app(config: Optional[dict]=None) -> Flask:
+    """
+    Builds the Flask app. Nothing connects to the database until the first request (or command)
+    needs to, so creating an app is cheap.
+    :param config: overrides for `app.config`. `DATABASE` (and `DATABASE_REPLICA`) replace the
+        engine settings from `config.database_config` for this process, and `SENTRY` set to False
+        skips Sentry.
+    :return:
+    """
+    app = Flask(__name__)
+    app.config['SENTRY'] = True
+    app.config['METRICS_QUERY_COUNT_THRESHOLD'] = METRICS_QUERY_COUNT_THRESHOLD
+    app.config.update(config or {})
+    if 'DATABASE' in app.config:
+        configure_engine(app.config['DATABASE'], app.config.get('DATABASE_REPLICA'))
+
+    CORS(app)
+    app.register_blueprint(member_api)
+    app.register_blueprint(election_api)
+    app.register_blueprint(job_api)
+    app.register_blueprint(onboarding_api)
+    app.register_blueprint(attendance_api)
+    app.register_blueprint(kiosk_api)
+    app.register_blueprint(export_api)
+    if app.config['SENTRY']:
+        from raven.contrib.flask import Sentry
+        Sentry(app)
+    metrics.init_app(app, app.config['METRICS_QUERY_COUNT_THRESHOLD'])
+    register_routes(app)
+    register_commands(app)
+    return app
+
+
+def register_routes(app: Flask) -> None:
+    @app.route('/health', methods=["GET"])
+    def health_check():
+        return jsonify({'health': True})
+
+    @app.route('/metrics', methods=["GET"])
+    @requires_auth(admin=True)
+    def get_metrics(requester: Member, session: Session):
+        return jsonify(metrics.registry.snapshot())
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command('worker')
+    def run_worker():
+        """Runs background jobs (Auth0 provisioning, welcome emails) until interrupted."""
+        Worker().run_forever()
+
+    @app.cli.command('rebuild-attendance')
+    def rebuild_attendance():
+        """Recomputes the attendance summaries from the attendees table."""
+        session = Session()
+        try:
+            rows = rebuild_attendance_summary(session)
+        finally:
+            session.close()
+        print('Wrote {} attendance summary rows'.format(rows))
 
-app = Flask(__name__)
-CORS(app)
-app.register_blueprint(member_api)
-app.register_blueprint(election_api)
-sentry = Sentry(app)
+    @app.cli.command('archive-elections')
+    def archive_elections():
+        """Moves the ballots and voter rolls of final elections into compressed archives."""
+        session = Session()
+        try:
+            elections = session.query(Election) \
+                .outerjoin(ElectionArchive, ElectionArchive.election_id == Election.id) \
+                .filter(Election.status == 'final', ElectionArchive.election_id.is_(None)).all()
+            for election in elections:
+                archive = archive_election(session, election)
+                session.commit()
+                print('Archived election {} ({} ballots, {} voters, {} bytes)'.format(
+                    election.id, archive.ballot_count, archive.voter_count,
+                    len(archive.snapshot)))
+        finally:
+            session.close()
 
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys():
+        """Deletes Idempotency-Keys older than IDEMPOTENCY_KEY_HOURS; run it daily from cron."""
+        session = Session()
+        try:
+            print('Deleted {} expired idempotency keys'.format(purge_expired_keys(session)))
+        finally:
+            session.close()
 
-@app.route('/health', methods=["GET"])
-def health_check():
-    return jsonify({'health': True})
\ No newline at end of file
+    @app.cli.command('seed')
+    @click.option('--members', default=1000, help='Number of members; the other tables are '
+                                                  'sized from it.')
+    @click.option('--elections', default=4, help='Number of elections.')
+    @click.option('--seed', 'random_seed', default=0, help='Random seed.')
+    def seed(members, elections, random_seed):
+        """Adds a deterministic synthetic dataset to the database, for performance work."""
+        started = time.monotonic()
+        counts = seed_dataset(get_engine(), members, elections, random_seed)
+        session = Session()
+        try:
+            # running servers must not keep serving cached responses from before the seed
+            bump_versions(session, Candidate, Committee, Election, Meeting, Member)
+            session.commit()
+        finally:
+            session.close()
+        for table, count in counts.items():
+            print('{:<22} {:>10}'.format(table, count))
+        print('Added {} rows in {:.1f}s'.format(sum(counts.values()), time.monotonic() - started))
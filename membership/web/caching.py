@@ -0,0 +1,101 @@
+"""Conditional GET for endpoints that are polled far more often than their data changes.
+
+Every table a cached endpoint reads from has a row in `table_versions` that writers bump in the
+same transaction as their change. A response's ETag is a digest of the request and the versions
+it was built from, so checking whether a client's copy is current costs one primary key lookup,
+and the body itself is kept in-process under the same key. A bump evicts only the bodies built
+from the bumped tables.
+"""
+import hashlib
+from functools import wraps
+from typing import Dict, Iterable, List, Type
+
+from config.cache_config import RESPONSE_CACHE_SECONDS, RESPONSE_CACHE_SIZE
+from flask import request, Response
+from membership.database.base import Base, Session
+from membership.database.models import TableVersion
+from membership.database.util import insert_ignore
+from membership.util.cache import TTLCache
+from sqlalchemy import event
+from membership.web.util import compress_response
+
+response_cache = TTLCache(ttl=RESPONSE_CACHE_SECONDS, max_size=RESPONSE_CACHE_SIZE)
+
+
+def table_names(models: Iterable[Type[Base]]) -> List[str]:
+    return sorted({model.__tablename__ for model in models})
+
+
+def table_versions(session: Session, *models: Type[Base]) -> Dict[str, int]:
+    """ The current version of each model's table; tables that were never written are at 0. """
+    names = table_names(models)
+    versions = dict.fromkeys(names, 0)
+    if names:
+        versions.update(session.query(TableVersion.table_name, TableVersion.version)
+                        .filter(TableVersion.table_name.in_(names)))
+    return versions
+
+
+def table_digests(session: Session, *models: Type[Base]) -> Dict[str, str]:
+    """ A hash of every row of each model's table, for tables that are written outside the app
+    and so never have their version bumped. Any insert, update or delete changes it. """
+    digests = {}
+    for model in models:
+        table = model.__table__
+        digest = hashlib.sha1()
+        for row in session.query(*table.columns).order_by(model.id):
+            digest.update(repr(tuple(row)).encode('utf-8'))
+        digests[table.name] = digest.hexdigest()
+    return digests
+
+
+def bump_versions(session: Session, *models: Type[Base]) -> None:
+    """ Marks the tables of the given models as changed. Call it in the transaction that makes
+    the change, so the new version becomes visible together with the data. """
+    table = TableVersion.__table__
+    names = table_names(models)
+    for name in names:
+        insert_ignore(session, table, {'table_name': name, 'version': 0})
+        session.execute(table.update().where(table.c.table_name == name)
+                        .values(version=table.c.version + 1))
+    # entries for the old versions can no longer be hit; drop them rather than wait for expiry,
+    # but only once the change is committed, or a concurrent read could cache the old data again
+    event.listen(session, 'after_commit', lambda session: response_cache.evict(names), once=True)
+
+
+def cached_response(*models: Type[Base], digested: Iterable[Type[Base]]=()):
+    """ Serves the decorated GET endpoint with an ETag derived from the versions of the tables
+    of `models`, answering 304 when the client already has the current response and reusing the
+    cached body otherwise. Tables that are written outside the app, and whose versions are
+    therefore never bumped, go in `digested` instead: a hash of their rows is part of the ETag.
+    The response must depend only on the request URL and those tables, not on the requester.
+    The body is cached uncompressed and compressed per request. Goes below `requires_auth`,
+    which provides the session. """
+    digested = tuple(digested)
+    tables = table_names(models + digested)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            versions = table_versions(kwargs['session'], *models)
+            digests = table_digests(kwargs['session'], *digested)
+            key = '{} {} {} {}'.format(request.path, sorted(request.args.items(multi=True)),
+                                       sorted(versions.items()), sorted(digests.items()))
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(etag)
+                if cached is None:
+                    response = f(*args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    cached = (response.get_data(), response.mimetype)
+                    response_cache.set(etag, cached, tags=tables)
+                response = Response(cached[0], mimetype=cached[1])
+            # weak, because the same ETag is served whichever encoding the client accepts
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return compress_response(response)
+        return decorated
+    return decorator
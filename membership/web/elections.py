@@ -1,19 +1,40 @@
+import hashlib
+import json
+from collections import defaultdict
+from typing import List, NamedTuple, Optional, Tuple
+
+from config.cache_config import BALLOT_CACHE_SECONDS, FINAL_BALLOT_MAX_AGE
 from flask import Blueprint, jsonify, request, Response
 from membership.database.base import Session
-from membership.database.models import Candidate, Election, Member, EligibleVoter, Vote, Ranking
+from membership.database.models import Candidate, Election, ElectionArchive, Member, \
+    EligibleVoter, Vote, Ranking, format_name, pack_ranking, unpack_ranking
+from membership.util.archive import Snapshot, build_archive, read_archive
 from membership.web.auth import requires_auth
+from membership.web.caching import bump_versions, cached_response, response_cache, \
+    table_versions
+from membership.web.idempotency import idempotent
 from membership.web.util import BadRequest
 from membership.util.vote import STVElection
-from membership.web.util import CustomEncoder, custom_jsonify
+from membership.web.util import compress_response, dumps, dumps_json, json_response
+import logging
 import random
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, object_session
+
+logger = logging.getLogger(__name__)
 
 election_api = Blueprint('election_api', __name__)
 
+# in the order an election goes through them
+ELECTION_STATUSES = ('draft', 'polls open', 'polls closed', 'final')
+
+# the tables a ballot definition is built from
+BALLOT_MODELS = (Election, Candidate, Member)
+
 
 @election_api.route('/election/list', methods=['GET'])
 @requires_auth(admin=False)
+@cached_response(Election)
 def get_elections(requester: Member, session: Session):
     elections = session.query(Election).all()
     result = {e.id: e.name for e in elections}
@@ -21,15 +42,63 @@ def get_elections(requester: Member, session: Session):
 
 
 @election_api.route('/election', methods=['GET'])
-@requires_auth(admin=False)
+@requires_auth(admin=False, replica=False)
 def get_election_by_id(requester: Member, session: Session):
-    election = session.query(Election).get(request.args.get('id'))
-    result = {'name': election.name,
-              'number_winners': election.number_winners,
-              'candidates': [{'id': candidate.id,
-                              'name': candidate.member.name} for candidate in election.candidates],
-              'status': election.status}
-    return jsonify(result)
+    """ The ballot definition of an election: its name, number of winners, status and
+    candidates. It is built once with a single query and then served from memory, with an ETag
+    and a max-age, under the versions of the tables it was built from, so a change made through
+    any worker is seen by every worker on its next request. It is read from the primary, since a
+    lagging replica would cache a status that was just changed. """
+    try:
+        election_id = int(request.args['id'])
+    except (KeyError, ValueError):
+        return BadRequest('id must be an integer')
+    versions = table_versions(session, *BALLOT_MODELS)
+    key = ('ballot', election_id, tuple(versions.items()))
+    ballot = response_cache.get(key)
+    if ballot is None:
+        generation = response_cache.generation
+        ballot = build_ballot(session, election_id)
+        if ballot is None:
+            return Response('No election with id={}'.format(election_id), 404)
+        response_cache.set(key, ballot, ttl=BALLOT_CACHE_SECONDS, generation=generation,
+                           tags=versions.keys())
+    if request.if_none_match.contains(ballot.etag):
+        response = Response(status=304)
+    else:
+        response = Response(ballot.body, mimetype='application/json')
+    response.set_etag(ballot.etag)
+    if ballot.status == 'final':
+        response.headers['Cache-Control'] = 'private, max-age={}, immutable'.format(
+            FINAL_BALLOT_MAX_AGE)
+    else:
+        response.headers['Cache-Control'] = 'private, max-age={}'.format(
+            int(BALLOT_CACHE_SECONDS))
+    return compress_response(response)
+
+
+class Ballot(NamedTuple):
+    etag: str
+    body: bytes
+    status: str
+
+
+def build_ballot(session: Session, election_id: int) -> Optional[Ballot]:
+    rows = session.query(Election.name, Election.number_winners, Election.status, Candidate.id,
+                         Member.first_name, Member.last_name) \
+        .outerjoin(Candidate, Candidate.election_id == Election.id) \
+        .outerjoin(Member, Candidate.member_id == Member.id) \
+        .filter(Election.id == election_id).order_by(Candidate.id).all()
+    if not rows:
+        return None
+    name, number_winners, status = rows[0][:3]
+    body = dumps({'name': name,
+                  'number_winners': number_winners,
+                  'candidates': [{'id': candidate_id, 'name': format_name(first_name, last_name)}
+                                 for _, _, _, candidate_id, first_name, last_name in rows
+                                 if candidate_id is not None],
+                  'status': status})
+    return Ballot(hashlib.sha1(body).hexdigest(), body, status)
 
 
 @election_api.route('/election', methods=['POST'])
@@ -44,31 +113,62 @@ def add_election(requester: Member, session: Session):
         candidate.election = election
         candidate.member = member
         session.add(candidate)
+    bump_versions(session, Election, Candidate)
     session.commit()
     return jsonify({'status': 'success'})
 
 
+@election_api.route('/election/status', methods=['POST'])
+@requires_auth(admin=True)
+def set_election_status(requester: Member, session: Session):
+    """ Moves an election on to a later status. Statuses never go back, and a final election
+    (whose ballots may have been archived, and whose ballot clients cache for a day) never
+    changes again. """
+    status = request.json.get('status')
+    if status not in ELECTION_STATUSES:
+        return BadRequest('status must be one of {}'.format(', '.join(ELECTION_STATUSES)))
+    election = session.query(Election).with_for_update().filter_by(
+        id=request.json['election_id']).one_or_none()
+    if not election:
+        return BadRequest('Invalid election_id')
+    if election.status == 'final' or session.query(ElectionArchive).get(election.id):
+        return BadRequest('A final election can not be changed')
+    if election.status in ELECTION_STATUSES and \
+            ELECTION_STATUSES.index(status) < ELECTION_STATUSES.index(election.status):
+        return BadRequest('Election is {}, it can not go back to {}'.format(
+            election.status, status))
+    if status != election.status:
+        election.status = status
+        bump_versions(session, Election)
+        session.commit()
+    return jsonify({'status': 'success'})
+
+
 @election_api.route('/election/eligible/list')
 @requires_auth(admin=True)
 def get_eligible(requester: Member, session: Session):
     election_id = request.args['election_id']
     eligibles = session.query(EligibleVoter)\
         .filter_by(election_id=election_id).options(joinedload(EligibleVoter.member)).all()
+    members = [eligible.member for eligible in eligibles]
     results = {}
-    for eligible in eligibles:
-        results[eligible.member_id] = {'name': eligible.member.name,
-                                       'email_address': eligible.member.email_address}
-    return jsonify(results)
+    for member in members:
+        results[member.id] = {'name': member.name, 'email_address': member.email_address}
+    return json_response(results)
 
 
 @election_api.route('/election/<int:election_id>/vote/<int:ballot_key>', methods=['GET'])
 @requires_auth(admin=False)
 def get_vote(requester: Member, session: Session, election_id: int, ballot_key: int):
     vote = session.query(Vote).filter(Vote.election_id == election_id, Vote.vote_key == ballot_key).one_or_none()
+    rankings = vote.candidate_ids if vote else None
     if not vote:
+        archive = session.query(ElectionArchive).get(election_id)
+        if archive is not None:
+            rankings = dict(read_archive(archive).ballots).get(ballot_key)
+    if rankings is None:
         return Response('Ballot #{} has not been cast for election_id={}'.format(ballot_key, election_id), 404)
     else:
-        rankings = [ranking.candidate_id for ranking in vote.ranking]
         return jsonify({
             'election_id': election_id,
             'ballot_key': ballot_key,
@@ -105,6 +205,28 @@ def add_paper_ballots(requester: Member, session: Session):
     return jsonify(ballot_keys)
 
 
+def check_rankings(session: Session, election_id: int, rankings) -> Tuple[List[int], Optional[str]]:
+    """ The candidate ids of `rankings` as integers, and why they are not a valid ballot for the
+    election, or None if they are: they must be distinct candidates of the election, given as
+    integers or strings of them. Packed rankings have no foreign key, so this is all that keeps an
+    unknown candidate out of the count. """
+    invalid = 'rankings must be a list of candidate ids'
+    if not isinstance(rankings, list) or any(isinstance(c, bool) for c in rankings):
+        return [], invalid
+    try:
+        rankings = [int(c) for c in rankings]
+    except (TypeError, ValueError):
+        return [], invalid
+    if len(set(rankings)) != len(rankings):
+        return rankings, 'A candidate may only be ranked once'
+    candidate_ids = {candidate_id for candidate_id, in
+                     session.query(Candidate.id).filter(Candidate.election_id == election_id)}
+    unknown = [c for c in rankings if c not in candidate_ids]
+    if unknown:
+        return rankings, 'Not candidates in this election: {}'.format(', '.join(map(str, unknown)))
+    return rankings, None
+
+
 @election_api.route('/vote/paper', methods=['POST'])
 @requires_auth(admin=True)
 def submit_paper_vote(requester: Member, session: Session):
@@ -112,6 +234,9 @@ def submit_paper_vote(requester: Member, session: Session):
     election = session.query(Election).get(election_id)
     if election.status == 'final':
         return BadRequest('You may not submit more votes after an election has been marked final')
+    rankings, error = check_rankings(session, election.id, request.json.get('rankings'))
+    if error:
+        return BadRequest(error)
     vote_key = request.json['ballot_key']
     vote = session.query(Vote).filter_by(
         election_id=election_id,
@@ -120,19 +245,14 @@ def submit_paper_vote(requester: Member, session: Session):
     if not vote:
         return Response('Ballot #{} for election_id={} not claimed'.format(vote_key, election_id), 404)
 
-    if vote.ranking and not request.json.get('override', False):
-        if len(vote.ranking) != len(request.json['rankings']):
+    if vote.candidate_ids and not request.json.get('override', False):
+        if vote.candidate_ids != rankings:
             return jsonify({'status': 'mismatch'})
-        for rank, candidate_id in enumerate(request.json['rankings']):
-            if candidate_id != vote.ranking[rank].candidate_id:
-                return jsonify({'status': 'mismatch'})
         return jsonify({'status': 'match'})
     if request.json.get('override', False):
         for rank in vote.ranking:
             session.delete(rank)
-    for rank, candidate_id in enumerate(request.json['rankings']):
-        ranking = Ranking(rank=rank, candidate_id=candidate_id)
-        vote.ranking.append(ranking)
+    vote.packed_ranking = pack_ranking(rankings)
     session.add(vote)
     session.commit()
     return jsonify({'status': 'new'})
@@ -140,11 +260,15 @@ def submit_paper_vote(requester: Member, session: Session):
 
 @election_api.route('/vote', methods=['POST'])
 @requires_auth()
+@idempotent
 def submit_vote(requester: Member, session: Session):
     election_id = request.json['election_id']
     election = session.query(Election).get(election_id)
     if election.status == 'final' or election.status == 'polls closed':
         return BadRequest('You may not submit a vote after the polls have closed')
+    rankings, error = check_rankings(session, election.id, request.json.get('rankings'))
+    if error:
+        return BadRequest(error)
     eligible = session.query(EligibleVoter). \
         filter_by(member_id=requester.id, election_id=election_id).with_for_update().one_or_none()
     if not eligible:
@@ -153,20 +277,9 @@ def submit_vote(requester: Member, session: Session):
         return BadRequest('You have either already voted or received a paper ballot for this '
                           'election.')
     eligible.voted = True
-    vote, rolled_back = create_vote(session, election_id, 6)
-    if rolled_back:  # If we lost the lock we have to recheck
-        eligible = session.query(EligibleVoter). \
-            filter_by(member_id=requester.id,
-                      election_id=election_id).with_for_update().one_or_none()
-        if eligible.voted:
-            return BadRequest('You have either already voted or received a paper ballot for this '
-                              'election.')
-        eligible.voted = True
-    for rank, candidate_id in enumerate(request.json['rankings']):
-        ranking = Ranking(rank=rank, candidate_id=candidate_id)
-        vote.ranking.append(ranking)
-    session.add(vote)
-    session.commit()
+    vote = draw_vote(session, election_id, 6)
+    vote.packed_ranking = pack_ranking(rankings)
+    # committed by `idempotent`, together with the stored response
     return jsonify({'ballot_id': vote.vote_key})
 
 
@@ -175,6 +288,8 @@ def submit_vote(requester: Member, session: Session):
 def add_voter(requester: Member, session: Session):
     election_id = request.json['election_id']
     member_id = request.json.get('member_id', requester.id)
+    if session.query(ElectionArchive).get(election_id) is not None:
+        return BadRequest('Election {} is archived and takes no more voters'.format(election_id))
     eligible_voter = EligibleVoter(member_id=member_id, election_id=election_id)
     session.add(eligible_voter)
     session.commit()
@@ -185,32 +300,107 @@ def add_voter(requester: Member, session: Session):
 @requires_auth(admin=True)
 def election_count(requester: Member, session: Session):
     election_id = request.args['id']
+    archive = session.query(ElectionArchive).get(election_id)
+    if archive is not None:
+        return json_response(archive.result)
     election = session.query(Election).get(election_id)
-    stv = hold_election(election)
-    winners = [session.query(Candidate).get(cid).member.name for cid in stv.winners]
+    return json_response(election_result(session, election))
+
+
+def election_result(session: Session, election: Election) -> dict:
+    """ The count of an election that is not archived, as /election/count serves it. """
+    ballots = [candidate_ids for _, candidate_ids in load_votes(session, election.id)
+               if candidate_ids]
+    stv = hold_election(election, ballots)
+    names = {candidate_id: format_name(first_name, last_name)
+             for candidate_id, first_name, last_name in
+             session.query(Candidate.id, Member.first_name, Member.last_name)
+             .join(Member, Candidate.member_id == Member.id)
+             .filter(Candidate.election_id == election.id)}
+    winners = [names[cid] for cid in stv.winners]
     round_information = {}
     for round_number, round in enumerate(stv.previous_rounds):
         candidate_information = {}
         for cid, vote_info in round.items():
-            candidate_name = session.query(Candidate).get(cid).member.name
-            candidate_information[candidate_name] = vote_info
+            candidate_information[names[cid]] = vote_info
         round_information[round_number + 1] = candidate_information
-    return custom_jsonify(data={'winners': winners, 'round_information': round_information},
-                          encoder=CustomEncoder)
+    return {'winners': winners, 'round_information': round_information}
+
+
+def load_votes(session: Session, election_id: int) -> List[Tuple[int, List[int]]]:
+    """ The key and ranked candidate ids of every ballot of an election that is not archived, in
+    the order they were claimed. Packed ballots are read straight from `votes`, and those cast
+    before rankings were packed are assembled from their `rankings` rows with one more query. """
+    ballots = session.query(Vote.id, Vote.vote_key, Vote.packed_ranking) \
+        .filter(Vote.election_id == election_id).order_by(Vote.id).all()
+    unpacked = defaultdict(list)
+    if any(packed is None for _, _, packed in ballots):
+        rows = session.query(Ranking.vote_id, Ranking.candidate_id) \
+            .join(Vote, Ranking.vote_id == Vote.id) \
+            .filter(Vote.election_id == election_id, Vote.packed_ranking.is_(None)) \
+            .order_by(Ranking.vote_id, Ranking.rank, Ranking.id)
+        for vote_id, candidate_id in rows:
+            unpacked[vote_id].append(candidate_id)
+    return [(vote_key, unpack_ranking(packed) if packed is not None else unpacked.get(vote_id, []))
+            for vote_id, vote_key, packed in ballots]
+
+
+def load_ballots(session: Session, election_id: int) -> List[List[int]]:
+    """ The ranked candidate ids of every filled-in ballot of an election, read from its archive
+    if it has one. """
+    archive = session.query(ElectionArchive).get(election_id)
+    votes = read_archive(archive).ballots if archive is not None \
+        else load_votes(session, election_id)
+    return [candidate_ids for _, candidate_ids in votes if candidate_ids]
 
 
-def hold_election(election: Election):
-    votes = [
-        [v.candidate_id for v in vote.ranking]
-        for vote in election.votes if vote.ranking
-    ]
+def hold_election(election: Election, votes: Optional[List[List[int]]]=None):
+    if votes is None:
+        votes = load_ballots(object_session(election), election.id)
     candidate_ids = [c.id for c in election.candidates]
-    print("CANDIDATE_IDS: {}, VOTES: {}, NUM WINNERS: {}".format(candidate_ids, votes, election.number_winners))
+    # formatting every ballot is slow for large elections, so only do it when asked to
+    logger.debug('CANDIDATE_IDS: %s, VOTES: %s, NUM WINNERS: %s', candidate_ids, votes,
+                 election.number_winners)
     stv = STVElection([c.id for c in election.candidates], election.number_winners, votes)
     stv.hold_election()
     return stv
 
 
+def archive_election(session: Session, election: Election) -> ElectionArchive:
+    """
+    Moves the ballots of a finalized election out of `votes` and `rankings` into an
+    ElectionArchive, along with its count and a copy of its voter roll, as part of the caller's
+    transaction. The voter roll stays in `eligible_voters`, where member details and the voter
+    export read it.
+    :param session:
+    :param election:
+    :return: the new archive, or the existing one if the election is already archived
+    """
+    if election.status != 'final':
+        raise ValueError('Election {} is {}, only final elections are archived'.format(
+            election.id, election.status))
+    archive = session.query(ElectionArchive).get(election.id)
+    if archive is not None:
+        return archive
+
+    # stored the way /election/count serves it, Decimal totals included
+    result = json.loads(dumps_json(election_result(session, election)).decode('utf-8'))
+    voters = session.query(EligibleVoter.member_id, EligibleVoter.voted) \
+        .filter(EligibleVoter.election_id == election.id).order_by(EligibleVoter.id)
+    snapshot = Snapshot(load_votes(session, election.id),
+                        [(member_id, bool(voted)) for member_id, voted in voters])
+    archive = build_archive(election.id, snapshot, result)
+    session.add(archive)
+
+    vote_ids = session.query(Vote.id).filter(Vote.election_id == election.id)
+    session.query(Ranking).filter(Ranking.vote_id.in_(vote_ids.subquery())) \
+        .delete(synchronize_session=False)
+    session.query(Vote).filter(Vote.election_id == election.id) \
+        .delete(synchronize_session=False)
+    session.expire(election, ['votes'])
+    return archive
+
+
 def create_vote(session: Session, election_id: int, digits: int):
     i = 0
     rolled_back = False
@@ -227,3 +417,21 @@ def create_vote(session: Session, election_id: int, digits: int):
             session.rollback()
             rolled_back = True
     raise Exception('Failing to find a random key in five tries. Think something is wrong.')
+
+
+def draw_vote(session: Session, election_id: int, digits: int) -> Vote:
+    """ Adds a vote with a random key that is not taken yet, without committing, so that the
+    voter is marked as voted and the ballot is cast in one transaction. Each key is inserted in
+    a savepoint, so a key that is taken, even by a voter whose ballot commits at the same moment,
+    is rolled back alone and another key is drawn. """
+    for _ in range(5):
+        vote = Vote(vote_key=random.randint(10 ** (digits - 1), 10 ** digits - 1),
+                    election_id=election_id)
+        try:
+            with session.begin_nested():
+                session.add(vote)
+        except IntegrityError:
+            logger.info('Ballot key collision in election %s, drawing another', election_id)
+            continue
+        return vote
+    raise Exception('Failing to find a random key in five tries. Think something is wrong.')
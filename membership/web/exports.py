@@ -0,0 +1,96 @@
+import csv
+import io
+from typing import Iterable, Iterator, Sequence
+
+from flask import Blueprint, request, Response
+from membership.database.base import Session
+from membership.database.models import Attendee, Election, EligibleVoter, Meeting, Member
+from membership.database.util import stream_rows
+from membership.web.auth import requires_auth
+from membership.web.util import BadRequest
+from sqlalchemy.orm import Query
+
+export_api = Blueprint('export_api', __name__)
+
+# rows written per chunk of a streamed CSV export
+CSV_CHUNK_SIZE = 1000
+
+
+def stream_csv(header: Sequence[str], rows: Iterable) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CSV_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(session: Session, query: Query, filename: str) -> Response:
+    """ Streams the rows of a column-only query as a CSV attachment, reading them from a
+    server-side cursor so memory use does not grow with the table. """
+    header = [column['name'] for column in query.column_descriptions]
+    rows = stream_rows(session.get_bind(), query.statement)
+    response = Response(stream_csv(header, rows), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+    return response
+
+
+def int_args(*names: str) -> dict:
+    return {name: int(request.args[name]) for name in names if name in request.args}
+
+
+@export_api.route('/export/members.csv', methods=['GET'])
+@requires_auth(admin=True)
+def export_members(requester: Member, session: Session):
+    query = session.query(Member.id, Member.first_name, Member.last_name, Member.email_address) \
+        .order_by(Member.id)
+    return csv_response(session, query, 'members.csv')
+
+
+@export_api.route('/export/attendance.csv', methods=['GET'])
+@requires_auth(admin=True)
+def export_attendance(requester: Member, session: Session):
+    """ Every check-in with its meeting and member, optionally for one `meeting_id` or
+    `committee_id`. """
+    try:
+        filters = int_args('meeting_id', 'committee_id')
+    except ValueError:
+        return BadRequest('meeting_id and committee_id must be integers')
+    query = session.query(Meeting.id.label('meeting_id'), Meeting.name.label('meeting_name'),
+                          Meeting.committee_id, Meeting.start_time,
+                          Member.id.label('member_id'), Member.first_name, Member.last_name,
+                          Member.email_address) \
+        .select_from(Attendee) \
+        .join(Meeting, Attendee.meeting_id == Meeting.id) \
+        .join(Member, Attendee.member_id == Member.id) \
+        .order_by(Attendee.id)
+    if 'meeting_id' in filters:
+        query = query.filter(Meeting.id == filters['meeting_id'])
+    if 'committee_id' in filters:
+        query = query.filter(Meeting.committee_id == filters['committee_id'])
+    return csv_response(session, query, 'attendance.csv')
+
+
+@export_api.route('/export/voters.csv', methods=['GET'])
+@requires_auth(admin=True)
+def export_voters(requester: Member, session: Session):
+    """ The voter roll of an election (or of every election) with whether each voter voted. """
+    try:
+        filters = int_args('election_id')
+    except ValueError:
+        return BadRequest('election_id must be an integer')
+    query = session.query(Election.id.label('election_id'),
+                          Election.name.label('election_name'),
+                          Member.id.label('member_id'), Member.first_name, Member.last_name,
+                          Member.email_address, EligibleVoter.voted) \
+        .select_from(EligibleVoter) \
+        .join(Election, EligibleVoter.election_id == Election.id) \
+        .join(Member, EligibleVoter.member_id == Member.id) \
+        .order_by(EligibleVoter.id)
+    if 'election_id' in filters:
+        query = query.filter(Election.id == filters['election_id'])
+    return csv_response(session, query, 'voters.csv')
@@ -0,0 +1,154 @@
+"""Safe retries for submissions from clients on unreliable connections.
+
+A client sends an `Idempotency-Key` header, any string unique to the submission, and sends the
+same key with every retry of it. The key is reserved under the member before the request runs, so
+the unique constraint on it lets only one of several concurrent retries do the work. The response
+is stored in the same transaction as that work, and a retry gets it back from one indexed lookup,
+without running the request's transactional work again.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Optional
+
+from config.idempotency_config import IDEMPOTENCY_KEY_HOURS, IDEMPOTENCY_RESERVATION_SECONDS
+from flask import request, Response
+from membership.database.base import Session
+from membership.database.models import IdempotencyKey
+from membership.web.util import BadRequest
+from sqlalchemy.exc import IntegrityError
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint() -> str:
+    digest = hashlib.sha256('{} {}\n'.format(request.method, request.path).encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def expiry() -> datetime:
+    """ Keys created before this have expired. """
+    return datetime.utcnow() - timedelta(hours=IDEMPOTENCY_KEY_HOURS)
+
+
+def find_key(session: Session, member_id: int, key: str) -> Optional[IdempotencyKey]:
+    return session.query(IdempotencyKey) \
+        .filter(IdempotencyKey.member_id == member_id, IdempotencyKey.key == key,
+                IdempotencyKey.created_at > expiry()).one_or_none()
+
+
+def reserve_key(session: Session, member_id: int, key: str,
+                fingerprint: str) -> Optional[IdempotencyKey]:
+    """ Commits a row for the key without a response, or returns None if another request holds
+    the key. The member's expired keys are deleted in the same transaction, so an expired key
+    can be used again. """
+    session.query(IdempotencyKey) \
+        .filter(IdempotencyKey.member_id == member_id, IdempotencyKey.created_at <= expiry()) \
+        .delete(synchronize_session=False)
+    reserved = IdempotencyKey(member_id=member_id, key=key, fingerprint=fingerprint,
+                              created_at=datetime.utcnow())
+    session.add(reserved)
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        return None
+    return reserved
+
+
+def take_over_key(session: Session, stored: IdempotencyKey) -> Optional[IdempotencyKey]:
+    """ Takes over a reservation that has gone without a response for longer than
+    IDEMPOTENCY_RESERVATION_SECONDS, most likely because its worker was killed mid-request and
+    its work rolled back, or returns None if it may still be running. The update is conditional,
+    so only one of several retries takes it over. """
+    now = datetime.utcnow()
+    lease_expired = now - timedelta(seconds=IDEMPOTENCY_RESERVATION_SECONDS)
+    if stored.created_at > lease_expired:
+        return None
+    taken = session.query(IdempotencyKey) \
+        .filter(IdempotencyKey.id == stored.id, IdempotencyKey.body.is_(None),
+                IdempotencyKey.created_at <= lease_expired) \
+        .update({IdempotencyKey.created_at: now}, synchronize_session=False)
+    session.commit()
+    return stored if taken else None
+
+
+def release_key(session: Session, reserved: IdempotencyKey) -> None:
+    """ Rolls back the request's work and deletes its reservation, so the key can be retried. """
+    session.rollback()
+    session.delete(reserved)
+    session.commit()
+
+
+def purge_expired_keys(session: Session) -> int:
+    """ Deletes every expired key and returns how many there were. Members who come back delete
+    their own when they next send a key; this is for everyone else. """
+    count = session.query(IdempotencyKey).filter(IdempotencyKey.created_at <= expiry()) \
+        .delete(synchronize_session=False)
+    session.commit()
+    return count
+
+
+def idempotent(f):
+    """ Replays the stored response when the requester retries a request with the same
+    Idempotency-Key. A request that has one first reserves it, and stores its response if it
+    succeeds. Failed requests release the key, so retrying one runs it again. A retry that arrives
+    while the first request is still running is refused with a 409, unless the reservation is
+    older than IDEMPOTENCY_RESERVATION_SECONDS, in which case the retry takes it over and runs.
+    A key that is reused with a different request is refused with a 422.
+
+    The decorated view must not commit its last changes: they are committed here, together with
+    the stored response, when it succeeds, and rolled back when it fails. Goes below
+    `requires_auth`, which provides the requester and the session. """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        session = kwargs['session']
+        key = request.headers.get(HEADER)
+        if not key:
+            response = f(*args, **kwargs)
+            if 200 <= response.status_code < 300:
+                session.commit()
+            return response
+        if len(key) > MAX_KEY_LENGTH:
+            return BadRequest('{} may be at most {} characters'.format(HEADER, MAX_KEY_LENGTH))
+        requester = kwargs['requester']
+        fingerprint = request_fingerprint()
+        stored = find_key(session, requester.id, key)
+        if stored is None:
+            reserved = reserve_key(session, requester.id, key, fingerprint)
+            if reserved is not None:
+                return run_reserved(f, reserved, args, kwargs)
+            stored = find_key(session, requester.id, key)
+
+        if stored is not None and stored.fingerprint != fingerprint:
+            return Response('{} {} was already used for a different request'.format(
+                HEADER, key), 422)
+        if stored is not None and stored.body is None:
+            reserved = take_over_key(session, stored)
+            if reserved is not None:
+                return run_reserved(f, reserved, args, kwargs)
+        if stored is None or stored.body is None:
+            return Response('A request with {} {} is still in progress'.format(HEADER, key), 409)
+        response = Response(stored.body, status=stored.status_code, mimetype=stored.mimetype)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    return decorated
+
+
+def run_reserved(f, reserved: IdempotencyKey, args: tuple, kwargs: dict) -> Response:
+    session = kwargs['session']
+    try:
+        response = f(*args, **kwargs)
+        if 200 <= response.status_code < 300:
+            reserved.status_code = response.status_code
+            reserved.mimetype = response.mimetype
+            reserved.body = response.get_data()
+            session.commit()
+            return response
+    except Exception:
+        release_key(session, reserved)
+        raise
+    release_key(session, reserved)
+    return response
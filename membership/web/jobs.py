@@ -0,0 +1,26 @@
+from flask import Blueprint, jsonify, request
+from membership.database.base import Session
+from membership.database.models import Job, Member
+from membership.web.auth import requires_auth
+from membership.web.util import BadRequest
+
+job_api = Blueprint('job_api', __name__)
+
+
+@job_api.route('/job', methods=['GET'])
+# polled right after the job is enqueued, so a lagging replica could report it missing
+@requires_auth(admin=True, replica=False)
+def get_job(requester: Member, session: Session):
+    job = session.query(Job).get(request.args['id'])
+    if not job:
+        return BadRequest('Invalid job id')
+    return jsonify({'id': job.id,
+                    'kind': job.kind,
+                    'status': job.status,
+                    'attempts': job.attempts,
+                    'max_attempts': job.max_attempts,
+                    'last_error': job.last_error,
+                    'result': job.result,
+                    'run_after': job.run_after.isoformat() if job.run_after else None,
+                    'created_at': job.created_at.isoformat() if job.created_at else None,
+                    'updated_at': job.updated_at.isoformat() if job.updated_at else None})
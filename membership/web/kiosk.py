@@ -0,0 +1,174 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from flask import Blueprint, jsonify, request
+from membership.database.base import Session
+from membership.database.models import Attendee, Meeting, Member
+from membership.database.util import insert_ignore
+from membership.util.attendance import period_for, record_attendance
+from membership.web.auth import requires_auth
+from membership.web.members import MeetingInfo, check_in, meeting_cache
+from membership.web.util import BadRequest
+from sqlalchemy import func, or_
+
+kiosk_api = Blueprint('kiosk_api', __name__)
+
+# most check-ins a kiosk may upload at once
+MAX_BATCH_SIZE = 5000
+
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """ Reads a UTC timestamp given as an ISO 8601 string or as seconds since the epoch. """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    value = value.rstrip('Z')
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Invalid timestamp {}'.format(value))
+
+
+@kiosk_api.route('/meeting/attend/batch', methods=['POST'])
+@requires_auth(admin=True)
+def sync_check_ins(requester: Member, session: Session):
+    """ Records check-ins a kiosk collected while offline. Each record names a meeting by
+    `meeting_short_id`, a member by `email` or `member_id`, and when they checked in as
+    `timestamp`. Everything is resolved and inserted in one transaction with a handful of queries,
+    and the response has an outcome for every record, in order. """
+    records = request.json.get('check_ins') if isinstance(request.json, dict) else None
+    if not isinstance(records, list):
+        return BadRequest('Expected a list of check_ins')
+    if len(records) > MAX_BATCH_SIZE:
+        return BadRequest('At most {} check-ins can be synced at once'.format(MAX_BATCH_SIZE))
+
+    results: List[dict] = [{'index': i} for i in range(len(records))]
+    parsed = []
+    for i, record in enumerate(records):
+        try:
+            short_id = int(record['meeting_short_id'])
+            email = record.get('email')
+            member_id = int(record['member_id']) if record.get('member_id') is not None else None
+            if not email and member_id is None:
+                raise ValueError('email or member_id is required')
+            timestamp = parse_timestamp(record.get('timestamp'))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            results[i].update({'status': 'invalid', 'err': str(e)})
+            continue
+        parsed.append((i, short_id, email.lower() if email else None, member_id, timestamp))
+
+    meetings = resolve_meetings(session, {short_id for _, short_id, _, _, _ in parsed})
+    members_by_email, member_ids = resolve_members(
+        session, {email for _, _, email, _, _ in parsed if email},
+        {member_id for _, _, email, member_id, _ in parsed if not email})
+
+    to_insert: Dict[Tuple[int, int], int] = {}
+    for i, short_id, email, member_id, timestamp in parsed:
+        meeting = meetings.get(short_id)
+        member_id = members_by_email.get(email) if email else \
+            (member_id if member_id in member_ids else None)
+        if meeting is None:
+            results[i]['status'] = 'unknown_meeting'
+        elif member_id is None:
+            results[i]['status'] = 'unknown_member'
+        elif timestamp is not None and not meeting.is_open(timestamp):
+            results[i]['status'] = 'outside_meeting_window'
+        elif (meeting.id, member_id) in to_insert:
+            results[i].update({'status': 'duplicate', 'member_id': member_id})
+        else:
+            results[i]['member_id'] = member_id
+            to_insert[(meeting.id, member_id)] = i
+
+    already = existing_check_ins(session, to_insert.keys())
+    for pair in already:
+        results[to_insert.pop(pair)]['status'] = 'duplicate'
+    inserted = insert_check_ins(session, {meeting.id: meeting for meeting in meetings.values()},
+                                to_insert)
+    for pair, i in to_insert.items():
+        results[i]['status'] = 'checked_in' if pair in inserted else 'duplicate'
+    session.commit()
+    return jsonify({'checked_in': len(inserted), 'results': results})
+
+
+def resolve_meetings(session: Session, short_ids: Set[int]) -> Dict[int, MeetingInfo]:
+    meetings = {}
+    for short_id in short_ids:
+        cached = meeting_cache.get(short_id)
+        if cached is not None:
+            meetings[short_id] = cached
+    missing = short_ids.difference(meetings)
+    if missing:
+        rows = session.query(Meeting.short_id, Meeting.id, Meeting.committee_id,
+                             Meeting.start_time, Meeting.end_time) \
+            .filter(Meeting.short_id.in_(missing))
+        for short_id, *info in rows:
+            meetings[short_id] = MeetingInfo(*info)
+            meeting_cache.set(short_id, meetings[short_id])
+    return meetings
+
+
+def resolve_members(session: Session, emails: Set[str], ids: Set[int]) \
+        -> Tuple[Dict[str, int], Set[int]]:
+    """ Looks up member ids by lowercased email, and checks which of the given ids exist, in one
+    query. """
+    if not emails and not ids:
+        return {}, set()
+    conditions = []
+    if emails:
+        conditions.append(func.lower(Member.email_address).in_(emails))
+    if ids:
+        conditions.append(Member.id.in_(ids))
+    by_email = {}
+    found = set()
+    for member_id, email in session.query(Member.id, Member.email_address).filter(or_(*conditions)):
+        if email and email.lower() in emails:
+            by_email[email.lower()] = member_id
+        if member_id in ids:
+            found.add(member_id)
+    return by_email, found
+
+
+def existing_check_ins(session: Session, pairs) -> Set[Tuple[int, int]]:
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    rows = session.query(Attendee.meeting_id, Attendee.member_id) \
+        .filter(Attendee.meeting_id.in_({meeting_id for meeting_id, _ in pairs}),
+                Attendee.member_id.in_({member_id for _, member_id in pairs}))
+    return pairs.intersection((meeting_id, member_id) for meeting_id, member_id in rows)
+
+
+def insert_check_ins(session: Session, meetings: Dict[int, MeetingInfo], pairs) \
+        -> Set[Tuple[int, int]]:
+    """ Inserts the (meeting_id, member_id) pairs and updates the attendance summaries, returning
+    the pairs that were inserted. A single multi-row insert is used unless a live check-in raced
+    the batch, in which case it is rolled back and redone a row at a time to find out which rows
+    were new. """
+    pairs = list(pairs)
+    if not pairs:
+        return set()
+    dialect = session.get_bind().dialect
+    if dialect.supports_sane_multi_rowcount:
+        inserted = insert_ignore(session, Attendee.__table__,
+                                 [{'meeting_id': meeting_id, 'member_id': member_id}
+                                  for meeting_id, member_id in pairs])
+        if inserted == len(pairs):
+            counts = defaultdict(lambda: [None, 0])
+            for meeting_id, member_id in pairs:
+                meeting = meetings[meeting_id]
+                key = (member_id, meeting.committee_id, period_for(meeting.start_time))
+                counts[key][0] = meeting
+                counts[key][1] += 1
+            for (member_id, _, _), (meeting, count) in counts.items():
+                record_attendance(session, meeting, member_id, count)
+            return set(pairs)
+        # nothing but this insert has been written in the transaction yet
+        session.rollback()
+    return {(meeting_id, member_id) for meeting_id, member_id in pairs
+            if check_in(session, meetings[meeting_id], member_id)}
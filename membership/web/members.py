@@ -1,22 +1,100 @@
-from flask import Blueprint, jsonify, request
+import json
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from config.meeting_config import CHECK_IN_GRACE_MINUTES, MEETING_CACHE_SECONDS
+from flask import Blueprint, jsonify, request, Response
 from membership.database.base import Session
-from membership.database.models import Member, Committee, Role, Meeting, Attendee
+from membership.database.models import Member, Committee, Role, Meeting, Attendee, Election, \
+    EligibleVoter, format_name
+from membership.database.util import insert_ignore, stream_rows
 from membership.web.auth import create_auth0_user, requires_auth
-from membership.web.util import BadRequest
+from membership.web.caching import bump_versions, cached_response
+from membership.web.idempotency import idempotent
+from membership.web.util import BadRequest, json_response
+from membership.util.attendance import record_attendance
+from membership.util.cache import TTLCache
 from membership.util.email import send_welcome_email
+from membership.util.jobs import enqueue, job_handler
+from membership.util.search import DEFAULT_LIMIT, MAX_LIMIT, member_index
+from sqlalchemy.orm import joinedload
 member_api = Blueprint('member_api', __name__)
 
 
+# largest page /member/list returns when paginating with `limit`
+MAX_PAGE_SIZE = 1000
+
+# members serialized per chunk written to a streamed /member/list response
+STREAM_CHUNK_SIZE = 500
+
+
 @member_api.route('/member/list', methods=['GET'])
 @requires_auth(admin=True)
 def get_members(requester: Member, session: Session):
-    results = []
-    members = session.query(Member).all()
-    for member in members:
-        results.append({'id': member.id,
-                        'name': member.name,
-                        'email': member.email_address})
-    return jsonify(results)
+    """ Lists members ordered by id. Pass `limit` (and the previous page's `next_after_id` as
+    `after_id`) to get a page at a time, or `format=ndjson` / `stream=true` to stream every
+    member after `after_id` as newline-delimited JSON or as one JSON array. """
+    try:
+        after_id = int(request.args.get('after_id', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return BadRequest('after_id and limit must be integers')
+    query = session.query(Member.id, Member.first_name, Member.last_name, Member.email_address) \
+        .filter(Member.id > after_id).order_by(Member.id)
+
+    ndjson = request.args.get('format') == 'ndjson'
+    if ndjson or request.args.get('stream') == 'true':
+        if limit is not None:
+            query = query.limit(limit)
+        rows = stream_rows(session.get_bind(), query.statement)
+        return Response(stream_member_list(rows, ndjson),
+                        mimetype='application/x-ndjson' if ndjson else 'application/json')
+
+    if limit is None:
+        return json_response([member_summary(row) for row in query])
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    results = [member_summary(row) for row in query.limit(limit)]
+    next_after_id = results[-1]['id'] if len(results) == limit else None
+    return json_response({'members': results, 'next_after_id': next_after_id})
+
+
+def member_summary(row) -> dict:
+    return {'id': row.id,
+            'name': format_name(row.first_name, row.last_name),
+            'email': row.email_address}
+
+
+def stream_member_list(rows: Iterable, ndjson: bool) -> Iterator[str]:
+    chunk = []
+    first = True
+    if not ndjson:
+        yield '['
+    for row in rows:
+        encoded = json.dumps(member_summary(row))
+        if ndjson:
+            chunk.append(encoded + '\n')
+        else:
+            chunk.append(encoded if first else ',' + encoded)
+            first = False
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk)
+    if not ndjson:
+        yield ']'
+
+
+@member_api.route('/member/search', methods=['GET'])
+@requires_auth(admin=True)
+def search_members(requester: Member, session: Session):
+    """ Finds members whose name or email contains `q`, best matches first. """
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return BadRequest('limit must be an integer')
+    member_index.refresh(session)
+    results = member_index.search(request.args.get('q', ''), limit)
+    return jsonify([{'id': m.id, 'name': m.name, 'email': m.email_address} for m in results])
 
 
 @member_api.route('/member', methods=['GET'])
@@ -35,44 +113,69 @@ def get_member_basics(member: Member):
              }
 
 
-def get_member_details_helper(member: Member):
+def get_member_details_helper(session: Session, member: Member):
+    """ Builds the member's details from two column queries, regardless of how many meetings and
+    elections they have. Expects `member.roles` and their committees to be loaded already. """
     member_dict = get_member_basics(member)
-    member_dict['meetings'] = [attendee.meeting.name for attendee in member.meetings_attended]
-    member_dict['votes'] = [{'election_id': eligible_vote.election_id,
-                             'election_name': eligible_vote.election.name,
-                             'election_status': eligible_vote.election.status,
-                             'voted': eligible_vote.voted
-                             } for eligible_vote in member.eligible_votes]
+    meetings = session.query(Meeting.name).join(Attendee, Attendee.meeting_id == Meeting.id) \
+        .filter(Attendee.member_id == member.id).order_by(Attendee.id)
+    member_dict['meetings'] = [name for name, in meetings]
+    votes = session.query(EligibleVoter.election_id, EligibleVoter.voted, Election.name,
+                          Election.status) \
+        .join(Election, EligibleVoter.election_id == Election.id) \
+        .filter(EligibleVoter.member_id == member.id).order_by(EligibleVoter.id)
+    member_dict['votes'] = [{'election_id': vote.election_id,
+                             'election_name': vote.name,
+                             'election_status': vote.status,
+                             'voted': vote.voted
+                             } for vote in votes]
     return member_dict
 
 
 @member_api.route('/member/details', methods=['GET'])
-@requires_auth(admin=False)
+# reloaded right after voting or checking in, which must show up at once
+@requires_auth(admin=False, replica=False)
 def get_member_details(requester: Member, session: Session):
-    member = get_member_details_helper(requester)
+    member = get_member_details_helper(session, requester)
     return jsonify(member)
 
 
 @member_api.route('/admin/member/details', methods=['GET'])
 @requires_auth(admin=True)
 def get_member_info(requester: Member, session: Session):
-    other_member = session.query(Member).get(request.args['member_id'])
-    return jsonify(get_member_details_helper(other_member))
+    other_member = session.query(Member) \
+        .options(joinedload(Member.roles).joinedload(Role.committee)) \
+        .filter_by(id=request.args['member_id']).one_or_none()
+    if not other_member:
+        return BadRequest('Invalid member id')
+    return jsonify(get_member_details_helper(session, other_member))
 
 
 @member_api.route('/member', methods=['POST'])
 @requires_auth(admin=True)
 def add_member(requester: Member, session: Session):
     member = Member(**request.json)
-    verify_url = create_auth0_user(member.email_address)
-    send_welcome_email(member.email_address, member.first_name, verify_url)
     session.add(member)
+    session.flush()
+    job = enqueue(session, 'provision_member', {'member_id': member.id})
     session.commit()
-    return jsonify({'status': 'success'})
+    member_index.add(member.id, member.first_name, member.last_name, member.email_address)
+    return jsonify({'status': 'success', 'member_id': member.id, 'job_id': job.id})
+
+
+@job_handler('provision_member')
+def provision_member(session: Session, payload: dict):
+    """ Creates the Auth0 account for a newly added member and sends them the welcome email. """
+    member = session.query(Member).get(payload['member_id'])
+    if not member:
+        raise LookupError('Member {} no longer exists'.format(payload['member_id']))
+    verify_url = create_auth0_user(member.email_address)
+    send_welcome_email(member.email_address, member.first_name, verify_url)
 
 
 @member_api.route('/committee/list', methods=['GET'])
 @requires_auth(admin=False)
+@cached_response(Committee)
 def get_committees(requester: Member, session: Session):
     committees = session.query(Committee).all()
     result = {c.id: c.name for c in committees}
@@ -91,33 +194,77 @@ def add_committee(requester: Member, session: Session):
         role.committee = committee
         role.member = member
         session.add(role)
+    bump_versions(session, Committee)
     session.commit()
     return jsonify({'status': 'success'})
 
 
 @member_api.route('/meeting/list', methods=['GET'])
 @requires_auth(admin=False)
+@cached_response(digested=(Meeting,))
 def get_meeting(requester: Member, session: Session):
     meetings = session.query(Meeting).all()
     result = {m.id: m.name for m in meetings}
     return jsonify(result)
 
 
+class MeetingInfo(NamedTuple):
+    id: int
+    committee_id: Optional[int]
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+
+    def is_open(self, now: datetime) -> bool:
+        """ `now` is naive UTC, like the meeting's times: see `UTCDateTime`. """
+        grace = timedelta(minutes=CHECK_IN_GRACE_MINUTES)
+        if self.start_time and now < self.start_time - grace:
+            return False
+        if self.end_time and now > self.end_time + grace:
+            return False
+        return True
+
+
+meeting_cache = TTLCache(ttl=MEETING_CACHE_SECONDS)
+
+
+def find_meeting(session: Session, short_id: int) -> Optional[MeetingInfo]:
+    """ Looks a meeting up by short id, caching it so a rush of check-ins hits the database
+    once. Unknown ids are not cached, so a meeting can be used as soon as it is created. """
+    meeting = meeting_cache.get(short_id)
+    if meeting is None:
+        row = session.query(Meeting.id, Meeting.committee_id, Meeting.start_time,
+                            Meeting.end_time).filter_by(short_id=short_id).one_or_none()
+        if row is None:
+            return None
+        meeting = MeetingInfo(*row)
+        meeting_cache.set(short_id, meeting)
+    return meeting
+
+
+def check_in(session: Session, meeting: MeetingInfo, member_id: int) -> bool:
+    """ Records that the member attended the meeting, returning False if they already had. The
+    unique (meeting_id, member_id) constraint makes this a single statement that is safe under
+    concurrent check-ins. The member must exist: see `insert_ignore`. """
+    if not insert_ignore(session, Attendee.__table__,
+                         {'meeting_id': meeting.id, 'member_id': member_id}):
+        return False
+    record_attendance(session, meeting, member_id)
+    return True
+
+
 @member_api.route('/meeting/attend', methods=['POST'])
 @requires_auth(admin=False)
+@idempotent
 def attend_meeting(requester: Member, session: Session):
     short_id = request.json['meeting_short_id']
-    meeting = session.query(Meeting).filter_by(short_id=short_id).one_or_none()
+    meeting = find_meeting(session, short_id)
     if not meeting:
         return BadRequest('Invalid meeting id')
-    if len(session.query(Attendee).filter_by(meeting_id=meeting.id,
-                                             member_id=requester.id).all()) > 0:
+    if not meeting.is_open(datetime.utcnow()):
+        return BadRequest('This meeting is not open for check-in')
+    if not check_in(session, meeting, requester.id):
         return BadRequest('You have already logged into this meeting')
-    a = Attendee()
-    a.meeting = meeting
-    a.member = requester
-    session.add(a)
-    session.commit()
+    # committed by `idempotent`, together with the stored response
     return jsonify({'status': 'success'})
 
 
@@ -147,7 +294,13 @@ def add_role(requester: Member, session: Session):
 @requires_auth(admin=True)
 def add_meeting(requester: Member, session: Session):
     member_id = request.json.get('member_id', requester.id)
-    attend = Attendee(member_id=member_id, meeting_id=request.json['meeting_id'])
-    session.add(attend)
+    meeting = session.query(Meeting).get(request.json['meeting_id'])
+    if not meeting:
+        return BadRequest('Invalid meeting id')
+    if member_id != requester.id and \
+            session.query(Member.id).filter_by(id=member_id).one_or_none() is None:
+        return BadRequest('Invalid member id')
+    if not check_in(session, meeting, member_id):
+        return BadRequest('Member has already attended this meeting')
     session.commit()
     return jsonify({'status': 'success'})
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from config.auth_config import AUTH0_PROVISION_CONCURRENCY
+from flask import Blueprint, jsonify, request
+from membership.database.base import Session
+from membership.database.models import Member
+from membership.util.email import EmailError, send_welcome_emails
+from membership.util.jobs import enqueue, job_handler
+from membership.util.search import member_index
+from membership.web.auth import create_auth0_user, requires_auth
+from membership.web.caching import bump_versions
+from membership.web.util import BadRequest
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+onboarding_api = Blueprint('onboarding_api', __name__)
+
+# number of imported records that are looked up, upserted and committed together
+IMPORT_CHUNK_SIZE = 500
+
+MEMBER_FIELDS = ('first_name', 'last_name', 'email_address', 'biography')
+
+
+@onboarding_api.route('/member/import', methods=['POST'])
+@requires_auth(admin=True)
+def import_members(requester: Member, session: Session):
+    """ Upserts members from a CSV, JSON or newline-delimited JSON body and queues the Auth0
+    accounts and welcome emails for every newly created member. """
+    content_type = request.mimetype
+    if content_type == 'text/csv':
+        records = read_csv(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    elif content_type == 'application/json':
+        if not isinstance(request.json, list):
+            return BadRequest('Expected a list of members')
+        records = iter(request.json)
+    elif content_type == 'application/x-ndjson':
+        records = read_ndjson(io.TextIOWrapper(request.stream, encoding='utf-8'))
+    else:
+        return BadRequest('Unsupported content type {}'.format(content_type))
+
+    report, created_ids = upsert_members(session, records)
+    if created_ids and request.args.get('provision', 'true') != 'false':
+        # the batch runs once; onboard_members retries its failures as provision_member jobs
+        job = enqueue(session, 'onboard_members', {'member_ids': created_ids}, max_attempts=1)
+        session.commit()
+        report['job_id'] = job.id
+    return jsonify(report)
+
+
+def read_csv(stream: io.TextIOBase) -> Iterator[dict]:
+    for row in csv.DictReader(stream):
+        if 'email' in row and 'email_address' not in row:
+            row['email_address'] = row.pop('email')
+        yield row
+
+
+def read_ndjson(stream: io.TextIOBase) -> Iterator[dict]:
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def chunked(records: Iterable[dict], size: int) -> Iterator[List[Tuple[int, dict]]]:
+    chunk = []
+    for row_number, record in enumerate(records, start=1):
+        chunk.append((row_number, record))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def upsert_members(session: Session, records: Iterable[dict],
+                   chunk_size: int=IMPORT_CHUNK_SIZE) -> Tuple[dict, List[int]]:
+    """ Creates or updates a member for every record, keyed on email address, committing once per
+    chunk. Returns the import report along with the ids of the members that were created. """
+    report = {'received': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': []}
+    created_ids = []
+    seen = set()
+    for chunk in chunked(records, chunk_size):
+        report['received'] += len(chunk)
+        valid = {}
+        for row_number, record in chunk:
+            fields = {f: (record.get(f) or '').strip() or None for f in MEMBER_FIELDS}
+            email = fields['email_address']
+            if not email:
+                report['errors'].append({'row': row_number, 'err': 'Missing email address'})
+            elif email.lower() in seen:
+                report['errors'].append({'row': row_number, 'err': 'Duplicate email address'})
+            else:
+                seen.add(email.lower())
+                valid[email.lower()] = fields
+
+        existing = session.query(Member) \
+            .filter(func.lower(Member.email_address).in_(list(valid))).all()
+        updated = []
+        for member in existing:
+            fields = valid.pop(member.email_address.lower(), None)
+            if fields is None:
+                continue
+            changes = {k: v for k, v in fields.items()
+                       if v is not None and getattr(member, k) != v}
+            if changes:
+                for k, v in changes.items():
+                    setattr(member, k, v)
+                updated.append(member)
+                report['updated'] += 1
+            else:
+                report['unchanged'] += 1
+
+        new_members = [Member(**fields) for fields in valid.values()]
+        session.add_all(new_members)
+        if updated:
+            # candidate names are served from the cached ballot definitions
+            bump_versions(session, Member)
+        session.commit()
+        for member in updated + new_members:
+            member_index.add(member.id, member.first_name, member.last_name, member.email_address)
+        created_ids.extend(member.id for member in new_members)
+        report['created'] += len(new_members)
+    return report, created_ids
+
+
+@job_handler('onboard_members')
+def onboard_members(session: Session, payload: dict):
+    """ Creates Auth0 accounts for a batch of imported members with bounded concurrency, then
+    sends all of their welcome emails as Mailgun batch sends. Every member whose account or email
+    failed gets a `provision_member` job of their own (see `members.provision_member`), which is
+    retried with backoff, so one failure doesn't send the whole batch through Auth0 again. """
+    members = session.query(Member.id, Member.email_address, Member.first_name) \
+        .filter(Member.id.in_(payload['member_ids'])).all()
+
+    def provision(member):
+        try:
+            return member, create_auth0_user(member.email_address), None
+        except Exception as e:
+            logger.exception('Failed to provision %s', member.email_address)
+            return member, None, str(e)
+
+    recipients: Dict[str, Tuple[str, str]] = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=AUTH0_PROVISION_CONCURRENCY) as executor:
+        for member, verify_url, err in executor.map(provision, members):
+            if err:
+                failures.append({'email': member.email_address, 'err': err})
+            else:
+                recipients[member.email_address] = (member.first_name, verify_url)
+    unsent = []
+    try:
+        send_welcome_emails(recipients)
+    except EmailError as e:
+        unsent = e.failed_recipients
+    retried = [member.id for member in members
+               if member.email_address not in recipients or member.email_address in unsent]
+    retry_jobs = [enqueue(session, 'provision_member', {'member_id': member_id})
+                  for member_id in retried]
+    session.flush()
+    return {'provisioned': len(recipients), 'emails_sent': len(recipients) - len(unsent),
+            'failed': failures, 'unsent_emails': unsent,
+            'retry_job_ids': [job.id for job in retry_jobs]}
@@ -1,14 +1,29 @@
 import datetime
 from enum import Enum
+import gzip
 import json
 
+from config.response_config import BROTLI_QUALITY, COMPRESSION_MIN_SIZE, GZIP_LEVEL, \
+    JSON_BACKEND
 from decimal import Decimal
-from flask import Response
+from flask import request, Response
 import logging
 
 from flask.json import JSONEncoder
+from functools import lru_cache
+from sqlalchemy import inspect
 from sqlalchemy.ext.declarative import DeclarativeMeta
-from typing import List
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 logger = logging.getLogger(__name__)
 
@@ -20,36 +35,66 @@ class BadRequest(Response):
             json.dumps(payload), status=400, mimetype='application/json')
 
 
+class SerializationPlan(NamedTuple):
+    columns: Tuple[str, ...]
+    properties: Tuple[str, ...]
+    relationships: Dict[str, bool]
+
+
+@lru_cache(maxsize=None)
+def serialization_plan(cls: type) -> SerializationPlan:
+    """ Inspects a model's mapper once: the column attributes to copy, the read-only properties
+    (such as `Member.name`) to evaluate, and whether each relationship holds a list. """
+    mapper = inspect(cls)
+    properties = tuple(sorted({name for klass in cls.__mro__ for name, value in vars(klass).items()
+                               if isinstance(value, property) and not name.startswith('_')}))
+    return SerializationPlan(columns=tuple(attr.key for attr in mapper.column_attrs),
+                             properties=properties,
+                             relationships={rel.key: rel.uselist for rel in mapper.relationships})
+
+
+def serialize_model(obj, fields_to_expand: Iterable[str]=(), _visited: Optional[Set[int]]=None) \
+        -> dict:
+    """ Converts a model instance to a dict of its columns and properties. Relationships are
+    only followed, and so only loaded, when their name is in `fields_to_expand`; an object that
+    was already serialized further up is replaced by None to break cycles. """
+    visited = set() if _visited is None else _visited
+    visited.add(id(obj))
+    plan = serialization_plan(type(obj))
+    fields = {}
+    for field in plan.columns + plan.properties:
+        val = getattr(obj, field)
+        fields[field] = val.name if isinstance(val, Enum) else val
+    for field, uselist in plan.relationships.items():
+        if field not in fields_to_expand:
+            continue
+        val = getattr(obj, field)
+        if uselist:
+            fields[field] = [None if id(o) in visited else
+                             serialize_model(o, fields_to_expand, visited) for o in val]
+        elif val is not None:
+            fields[field] = None if id(val) in visited else \
+                serialize_model(val, fields_to_expand, visited)
+        else:
+            fields[field] = None
+    return fields
+
+
 def new_alchemy_encoder(fields_to_expand: List[str]=[]):
-    _visited_objs = []  # type: List[DeclarativeMeta]
+    expand = frozenset(fields_to_expand)
 
     class AlchemyEncoder(json.JSONEncoder):
+        def __init__(self, *args, **kwargs):
+            super(AlchemyEncoder, self).__init__(*args, **kwargs)
+            self.visited = set()  # type: Set[int]
+
         def default(self, obj):
             if isinstance(obj.__class__, DeclarativeMeta):
-                if obj in _visited_objs:
+                if id(obj) in self.visited:
                     return None
-                _visited_objs.append(obj)
-
-                # go through each field in this SQLalchemy class
-                fields = {}
-                for field in [x for x in dir(obj) if not x.startswith('_') and x != 'metadata']:
-                    val = obj.__getattribute__(field)
-                    if callable(val):
-                        continue
-                    if isinstance(val, Enum):
-                        val = val.name
-                    # is this field another SQLalchemy object, or a list of SQLalchemy objects?
-                    elif isinstance(val.__class__, DeclarativeMeta) \
-                            or (isinstance(val, list) and len(val) > 0  # NOQA
-                                and isinstance(val[0].__class__, DeclarativeMeta)):  # NOQA
-                        if field not in fields_to_expand:
-                            # not expanding this field: set it to None and continue
-                            continue
-
-                    fields[field] = val
-                # a json-encodable dict
-                return fields
-
+                return serialize_model(obj, expand, self.visited)
+            if isinstance(obj, datetime.date):
+                return obj.isoformat()
             return json.JSONEncoder.default(self, obj)
 
     return AlchemyEncoder
@@ -62,8 +107,6 @@ class CustomEncoder(JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
             return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
         if isinstance(obj, datetime.date):
             return obj.isoformat()
         return JSONEncoder.default(self, obj)
@@ -73,3 +116,57 @@ def custom_jsonify(data, encoder, status=200) -> Response:
     return Response(
         status=status, response=json.dumps(
             data, cls=encoder), content_type='application/json')
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def dumps_orjson(data) -> bytes:
+    return orjson.dumps(data, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_json(data) -> bytes:
+    return json.dumps(data, cls=CustomEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def json_backend(name: str=JSON_BACKEND):
+    """ The function used to encode JSON responses. Both backends encode Decimals as strings and
+    dates as ISO 8601 strings like `CustomEncoder`. """
+    if name == 'json' or (name == 'auto' and orjson is None):
+        return dumps_json
+    if orjson is None:
+        raise ImportError('JSON_BACKEND is orjson but orjson is not installed')
+    return dumps_orjson
+
+
+dumps = json_backend()
+
+
+def compress_response(response: Response, min_size: int=COMPRESSION_MIN_SIZE) -> Response:
+    """ Compresses the body of a buffered response with brotli (when installed) or gzip, if the
+    client accepts it and the body is at least `min_size` bytes. """
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200 \
+            or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def json_response(data, status: int=200) -> Response:
+    """ Encodes `data` with the configured JSON backend and compresses it for clients that
+    accept it. Use it in place of `jsonify` for endpoints with large payloads. """
+    response = Response(dumps(data), status=status, mimetype='application/json')
+    return compress_response(response)
@@ -1,8 +1,12 @@
-from membership.database import base
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import os
+
+# configure the app for tests before anything reads its config
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('USE_AUTH', 'FALSE')
+os.environ.setdefault('USE_EMAIL', 'FALSE')
+
+from membership.database import base  # NOQA
 
 
 def pytest_configure(config):
-    base.engine = create_engine('sqlite://', pool_size=10, pool_recycle=3600)
-    base.Session = sessionmaker(bind=base.engine)
\ No newline at end of file
+    base.configure_engine({'name_or_url': 'sqlite://', 'pool_size': 10, 'pool_recycle': 3600})
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Candidate, Election, ElectionArchive, EligibleVoter, \
+    Member, Ranking, Role, Vote, pack_ranking
+from membership.util.archive import ArchiveError, Snapshot, pack_snapshot, read_archive, \
+    unpack_snapshot
+from membership.web.base_app import create_app
+from membership.web.elections import archive_election
+
+app = create_app()
+
+
+class TestArchive:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add_all([admin, Role(member=admin, role='admin')])
+        members = [Member(first_name='Member', last_name=str(i)) for i in range(4)]
+        election = Election(name='Chair', number_winners=1, status='final')
+        candidates = [Candidate(member=member, election=election) for member in members[:3]]
+        session.add_all(candidates)
+        session.add_all(EligibleVoter(member=member, election=election, voted=i % 2 == 0)
+                        for i, member in enumerate(members))
+        session.flush()
+        ids = [candidate.id for candidate in candidates]
+        for key in range(1, 10):
+            ranked = ids if key < 6 else ids[1:] + ids[:1]
+            vote = Vote(vote_key=key, election=election)
+            if key % 2:
+                vote.packed_ranking = pack_ranking(ranked)
+            else:
+                for rank, candidate_id in enumerate(ranked):
+                    vote.ranking.append(Ranking(rank=rank, candidate_id=candidate_id))
+            session.add(vote)
+        # claimed but never filled in
+        session.add(Vote(vote_key=10, election=election))
+        session.commit()
+        cls.ids = ids
+        cls.member_ids = [member.id for member in members]
+        session.close()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def get(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_archive_election(self):
+        count = self.get('/election/count?id=1')
+        vote = self.get('/election/1/vote/4')
+        blank = self.get('/election/1/vote/10')
+        eligible = self.get('/election/eligible/list?election_id=1')
+        voter_id = self.member_ids[0]
+        details = self.get('/admin/member/details?member_id={}'.format(voter_id))
+        assert [vote['election_id'] for vote in details['votes']] == [1]
+
+        session = Session()
+        election = session.query(Election).get(1)
+        archive = archive_election(session, election)
+        session.commit()
+        assert (archive.ballot_count, archive.voter_count) == (10, 4)
+        assert session.query(Vote).count() == 0
+        assert session.query(Ranking).count() == 0
+        # the voter roll stays
+        assert session.query(EligibleVoter).count() == 4
+        assert archive_election(session, election) is archive
+        session.close()
+
+        assert self.get('/election/count?id=1') == count
+        assert self.get('/election/1/vote/4') == vote
+        assert count['winners'] == ['Member 0']
+        assert vote['rankings'] == self.ids
+        assert self.get('/election/1/vote/10') == blank
+        assert self.client.get('/election/1/vote/11').status_code == 404
+        assert self.get('/election/eligible/list?election_id=1') == eligible
+        assert self.get('/admin/member/details?member_id={}'.format(voter_id)) == details
+        added = self.client.post('/election/voter', data=json.dumps(
+            {'election_id': 1, 'member_id': voter_id}), content_type='application/json')
+        assert added.status_code == 400
+
+    def test_only_final_elections(self):
+        session = Session()
+        election = Election(name='Open', status='polls open')
+        session.add(election)
+        session.flush()
+        with pytest.raises(ValueError):
+            archive_election(session, election)
+        session.rollback()
+        session.close()
+
+    def test_checksum(self):
+        session = Session()
+        archive = session.query(ElectionArchive).get(1)
+        snapshot = read_archive(archive)
+        archive.snapshot = pack_snapshot(Snapshot(snapshot.ballots[1:], snapshot.voters))
+        with pytest.raises(ArchiveError):
+            read_archive(archive)
+        session.rollback()
+        session.close()
+
+    def test_snapshot_round_trip(self):
+        snapshot = Snapshot([(123456, [3, 1, 2]), (7, []), (2 ** 32 - 1, [5])],
+                            [(1, True), (2, False)])
+        assert unpack_snapshot(pack_snapshot(snapshot)) == snapshot
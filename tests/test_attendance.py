@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Attendee, AttendanceSummary, Committee, Meeting, Member
+from membership.util.attendance import attendance_query, rebuild_attendance_summary, \
+    record_attendance
+
+
+class TestAttendance:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def summary(self, session):
+        return sorted(((s.member_id, s.committee_id, s.period, s.count)
+                       for s in session.query(AttendanceSummary)), key=str)
+
+    def test_incremental_summary_matches_rebuild(self):
+        session = Session()
+        member = Member(first_name='Rosa')
+        committee = Committee(name='Housing')
+        session.add_all([member, committee])
+        session.flush()
+        meetings = [
+            Meeting(short_id=1, name='Jan', committee_id=committee.id,
+                    start_time=datetime(2017, 1, 5)),
+            Meeting(short_id=2, name='Jan again', committee_id=committee.id,
+                    start_time=datetime(2017, 1, 20)),
+            Meeting(short_id=3, name='General', start_time=datetime(2017, 2, 1)),
+            Meeting(short_id=4, name='Undated'),
+        ]
+        session.add_all(meetings)
+        session.flush()
+        for meeting in meetings:
+            session.add(Attendee(member_id=member.id, meeting_id=meeting.id))
+            record_attendance(session, meeting, member.id)
+        session.commit()
+
+        incremental = self.summary(session)
+        assert incremental == sorted([(member.id, committee.id, '2017-01', 2),
+                                      (member.id, None, '2017-02', 1),
+                                      (member.id, None, None, 1)], key=str)
+        assert rebuild_attendance_summary(session) == 3
+        assert self.summary(session) == incremental
+
+        totals = attendance_query(session, AttendanceSummary.committee_id, member_id=member.id,
+                                  since='2017-01', until='2017-01').all()
+        assert [(row.committee_id, row.count) for row in totals] == [(committee.id, 2)]
+        general = attendance_query(session, committee_id=0).one()
+        assert general.count == 2
+        session.close()
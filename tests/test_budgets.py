@@ -0,0 +1,198 @@
+"""Query-count and latency budgets for every route.
+
+Seeds a few hundred members with meetings, attendance and elections, then calls each route once
+through the test client and compares the SQL statements it ran and the time it took with
+tests/budgets.json. A route over its query budget fails, so an N+1 query shows up in review. Timings
+depend on the machine, so a route over its latency budget is only reported as a warning. Run
+`make budgets` to print the current numbers as well.
+"""
+import json
+import os
+import time
+import warnings
+from datetime import datetime, timedelta
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Attendee, Candidate, Committee, Election, \
+    EligibleVoter, Job, Meeting, Member, Ranking, Role, Vote
+from membership.util.attendance import rebuild_attendance_summary
+from membership.util.metrics import track_queries
+from membership.util.search import member_index
+from membership.web.base_app import create_app
+from membership.web.caching import response_cache
+from membership.web.members import meeting_cache
+
+app = create_app()
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'budgets.json')
+REPORT = os.environ.get('BUDGET_REPORT', '').lower() in ('1', 'true')
+
+MEMBERS = 300
+COMMITTEES = 5
+MEETINGS = 40
+ATTENDEES_PER_MEETING = 30
+CANDIDATES = 6
+BALLOTS = 200
+OPEN_MEETING = 1000
+PAPER_BALLOT = 55555
+
+# (method, rule, url, json body), called in this order; writes come after the reads so every
+# read sees the seeded data
+ROUTES = [
+    ('GET', '/health', '/health', None),
+    ('GET', '/metrics', '/metrics', None),
+    ('GET', '/member', '/member', None),
+    ('GET', '/member/list', '/member/list', None),
+    ('GET', '/member/search', '/member/search?q=member 12', None),
+    ('GET', '/member/details', '/member/details', None),
+    ('GET', '/admin/member/details', '/admin/member/details?member_id=2', None),
+    ('GET', '/member/attendance', '/member/attendance', None),
+    ('GET', '/attendance/summary', '/attendance/summary?committee_id=1', None),
+    ('GET', '/attendance/committee', '/attendance/committee?committee_id=1', None),
+    ('GET', '/committee/list', '/committee/list', None),
+    ('GET', '/meeting/list', '/meeting/list', None),
+    ('GET', '/election/list', '/election/list', None),
+    ('GET', '/election', '/election?id=1', None),
+    ('GET', '/election/eligible/list', '/election/eligible/list?election_id=1', None),
+    ('GET', '/election/<int:election_id>/vote/<int:ballot_key>', '/election/1/vote/100000', None),
+    ('GET', '/election/count', '/election/count?id=1', None),
+    ('GET', '/export/members.csv', '/export/members.csv', None),
+    ('GET', '/export/attendance.csv', '/export/attendance.csv', None),
+    ('GET', '/export/voters.csv', '/export/voters.csv?election_id=1', None),
+    ('GET', '/job', '/job?id=1', None),
+    ('POST', '/committee', '/committee', {'name': 'Tenants', 'admin_list': NO_AUTH_EMAIL}),
+    ('POST', '/election', '/election',
+     {'name': 'Treasurer', 'candidate_list': 'member2@example.com,member3@example.com'}),
+    ('POST', '/member', '/member',
+     {'first_name': 'New', 'last_name': 'Member', 'email_address': 'new@example.com'}),
+    ('POST', '/member/import', '/member/import?provision=false',
+     [{'first_name': 'Imported', 'last_name': str(i),
+       'email_address': 'imported{}@example.com'.format(i)} for i in range(50)]),
+    ('POST', '/member/role', '/member/role',
+     {'member_id': 3, 'committee_id': '1', 'role': 'member'}),
+    ('POST', '/admin', '/admin', {'email_address': 'member3@example.com', 'committee': '1'}),
+    ('POST', '/member/attendee', '/member/attendee', {'member_id': 2, 'meeting_id': MEETINGS}),
+    ('POST', '/meeting/attend', '/meeting/attend', {'meeting_short_id': OPEN_MEETING}),
+    ('POST', '/meeting/attend/batch', '/meeting/attend/batch',
+     {'check_ins': [{'meeting_short_id': OPEN_MEETING, 'member_id': i}
+                    for i in range(2, 52)]}),
+    ('POST', '/election/status', '/election/status', {'election_id': 2, 'status': 'polls open'}),
+    ('POST', '/election/voter', '/election/voter', {'election_id': 2, 'member_id': 2}),
+    ('POST', '/ballot/issue', '/ballot/issue', {'election_id': 2, 'member_id': 3}),
+    ('POST', '/ballot/claim', '/ballot/claim', {'election_id': 2, 'number_ballots': 5}),
+    ('POST', '/vote/paper', '/vote/paper',
+     {'election_id': 2, 'ballot_key': PAPER_BALLOT, 'rankings': [7, 8, 9]}),
+    ('POST', '/vote', '/vote', {'election_id': 2, 'rankings': [9, 8, 7]}),
+]
+
+
+def seed(session: Session) -> None:
+    admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+    session.add_all([admin, Role(member=admin, role='admin')])
+    members = [Member(first_name='Member', last_name=str(i),
+                      email_address='member{}@example.com'.format(i))
+               for i in range(2, MEMBERS + 1)]
+    session.add_all(members)
+    committees = [Committee(name='Committee {}'.format(i)) for i in range(COMMITTEES)]
+    session.add_all(committees)
+    session.flush()
+    members.insert(0, admin)
+    for committee in committees:
+        session.add(Role(member=admin, committee_id=committee.id, role='member'))
+
+    start = datetime(2017, 1, 1, 18)
+    for i in range(MEETINGS):
+        meeting = Meeting(short_id=i, name='Meeting {}'.format(i),
+                          committee_id=committees[i % COMMITTEES].id if i % 2 else None,
+                          start_time=start + timedelta(weeks=i),
+                          end_time=start + timedelta(weeks=i, hours=2))
+        session.add(meeting)
+        if i < MEETINGS - 1:
+            first = (i * 7) % (MEMBERS - ATTENDEES_PER_MEETING)
+            session.add_all(Attendee(member=member, meeting=meeting)
+                            for member in members[first:first + ATTENDEES_PER_MEETING])
+    now = datetime.utcnow()
+    session.add(Meeting(short_id=OPEN_MEETING, name='Open meeting', start_time=now,
+                        end_time=now + timedelta(hours=2)))
+
+    for number, status in ((1, 'polls closed'), (2, 'polls open')):
+        election = Election(name='Election {}'.format(number), number_winners=2, status=status)
+        candidates = [Candidate(member=member, election=election)
+                      for member in members[number * 10:number * 10 + CANDIDATES]]
+        session.add_all(candidates)
+        session.add_all(EligibleVoter(member=member, election=election, voted=number == 1)
+                        for member in members)
+        session.flush()
+        if number == 1:
+            for ballot in range(BALLOTS):
+                vote = Vote(vote_key=100000 + ballot, election=election)
+                offset = ballot % CANDIDATES
+                for rank, candidate in enumerate(candidates[offset:] + candidates[:offset]):
+                    vote.ranking.append(Ranking(rank=rank, candidate_id=candidate.id))
+                session.add(vote)
+        else:
+            session.add(Vote(vote_key=PAPER_BALLOT, election=election))
+    session.add(Job(kind='provision_member', payload={'member_id': 2}, status='succeeded'))
+    session.commit()
+    rebuild_attendance_summary(session)
+
+
+class TestBudgets:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        seed(session)
+        session.close()
+        for cache in (response_cache, meeting_cache, member_index):
+            cache.clear()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def test_every_route_is_budgeted(self):
+        rules = {(method, rule.rule) for rule in app.url_map.iter_rules()
+                 if rule.endpoint != 'static'
+                 for method in rule.methods - {'HEAD', 'OPTIONS'}}
+        assert rules == {(method, rule) for method, rule, _, _ in ROUTES}
+
+    def test_budgets(self, capsys):
+        with open(BUDGETS_PATH) as f:
+            budgets = json.load(f)
+        measured = {}
+        for method, rule, url, body in ROUTES:
+            kwargs = {'data': json.dumps(body), 'content_type': 'application/json'} \
+                if body is not None else {}
+            start = time.perf_counter()
+            with track_queries() as queries:
+                response = self.client.open(url, method=method, **kwargs)
+                # streamed responses run their queries while the body is read
+                response.get_data()
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, '{} {}: {}'.format(method, url, response.data)
+            measured['{} {}'.format(method, rule)] = {'queries': queries.count,
+                                                      'ms': round(elapsed * 1000, 1)}
+
+        if REPORT:
+            with capsys.disabled():
+                print('\n{:<60} {:>14} {:>18}'.format('route', 'queries/budget', 'ms/budget'))
+                for route, numbers in measured.items():
+                    budget = budgets.get(route, {})
+                    print('{:<60} {:>6} / {:<6} {:>8} / {:<8}'.format(
+                        route, numbers['queries'], budget.get('queries', '-'), numbers['ms'],
+                        budget.get('ms', '-')))
+
+        # timings depend on the machine, so a slow route is only reported
+        slow = ['{}: {} ms (budget {} ms)'.format(route, numbers['ms'], budgets[route]['ms'])
+                for route, numbers in measured.items()
+                if route in budgets and numbers['ms'] > budgets[route]['ms']]
+        if slow:
+            warnings.warn('Routes over their latency budget:\n' + '\n'.join(slow))
+        over = ['{}: {} queries (budget {})'.format(route, numbers['queries'],
+                                                    budgets.get(route, {}).get('queries'))
+                for route, numbers in measured.items()
+                if route not in budgets or numbers['queries'] > budgets[route]['queries']]
+        assert not over, 'Routes over their query budget:\n' + '\n'.join(over)
@@ -0,0 +1,169 @@
+import json
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Committee, Election, Meeting, Member, Role, \
+    TableVersion
+from membership.util.metrics import track_queries
+from membership.web.base_app import create_app
+from membership.web.caching import bump_versions, response_cache
+
+app = create_app()
+
+
+class TestCaching:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add_all([admin, Role(member=admin, role='admin'),
+                         Member(first_name='Rosa', last_name='L', email_address='rosa@example.com'),
+                         Committee(name='Housing')])
+        session.commit()
+        session.close()
+        response_cache.clear()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def post(self, url, payload):
+        response = self.client.post(url, data=json.dumps(payload),
+                                    content_type='application/json')
+        assert response.status_code == 200
+
+    def test_committee_list_conditional_get(self):
+        first = self.client.get('/committee/list')
+        assert json.loads(first.data.decode('utf-8')) == {'1': 'Housing'}
+        etag = first.headers['ETag']
+
+        with track_queries() as queries:
+            again = self.client.get('/committee/list')
+        assert again.data == first.data
+        # the requester and the table versions, but not the committees themselves
+        assert queries.count == 2
+
+        not_modified = self.client.get('/committee/list', headers={'If-None-Match': etag})
+        assert not_modified.status_code == 304
+        assert not_modified.data == b''
+
+        self.post('/committee', {'name': 'Labor', 'admin_list': NO_AUTH_EMAIL})
+        changed = self.client.get('/committee/list', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert json.loads(changed.data.decode('utf-8')) == {'1': 'Housing', '2': 'Labor'}
+
+    def test_meeting_list_sees_meeting_changes(self):
+        # meetings are created outside the app, so nothing bumps their table's version
+        first = self.client.get('/meeting/list')
+        assert json.loads(first.data.decode('utf-8')) == {}
+        etag = first.headers['ETag']
+        assert self.client.get('/meeting/list',
+                               headers={'If-None-Match': etag}).status_code == 304
+
+        session = Session()
+        session.add(Meeting(short_id=1, name='General Meeting'))
+        session.commit()
+        session.close()
+        changed = self.client.get('/meeting/list', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert json.loads(changed.data.decode('utf-8')) == {'1': 'General Meeting'}
+
+        session = Session()
+        session.query(Meeting).filter_by(short_id=1).update({Meeting.name: 'Annual Meeting'})
+        session.commit()
+        session.close()
+        renamed = self.client.get('/meeting/list',
+                                  headers={'If-None-Match': changed.headers['ETag']})
+        assert renamed.status_code == 200
+        assert json.loads(renamed.data.decode('utf-8')) == {'1': 'Annual Meeting'}
+
+    def test_election_invalidated_by_writes(self):
+        self.post('/election', {'name': 'Chair', 'candidate_list': 'rosa@example.com'})
+        election = self.client.get('/election?id=1')
+        assert json.loads(election.data.decode('utf-8'))['candidates'] == \
+            [{'id': 1, 'name': 'Rosa L'}]
+
+        self.post('/member/import?provision=false',
+                  [{'email_address': 'rosa@example.com', 'last_name': 'Luxemburg'}])
+        renamed = self.client.get('/election?id=1',
+                                  headers={'If-None-Match': election.headers['ETag']})
+        assert renamed.status_code == 200
+        assert json.loads(renamed.data.decode('utf-8'))['candidates'][0]['name'] == \
+            'Rosa Luxemburg'
+        assert list(json.loads(self.client.get('/election/list').data.decode('utf-8')).values()) \
+            == ['Chair']
+
+    def test_ballot_definition(self):
+        self.post('/election', {'name': 'Secretary', 'candidate_list': 'rosa@example.com'})
+        election_id = max(int(i) for i in json.loads(
+            self.client.get('/election/list').data.decode('utf-8')))
+        url = '/election?id={}'.format(election_id)
+        first = self.client.get(url)
+        assert json.loads(first.data.decode('utf-8'))['status'] == 'draft'
+        assert first.headers['Cache-Control'] == 'private, max-age=60'
+
+        with track_queries() as queries:
+            again = self.client.get(url)
+            not_modified = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+        assert again.data == first.data
+        assert not_modified.status_code == 304
+        # only the requester and the table versions, once per request
+        assert queries.count == 4
+
+        self.post('/election/status', {'election_id': election_id, 'status': 'polls open'})
+        # statuses only move forward
+        assert self.client.post('/election/status', data=json.dumps(
+            {'election_id': election_id, 'status': 'draft'}),
+            content_type='application/json').status_code == 400
+        self.post('/election/status', {'election_id': election_id, 'status': 'final'})
+        final = self.client.get(url, headers={'If-None-Match': first.headers['ETag']})
+        assert final.status_code == 200
+        assert json.loads(final.data.decode('utf-8'))['status'] == 'final'
+        assert 'immutable' in final.headers['Cache-Control']
+
+        for status in ('polls closed', 'final'):
+            assert self.client.post('/election/status', data=json.dumps(
+                {'election_id': election_id, 'status': status}),
+                content_type='application/json').status_code == 400
+
+        assert self.client.get('/election?id=999').status_code == 404
+        assert self.client.post('/election/status', data=json.dumps(
+            {'election_id': election_id, 'status': 'counting'}),
+            content_type='application/json').status_code == 400
+
+    def test_ballot_sees_changes_from_other_workers(self):
+        self.post('/election', {'name': 'Treasurer', 'candidate_list': 'rosa@example.com'})
+        election_id = max(int(i) for i in json.loads(
+            self.client.get('/election/list').data.decode('utf-8')))
+        url = '/election?id={}'.format(election_id)
+        assert json.loads(self.client.get(url).data.decode('utf-8'))['status'] == 'draft'
+
+        # as another worker would: this one's cache is not evicted
+        session = Session()
+        session.query(Election).filter_by(id=election_id).update({Election.status: 'polls open'})
+        session.query(TableVersion).filter_by(table_name='elections').update(
+            {TableVersion.version: TableVersion.version + 1})
+        session.commit()
+        session.close()
+        assert json.loads(self.client.get(url).data.decode('utf-8'))['status'] == 'polls open'
+
+    def test_cache_evicted_after_commit(self):
+        response_cache.set('entry', 'cached', tags=['committees'])
+        response_cache.set('other', 'kept', tags=['meetings'])
+        generation = response_cache.generation
+        session = Session()
+        bump_versions(session, Committee)
+        # a read before the commit still sees the old data, and may cache it
+        assert response_cache.get('entry') == 'cached'
+        session.commit()
+        session.close()
+        assert response_cache.get('entry') is None
+        # only entries built from the bumped tables are dropped
+        assert response_cache.get('other') == 'kept'
+        # a value computed before the eviction is not cached
+        response_cache.set('entry', 'stale', generation=generation, tags=['committees'])
+        assert response_cache.get('entry') is None
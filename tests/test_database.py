@@ -0,0 +1,144 @@
+from membership.database import base, util
+from membership.database.util import backfill, insert_ignore
+import os
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+
+def count_pings(monkeypatch):
+    pings = []
+    real_ping = base.ping_connection
+    monkeypatch.setattr(base, 'ping_connection', lambda con: pings.append(con) or real_ping(con))
+    return pings
+
+
+def checkout(engine):
+    connection = engine.connect()
+    connection.execute('SELECT 1')
+    connection.close()
+
+
+@pytest.mark.parametrize('strategy, idle_seconds, expected_pings', [
+    ('checkout', 0, 3),
+    ('idle', 60, 0),
+    ('idle', -1, 3),
+    ('optimistic', 0, 0),
+])
+def test_liveness_strategies(monkeypatch, strategy, idle_seconds, expected_pings):
+    pings = count_pings(monkeypatch)
+    engine = base.create_engine_from_settings({'name_or_url': 'sqlite://', 'pool_size': 5},
+                                              liveness_check=strategy, idle_seconds=idle_seconds)
+    for _ in range(3):
+        checkout(engine)
+    assert len(pings) == expected_pings
+
+
+def test_unknown_liveness_strategy():
+    with pytest.raises(ValueError):
+        base.create_engine_from_settings({'name_or_url': 'sqlite://'}, liveness_check='sometimes')
+
+
+def test_engine_is_created_lazily():
+    registry = base.EngineRegistry({'name_or_url': 'mysql://nobody@localhost/none'})
+    # a driver that isn't installed is only a problem once the engine is needed
+    registry.configure({'name_or_url': 'sqlite://'})
+    session = base.RegistrySessionmaker(registry, base.EngineRegistry(None))()
+    assert session.execute('SELECT 1').scalar() == 1
+    engine = registry.engine
+    assert session.get_bind() is engine
+    session.close()
+
+    registry.dispose()
+    assert registry.engine is not engine
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_process_does_not_share_connections(tmpdir):
+    registry = base.EngineRegistry({'name_or_url': 'sqlite:///{}'.format(tmpdir.join('fork.db')),
+                                    'poolclass': QueuePool})
+    parent_engine = registry.engine
+    connection = parent_engine.connect()
+    connection.execute('CREATE TABLE workers (pid INTEGER)')
+    parent_dbapi_con = connection.connection.connection
+    connection.close()
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            child_engine = registry.engine
+            with child_engine.connect() as connection:
+                connection.execute('INSERT INTO workers VALUES (?)', os.getpid())
+                ok = child_engine is not parent_engine and \
+                    connection.connection.connection is not parent_dbapi_con
+            # the parent's pool hands out a new connection rather than the one it inherited
+            with parent_engine.connect() as connection:
+                ok = ok and connection.connection.connection is not parent_dbapi_con
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+    with registry.engine.connect() as connection:
+        assert connection.connection.connection is parent_dbapi_con
+        assert connection.execute('SELECT pid FROM workers').scalar() == pid
+
+
+def test_worker_pool_settings():
+    settings = {'name_or_url': 'mysql://', 'pool_size': 10, 'max_overflow': 10}
+    assert base.worker_pool_settings(settings, workers=4, threads=8) == \
+        {'name_or_url': 'mysql://', 'pool_size': 8, 'max_overflow': 10}
+    limited = base.worker_pool_settings(settings, workers=4, threads=8, max_connections=20)
+    assert (limited['pool_size'], limited['max_overflow']) == (5, 0)
+    limited = base.worker_pool_settings(settings, workers=4, threads=2, max_connections=20)
+    assert (limited['pool_size'], limited['max_overflow']) == (2, 3)
+
+
+def test_backfill_resumes(tmpdir):
+    engine = base.create_engine_from_settings(
+        {'name_or_url': 'sqlite:///{}'.format(tmpdir.join('backfill.db'))})
+    table = Table('numbers', MetaData(), Column('id', Integer, primary_key=True),
+                  Column('square', Integer))
+    table.create(engine)
+    engine.execute(table.insert(), [{'id': i} for i in range(1, 26)])
+    chunks = []
+
+    def square(connection, ids, fail_after=None):
+        if fail_after is not None and len(chunks) == fail_after:
+            raise RuntimeError('interrupted')
+        chunks.append(ids)
+        connection.execute(table.update().where(table.c.id.in_(ids))
+                           .values(square=table.c.id * table.c.id))
+
+    with pytest.raises(RuntimeError):
+        backfill(engine, table.c.id, lambda connection, ids: square(connection, ids, 2),
+                 where=table.c.square.is_(None), chunk_size=10, pause=0)
+    # the chunks before the failure are committed
+    assert engine.scalar(table.count().where(table.c.square.isnot(None))) == 20
+
+    assert backfill(engine, table.c.id, square, where=table.c.square.is_(None), chunk_size=10,
+                    pause=0) == 5
+    assert chunks[-1] == list(range(21, 26))
+    assert [row.square for row in engine.execute(table.select().order_by(table.c.id))] == \
+        [i * i for i in range(1, 26)]
+
+
+@pytest.mark.parametrize('ignoring', [True, False])
+def test_insert_ignore(monkeypatch, tmpdir, ignoring):
+    if not ignoring:
+        # a dialect without an ignoring INSERT
+        monkeypatch.setattr(util, 'ignoring_insert', lambda table, dialect_name: None)
+    engine = base.create_engine_from_settings(
+        {'name_or_url': 'sqlite:///{}'.format(tmpdir.join('insert.db'))})
+    table = Table('things', MetaData(), Column('id', Integer, primary_key=True))
+    table.create(engine)
+    session = sessionmaker(bind=engine)()
+    assert insert_ignore(session, table, {'id': 1}) == 1
+    assert insert_ignore(session, table, {'id': 1}) == 0
+    assert insert_ignore(session, table, [{'id': 1}, {'id': 2}, {'id': 3}]) == 2
+    session.commit()
+    assert [row.id for row in engine.execute(table.select().order_by(table.c.id))] == [1, 2, 3]
+    session.close()
+    engine.dispose()
@@ -1,26 +1,30 @@
-from membership.database.models import Candidate, Member, Election, Vote, Ranking
-from membership.database.base import engine, metadata, Base, Session
-from membership.web.elections import hold_election
+from membership.database.models import Candidate, Member, Election, Vote, Ranking, pack_ranking
+from membership.database.base import get_engine, metadata, Base, Session
+from membership.web import elections
+from membership.web.elections import draw_vote, hold_election, load_ballots
 from random import shuffle
 from hypothesis.strategies import data
-from hypothesis import given
+from hypothesis import given, settings
 import hypothesis.strategies as st
 
 
 class TestElection:
     @classmethod
     def setup_class(cls):
-        metadata.create_all(engine)
+        metadata.create_all(get_engine())
 
     @classmethod
     def teardown_class(cls):
-        metadata.drop_all(engine)
+        metadata.drop_all(get_engine())
 
+    # each example recreates the schema and inserts up to 5000 rankings, which takes longer than
+    # Hypothesis's default deadline on a slow machine
+    @settings(deadline=None)
     @given(data())
     def test_election_prob(self, data):
         # Set up the SQLAlchemy session
-        metadata.drop_all(engine)
-        metadata.create_all(engine)
+        metadata.drop_all(get_engine())
+        metadata.create_all(get_engine())
         session = Session()
 
         # Randomly generate parameters
@@ -97,3 +101,45 @@ class TestElection:
         results = hold_election(election)
         assert len(results.winners) == 2
         assert len(results.votes) == num_votes
+
+    def test_packed_and_legacy_ballots(self):
+        session = Session()
+        candidates = [Candidate(member=Member(first_name=str(i), last_name=str(i)))
+                      for i in range(3)]
+        election = Election(name='Packed', number_winners=1)
+        election.candidates.extend(candidates)
+        session.add(election)
+        session.flush()
+        ids = [c.id for c in candidates]
+
+        legacy = Vote(vote_key=1)
+        for rank, candidate_id in enumerate(reversed(ids)):
+            legacy.ranking.append(Ranking(rank=rank, candidate_id=candidate_id))
+        packed = Vote(vote_key=2, packed_ranking=pack_ranking(ids))
+        # claimed but not filled in
+        blank = Vote(vote_key=3)
+        election.votes.extend([legacy, packed, blank])
+        session.commit()
+
+        assert legacy.candidate_ids == list(reversed(ids))
+        assert packed.candidate_ids == ids
+        assert blank.candidate_ids == []
+        assert load_ballots(session, election.id) == [list(reversed(ids)), ids]
+        session.close()
+
+    def test_draw_vote_retries_taken_keys(self, monkeypatch):
+        session = Session()
+        election = Election(name='Keys', number_winners=1)
+        session.add(election)
+        session.flush()
+        session.add(Vote(vote_key=111111, election_id=election.id))
+        session.commit()
+
+        keys = iter([111111, 222222])
+        monkeypatch.setattr(elections.random, 'randint', lambda low, high: next(keys))
+        vote = draw_vote(session, election.id, 6)
+        session.commit()
+        assert vote.vote_key == 222222
+        assert sorted(v.vote_key for v in session.query(Vote).filter_by(
+            election_id=election.id)) == [111111, 222222]
+        session.close()
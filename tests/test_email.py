@@ -0,0 +1,45 @@
+from membership.util.email import EmailError, FakeTransport, Mailer, RateLimiter, load_template
+import pytest
+
+
+def recipients(n):
+    return {'{}@example.com'.format(i): {'name': str(i)} for i in range(n)}
+
+
+def test_template_is_loaded_once():
+    load_template.cache_clear()
+    assert '%recipient.name%' in load_template('welcome_email.html')
+    load_template('welcome_email.html')
+    assert load_template.cache_info().hits == 1
+
+
+def test_retryable_failures_are_retried_with_backoff():
+    sleeps = []
+    transport = FakeTransport(failures=2)
+    mailer = Mailer(transport, rate_limit=0, max_retries=3, retry_backoff=1, sleep=sleeps.append)
+    assert mailer.send('from@example.com', 'Hi', '<p>hi</p>', recipients(3)) == 1
+    assert sleeps == [1, 2]
+    assert len(transport.sent) == 1
+
+
+def test_failed_batches_are_reported():
+    transport = FakeTransport(failures=1, retryable=False)
+    mailer = Mailer(transport, rate_limit=0, batch_size=2, sleep=lambda s: None)
+    with pytest.raises(EmailError) as e:
+        mailer.send('from@example.com', 'Hi', '<p>hi</p>', recipients(3))
+    assert e.value.failed_recipients == ['0@example.com', '1@example.com']
+    assert [v for k, v in transport.sent[0] if k == 'to'] == ['2@example.com']
+
+
+def test_rate_limiter_spaces_out_calls():
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert sleeps == [0.25, 0.25]
@@ -0,0 +1,71 @@
+import csv
+import io
+from datetime import datetime
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Attendee, Committee, Election, EligibleVoter, Meeting, \
+    Member, Role
+from membership.web import exports
+from membership.web.base_app import create_app
+
+app = create_app()
+
+
+class TestExports:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add(Role(member=admin, role='admin'))
+        committee = Committee(name='Housing')
+        session.add(committee)
+        session.flush()
+        meetings = [Meeting(short_id=1, name='General', start_time=datetime(2017, 3, 1, 18)),
+                    Meeting(short_id=2, name='Housing', committee_id=committee.id)]
+        members = [Member(first_name='Member', last_name=str(i),
+                          email_address='{}@example.com'.format(i)) for i in range(5)]
+        election = Election(name='Chair')
+        session.add_all(Attendee(member=member, meeting=meeting)
+                        for meeting in meetings for member in members)
+        session.add_all(EligibleVoter(member=member, election=election, voted=i < 2)
+                        for i, member in enumerate(members))
+        session.commit()
+        session.close()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def get_csv(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert response.is_streamed
+        return list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))
+
+    def test_export_members(self, monkeypatch):
+        monkeypatch.setattr(exports, 'CSV_CHUNK_SIZE', 2)
+        rows = self.get_csv('/export/members.csv')
+        assert [row['id'] for row in rows] == ['1', '2', '3', '4', '5', '6']
+        assert rows[1] == {'id': '2', 'first_name': 'Member', 'last_name': '0',
+                           'email_address': '0@example.com'}
+
+    def test_export_attendance(self):
+        rows = self.get_csv('/export/attendance.csv')
+        assert len(rows) == 10
+        assert rows[0]['meeting_name'] == 'General'
+        assert rows[0]['start_time'].startswith('2017-03-01 18:00:00')
+        rows = self.get_csv('/export/attendance.csv?committee_id=1')
+        assert {row['meeting_name'] for row in rows} == {'Housing'}
+        assert rows[-1]['email_address'] == '4@example.com'
+
+    def test_export_voters(self):
+        rows = self.get_csv('/export/voters.csv?election_id=1')
+        assert [row['last_name'] for row in rows] == ['0', '1', '2', '3', '4']
+        assert [row['voted'] for row in rows] == ['True', 'True', 'False', 'False', 'False']
+        assert rows[0]['election_name'] == 'Chair'
+        assert self.get_csv('/export/voters.csv?election_id=2') == []
+        assert self.client.get('/export/voters.csv?election_id=x').status_code == 400
@@ -0,0 +1,142 @@
+import json
+from datetime import datetime, timedelta
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Candidate, Election, EligibleVoter, IdempotencyKey, \
+    Meeting, Member, Vote
+from membership.util.metrics import track_queries
+from membership.web.base_app import create_app
+from membership.web.idempotency import purge_expired_keys, request_fingerprint
+from membership.web.members import meeting_cache
+
+app = create_app()
+
+
+class TestIdempotency:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        member = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        election = Election(name='Chair', number_winners=1, status='polls open')
+        now = datetime.utcnow()
+        session.add_all([Candidate(member=member, election=election),
+                         EligibleVoter(member=member, election=election, voted=False),
+                         Meeting(short_id=4321, name='General Meeting',
+                                 start_time=now - timedelta(minutes=5),
+                                 end_time=now + timedelta(hours=2)),
+                         Meeting(short_id=4322, name='Committee Meeting',
+                                 start_time=now - timedelta(minutes=5),
+                                 end_time=now + timedelta(hours=2)),
+                         Meeting(short_id=8765, name='Next Meeting',
+                                 start_time=now + timedelta(days=7),
+                                 end_time=now + timedelta(days=7, hours=2))])
+        session.commit()
+        session.close()
+        meeting_cache.clear()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def post(self, url, payload, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(url, data=json.dumps(payload), content_type='application/json',
+                                headers=headers)
+
+    def test_invalid_rankings(self):
+        for rankings in ([2], [1, 1], [-1], ['1', 1], ['x'], [None], [True], '1', None):
+            assert self.post('/vote', {'election_id': 1, 'rankings': rankings},
+                             key='invalid').status_code == 400
+        # nothing was cast, so the member can still vote
+        session = Session()
+        assert session.query(Vote).count() == 0
+        assert not session.query(EligibleVoter).one().voted
+        session.close()
+
+    def test_vote_is_replayed(self):
+        # candidate ids may be sent as strings
+        vote = {'election_id': 1, 'rankings': ['1']}
+        first = self.post('/vote', vote, key='vote-1')
+        assert first.status_code == 200
+        assert 'Idempotent-Replayed' not in first.headers
+
+        with track_queries() as queries:
+            retry = self.post('/vote', vote, key='vote-1')
+        assert retry.status_code == 200
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(retry.data.decode('utf-8')) == \
+            json.loads(first.data.decode('utf-8'))
+        # the requester and the stored response
+        assert queries.count == 2
+
+        session = Session()
+        assert session.query(Vote).one().candidate_ids == [1]
+        session.close()
+        assert self.post('/vote', vote).status_code == 400
+        assert self.post('/vote', vote, key='vote-2').status_code == 400
+
+    def test_key_reused_for_another_request(self):
+        assert self.post('/vote', {'election_id': 1, 'rankings': []},
+                         key='vote-1').status_code == 422
+
+    def test_check_in(self):
+        assert self.post('/meeting/attend', {'meeting_short_id': 8765},
+                         key='attend-1').status_code == 400
+        # failures are not stored, so the key can still be used
+        session = Session()
+        assert session.query(IdempotencyKey).filter_by(key='attend-1').count() == 0
+        session.close()
+
+        attend = {'meeting_short_id': 4321}
+        assert self.post('/meeting/attend', attend, key='attend-1').status_code == 200
+        retry = self.post('/meeting/attend', attend, key='attend-1')
+        assert retry.status_code == 200
+        assert json.loads(retry.data.decode('utf-8')) == {'status': 'success'}
+        assert self.post('/meeting/attend', attend).status_code == 400
+
+    def test_in_progress(self):
+        attend = {'meeting_short_id': 4322}
+        session = Session()
+        member = session.query(Member).one()
+        # reserved by a request that has not finished yet
+        session.add(IdempotencyKey(member_id=member.id, key='attend-2', fingerprint='',
+                                   created_at=datetime.utcnow()))
+        session.commit()
+        session.close()
+        assert self.post('/meeting/attend', attend, key='attend-2').status_code == 422
+        session = Session()
+        session.query(IdempotencyKey).filter_by(key='attend-2').update(
+            {IdempotencyKey.fingerprint: self.fingerprint('/meeting/attend', attend)})
+        session.commit()
+        session.close()
+        assert self.post('/meeting/attend', attend, key='attend-2').status_code == 409
+
+        # the worker holding it was killed; once its lease is up a retry takes the key over
+        session = Session()
+        session.query(IdempotencyKey).filter_by(key='attend-2').update(
+            {IdempotencyKey.created_at: datetime.utcnow() - timedelta(minutes=5)})
+        session.commit()
+        session.close()
+        assert self.post('/meeting/attend', attend, key='attend-2').status_code == 200
+        retry = self.post('/meeting/attend', attend, key='attend-2')
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+
+    def test_purge_expired_keys(self):
+        session = Session()
+        member = session.query(Member).one()
+        old = datetime.utcnow() - timedelta(days=2)
+        session.add_all(IdempotencyKey(member_id=member.id, key='old-{}'.format(i),
+                                       fingerprint='', status_code=200, body=b'{}',
+                                       created_at=old) for i in range(3))
+        session.commit()
+        kept = session.query(IdempotencyKey).count() - 3
+        assert purge_expired_keys(session) == 3
+        assert session.query(IdempotencyKey).count() == kept
+        session.close()
+
+    def fingerprint(self, url, payload):
+        with app.test_request_context(url, method='POST', data=json.dumps(payload)):
+            return request_fingerprint()
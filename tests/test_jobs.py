@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Job
+from membership.util import jobs
+
+
+@jobs.job_handler('test_echo')
+def echo(session, payload):
+    return {'echo': payload['value']}
+
+
+@jobs.job_handler('test_fail')
+def fail(session, payload):
+    raise ValueError('upstream is down')
+
+
+class TestJobs:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def setup_method(self, method):
+        session = Session()
+        session.query(Job).delete()
+        session.commit()
+        session.close()
+
+    def test_job_runs_and_stores_result(self):
+        session = Session()
+        job = jobs.enqueue(session, 'test_echo', {'value': 42})
+        session.commit()
+        job_id = job.id
+        session.close()
+
+        assert jobs.run_pending() == 1
+
+        session = Session()
+        job = session.query(Job).get(job_id)
+        assert job.status == jobs.SUCCEEDED
+        assert job.attempts == 1
+        assert job.result == {'echo': 42}
+        session.close()
+
+    def test_failed_job_is_retried_then_failed(self):
+        session = Session()
+        job = jobs.enqueue(session, 'test_fail', {}, max_attempts=2)
+        session.commit()
+        job_id = job.id
+
+        assert jobs.run_pending() == 1
+        session.expire_all()
+        job = session.query(Job).get(job_id)
+        assert job.status == jobs.PENDING
+        assert job.last_error == 'upstream is down'
+        assert job.run_after > datetime.utcnow()
+
+        # nothing is due until the backoff has passed
+        assert jobs.run_pending() == 0
+        job.run_after = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+
+        assert jobs.run_pending() == 1
+        session.expire_all()
+        job = session.query(Job).get(job_id)
+        assert job.status == jobs.FAILED
+        assert job.attempts == 2
+        session.close()
+
+    def test_expired_lease_is_reclaimed(self):
+        session = Session()
+        job = jobs.enqueue(session, 'test_echo', {'value': 1})
+        session.commit()
+
+        claimed = jobs.claim_next(session)
+        assert claimed.id == job.id
+        assert jobs.claim_next(session) is None
+
+        claimed.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+        reclaimed = jobs.claim_next(session)
+        assert reclaimed.id == job.id
+        assert reclaimed.attempts == 2
+        session.close()
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        session = Session()
+        job = jobs.enqueue(session, 'test_echo', {'value': 1}, max_attempts=1)
+        session.commit()
+
+        claimed = jobs.claim_next(session)
+        assert claimed.id == job.id
+        claimed.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+        assert jobs.claim_next(session) is None
+        session.expire_all()
+        job = session.query(Job).get(job.id)
+        assert job.status == jobs.FAILED
+        assert job.attempts == 1
+        assert job.locked_until is None
+        session.close()
+
+    def test_kind_is_registered_once(self):
+        with pytest.raises(ValueError):
+            jobs.job_handler('test_echo')(echo)
+        assert jobs.handlers['test_echo'] is echo
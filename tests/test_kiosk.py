@@ -0,0 +1,65 @@
+import json
+from datetime import datetime
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Attendee, AttendanceSummary, Meeting, Member, Role
+from membership.util.metrics import track_queries
+from membership.web.base_app import create_app
+
+app = create_app()
+
+
+class TestKiosk:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add_all([admin, Role(member=admin, role='admin'),
+                         Member(first_name='Rosa', email_address='Rosa@Example.com'),
+                         Meeting(short_id=1234, name='General Meeting',
+                                 start_time=datetime(2017, 3, 1, 18),
+                                 end_time=datetime(2017, 3, 1, 20))])
+        session.commit()
+        session.close()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def sync(self, check_ins):
+        response = self.client.post('/meeting/attend/batch',
+                                    data=json.dumps({'check_ins': check_ins}),
+                                    content_type='application/json')
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_batch_check_in(self):
+        check_ins = [
+            {'meeting_short_id': 1234, 'email': 'ROSA@example.com',
+             'timestamp': '2017-03-01T18:05:00Z'},
+            {'meeting_short_id': 1234, 'member_id': 1, 'timestamp': '2017-03-01T18:06:00'},
+            {'meeting_short_id': 1234, 'email': 'rosa@example.com'},
+            {'meeting_short_id': 1234, 'email': 'nobody@example.com'},
+            {'meeting_short_id': 9999, 'member_id': 1},
+            {'meeting_short_id': 1234, 'member_id': 1, 'timestamp': '2017-03-02T18:00:00'},
+            {'meeting_short_id': 1234},
+        ]
+        with track_queries() as queries:
+            result = self.sync(check_ins)
+        assert [r['status'] for r in result['results']] == [
+            'checked_in', 'checked_in', 'duplicate', 'unknown_member', 'unknown_meeting',
+            'outside_meeting_window', 'invalid']
+        assert result['checked_in'] == 2
+        assert queries.count < 12
+
+        # syncing the same batch again is harmless
+        again = self.sync(check_ins[:2])
+        assert [r['status'] for r in again['results']] == ['duplicate', 'duplicate']
+
+        session = Session()
+        assert session.query(Attendee).count() == 2
+        assert sum(s.count for s in session.query(AttendanceSummary)) == 2
+        session.close()
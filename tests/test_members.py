@@ -0,0 +1,123 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Attendee, AttendanceSummary, Committee, Election, \
+    EligibleVoter, Meeting, Member, Role
+from membership.util.metrics import track_queries
+from membership.web.base_app import create_app
+
+app = create_app()
+
+
+class TestMembers:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add(admin)
+        session.add(Role(member=admin, role='admin'))
+        committee = Committee(name='Housing')
+        session.add(Role(member=admin, committee=committee, role='member'))
+        session.flush()
+        for i in range(20):
+            meeting = Meeting(short_id=i, name='Meeting {}'.format(i), committee_id=committee.id)
+            session.add(Attendee(member=admin, meeting=meeting))
+            election = Election(name='Election {}'.format(i))
+            session.add(EligibleVoter(member=admin, election=election, voted=i % 2 == 0))
+        session.add_all([Member(first_name='Member', last_name=str(i),
+                                email_address='{}@example.com'.format(i), biography='bio')
+                         for i in range(5)])
+        now = datetime.utcnow()
+        session.add(Meeting(short_id=100, name='General Meeting', start_time=now,
+                            end_time=now + timedelta(hours=2)))
+        session.add(Meeting(short_id=101, name='Next Month', start_time=now + timedelta(days=30)))
+        session.commit()
+        session.close()
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        return json.loads(response.data.decode('utf-8'))
+
+    def test_member_list(self):
+        members = self.get_json('/member/list')
+        assert [m['id'] for m in members] == [1, 2, 3, 4, 5, 6]
+        assert members[1] == {'id': 2, 'name': 'Member 0', 'email': '0@example.com'}
+
+    def test_member_list_pages(self):
+        page = self.get_json('/member/list?limit=4')
+        assert [m['id'] for m in page['members']] == [1, 2, 3, 4]
+        page = self.get_json('/member/list?limit=4&after_id={}'.format(page['next_after_id']))
+        assert [m['id'] for m in page['members']] == [5, 6]
+        assert page['next_after_id'] is None
+
+    def test_member_list_streams(self):
+        response = self.client.get('/member/list?format=ndjson&after_id=4')
+        lines = response.data.decode('utf-8').splitlines()
+        assert [json.loads(line)['id'] for line in lines] == [5, 6]
+        assert [m['id'] for m in self.get_json('/member/list?stream=true&after_id=2')] == \
+            [3, 4, 5, 6]
+
+    def test_member_details_query_count(self):
+        with track_queries() as queries:
+            details = self.get_json('/member/details')
+        assert len(details['meetings']) == 20
+        assert details['meetings'][0] == 'Meeting 0'
+        assert details['votes'][1] == {'election_id': 2, 'election_name': 'Election 1',
+                                       'election_status': 'draft', 'voted': False}
+        assert {'role': 'member', 'committee': 'Housing'} in details['roles']
+        assert queries.count == 3
+
+        with track_queries() as queries:
+            details = self.get_json('/admin/member/details?member_id=1')
+        assert len(details['votes']) == 20
+        assert queries.count == 4
+
+    def test_check_in(self):
+        def attend(short_id):
+            return self.client.post('/meeting/attend',
+                                    data=json.dumps({'meeting_short_id': short_id}),
+                                    content_type='application/json')
+
+        assert attend(100).status_code == 200
+        duplicate = attend(100)
+        assert duplicate.status_code == 400
+        assert b'already logged into' in duplicate.data
+        assert b'not open' in attend(101).data
+        assert b'Invalid meeting id' in attend(999).data
+
+        # INSERT IGNORE on MySQL would skip the foreign key violation and call it a duplicate
+        unknown = self.client.post('/member/attendee',
+                                   data=json.dumps({'meeting_id': 1, 'member_id': 999}),
+                                   content_type='application/json')
+        assert unknown.status_code == 400
+        assert b'Invalid member id' in unknown.data
+
+        session = Session()
+        meeting = session.query(Meeting).filter_by(short_id=100).one()
+        assert session.query(Attendee).filter_by(meeting_id=meeting.id).count() == 1
+        assert session.query(AttendanceSummary).filter_by(committee_id=None).one().count == 1
+        session.close()
+
+    def test_meeting_times_are_stored_in_utc(self):
+        session = Session()
+        pacific = datetime.now(timezone(timedelta(hours=-8)))
+        session.add(Meeting(short_id=102, name='Evening Meeting', start_time=pacific,
+                            end_time=pacific + timedelta(hours=2)))
+        session.commit()
+        meeting = session.query(Meeting).filter_by(short_id=102).one()
+        assert meeting.start_time.tzinfo is None
+        assert abs(meeting.start_time - datetime.utcnow()) < timedelta(minutes=1)
+        session.close()
+
+        # open now, not eight hours ago
+        assert self.client.post('/meeting/attend', data=json.dumps({'meeting_short_id': 102}),
+                                content_type='application/json').status_code == 200
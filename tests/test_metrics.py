@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Member, Role
+from membership.util.metrics import Histogram, track_queries
+from membership.web.base_app import create_app
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'1': 2, '10': 3, '+Inf': 4}
+    assert snapshot['count'] == 4
+    assert snapshot['sum'] == 56.5
+
+
+def test_track_queries_counts_statements():
+    engine = get_engine()
+    with track_queries() as outer:
+        engine.execute('SELECT 1')
+        with track_queries() as inner:
+            engine.execute('SELECT 2')
+    engine.execute('SELECT 3')
+    assert outer.count == 2
+    assert inner.count == 1
+    assert inner.statements == ['SELECT 2']
+
+
+def test_failed_statement_is_not_left_timing():
+    with get_engine().connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute('SELECT * FROM no_such_table')
+        assert conn.info['query_start_time'] == []
+        conn.execute('SELECT 1')
+        assert conn.info['query_start_time'] == []
+
+
+def test_metrics_are_for_admins():
+    metadata.create_all(get_engine())
+    try:
+        session = Session()
+        member = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+        session.add(member)
+        session.commit()
+        client = create_app().test_client()
+        assert client.get('/metrics').status_code == 401
+
+        session.add(Role(member=member, role='admin'))
+        session.commit()
+        session.close()
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        pools = json.loads(response.data.decode('utf-8'))['pools']
+        assert pools and all('url' not in pool for pool in pools)
+    finally:
+        metadata.drop_all(get_engine())
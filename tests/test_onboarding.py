@@ -0,0 +1,94 @@
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Job, Member
+from membership.util import email, jobs
+from membership.web import members as members_api, onboarding
+from membership.web.onboarding import read_csv, upsert_members
+import io
+
+
+class TestOnboarding:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def test_upsert_members(self):
+        session = Session()
+        session.add(Member(first_name='Old', last_name='Name', email_address='old@example.com'))
+        session.add(Member(first_name='Same', last_name='Name', email_address='same@example.com'))
+        session.add(Member(first_name='Mixed', last_name='Case', email_address='Mixed@Example.com'))
+        session.commit()
+
+        csv_body = io.StringIO(
+            'first_name,last_name,email\n'
+            'New,Name,old@example.com\n'
+            'Same,Name,same@example.com\n'
+            'Rosa,Luxemburg,rosa@example.com\n'
+            'Nobody,,\n'
+            'Rosa,Again,ROSA@example.com\n'
+            'Mixed,Case,mixed@example.com\n')
+        report, created_ids = upsert_members(session, read_csv(csv_body), chunk_size=2)
+
+        assert report['received'] == 6
+        assert report['created'] == 1
+        assert report['updated'] == 2
+        assert report['unchanged'] == 1
+        assert [e['row'] for e in report['errors']] == [4, 5]
+        assert session.query(Member).get(created_ids[0]).email_address == 'rosa@example.com'
+        assert session.query(Member).filter_by(email_address='old@example.com').one().first_name \
+            == 'New'
+        session.close()
+
+    def test_failed_members_are_retried(self, monkeypatch):
+        session = Session()
+        members = [Member(first_name='Member', email_address='{}@retry.example.com'.format(i))
+                   for i in range(3)]
+        session.add_all(members)
+        session.commit()
+        down = {'1@retry.example.com'}
+
+        def create_auth0_user(email_address):
+            if email_address in down:
+                raise Exception('Auth0 is down')
+            return 'url'
+
+        monkeypatch.setattr(members_api, 'create_auth0_user', create_auth0_user)
+        monkeypatch.setattr(onboarding, 'create_auth0_user', create_auth0_user)
+        transport = email.FakeTransport()
+        email.set_mailer(email.Mailer(transport, rate_limit=0))
+        try:
+            batch = jobs.enqueue(session, 'onboard_members',
+                                 {'member_ids': [member.id for member in members]},
+                                 max_attempts=1)
+            session.commit()
+            assert jobs.run_pending(limit=1) == 1
+            session.expire_all()
+            assert batch.status == jobs.SUCCEEDED
+            assert batch.result['provisioned'] == 2
+            retry = session.query(Job).get(batch.result['retry_job_ids'][0])
+            assert retry.kind == 'provision_member'
+            assert retry.max_attempts > 1
+
+            down.clear()
+            assert jobs.run_pending() == 1
+            session.expire_all()
+            assert retry.status == jobs.SUCCEEDED
+            assert len(transport.sent) == 2
+        finally:
+            email.set_mailer(None)
+            session.close()
+
+
+def test_welcome_emails_are_batched():
+    transport = email.FakeTransport()
+    email.set_mailer(email.Mailer(transport, rate_limit=0))
+    try:
+        recipients = {'{}@example.com'.format(i): ('Member', 'url') for i in range(2500)}
+        email.send_welcome_emails(recipients)
+    finally:
+        email.set_mailer(None)
+    assert [len([k for k, v in payload if k == 'to']) for payload in transport.sent] == \
+        [1000, 1000, 500]
@@ -0,0 +1,86 @@
+import json
+import shutil
+import tempfile
+
+from config.auth_config import NO_AUTH_EMAIL
+from membership.database import base
+from membership.database.base import metadata, Session
+from membership.database.models import Committee, Job, Member, Role
+from membership.web.base_app import create_app
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+app = create_app()
+
+
+class TestReplica:
+    """ Two sqlite files stand in for a primary and a replica that has fallen behind it. """
+
+    @classmethod
+    def setup_class(cls):
+        cls.previous = base.engine_registry.settings, base.replica_registry.settings
+        cls.directory = tempfile.mkdtemp()
+        cls.urls = {name: 'sqlite:///{}/{}.db'.format(cls.directory, name)
+                    for name in ('primary', 'replica')}
+        for url in cls.urls.values():
+            engine = create_engine(url)
+            metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            admin = Member(first_name='Joe', last_name='Schmoe', email_address=NO_AUTH_EMAIL)
+            session.add_all([admin, Role(member=admin, role='admin')])
+            session.commit()
+            session.close()
+            engine.dispose()
+        base.configure_engine({'name_or_url': cls.urls['primary']},
+                              {'name_or_url': cls.urls['replica']})
+        cls.client = app.test_client()
+
+    @classmethod
+    def teardown_class(cls):
+        base.configure_engine(*cls.previous)
+        shutil.rmtree(cls.directory)
+
+    def count(self, name, model):
+        engine = create_engine(self.urls[name])
+        session = sessionmaker(bind=engine)()
+        try:
+            return session.query(model).count()
+        finally:
+            session.close()
+            engine.dispose()
+
+    def test_routing(self):
+        # only the replica has the second member yet, and only the primary has the job
+        session = Session()
+        session.add(Job(kind='noop', status='pending'))
+        session.commit()
+        session.close()
+        replica = Session(bind=base.replica_registry.engine)
+        replica.add(Member(first_name='Rosa', email_address='rosa@example.com'))
+        replica.commit()
+        replica.close()
+
+        members = json.loads(self.client.get('/member/list').data.decode('utf-8'))
+        assert [m['email'] for m in members] == [NO_AUTH_EMAIL, 'rosa@example.com']
+        # /job opts out of the replica
+        assert self.client.get('/job?id=1').status_code == 200
+
+        response = self.client.post('/committee', data=json.dumps(
+            {'name': 'Housing', 'admin_list': NO_AUTH_EMAIL}), content_type='application/json')
+        assert response.status_code == 200
+        assert self.count('primary', Committee) == 1
+        assert self.count('replica', Committee) == 0
+
+    def test_session_reads_its_own_writes(self):
+        session = Session(use_replica=True)
+        assert session.get_bind() is base.replica_registry.engine
+        session.query(Member).with_for_update().first()
+        assert session.get_bind() is base.engine_registry.engine
+        session.close()
+
+        session = Session(use_replica=True)
+        session.add(Committee(name='Labor'))
+        session.flush()
+        assert session.query(Committee).filter_by(name='Labor').count() == 1
+        session.rollback()
+        session.close()
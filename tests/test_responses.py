@@ -0,0 +1,39 @@
+import gzip
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from membership.web.base_app import create_app
+from membership.web.util import dumps_json, dumps_orjson, json_backend, json_response, orjson
+
+app = create_app()
+
+DATA = {1: {'when': datetime(2017, 3, 1, 18, 30, 15, 250), 'day': date(2017, 3, 1),
+            'votes': Decimal('12.5'), 'names': ['Rosa', None]}}
+EXPECTED = {'1': {'when': '2017-03-01T18:30:15.000250', 'day': '2017-03-01', 'votes': '12.5',
+                  'names': ['Rosa', None]}}
+
+
+class TestResponses:
+    def test_backends_agree(self):
+        assert json.loads(dumps_json(DATA).decode('utf-8')) == EXPECTED
+        if orjson is not None:
+            assert json.loads(dumps_orjson(DATA).decode('utf-8')) == EXPECTED
+            assert json_backend('auto') is dumps_orjson
+        assert json_backend('json') is dumps_json
+
+    def test_compression(self):
+        data = [{'id': i, 'name': 'Member {}'.format(i)} for i in range(200)]
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = json_response(data)
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert 'Accept-Encoding' in response.headers['Vary']
+            assert json.loads(gzip.decompress(response.get_data()).decode('utf-8')) == data
+
+            small = json_response({'status': 'success'})
+            assert 'Content-Encoding' not in small.headers
+
+        with app.test_request_context():
+            response = json_response(data)
+            assert 'Content-Encoding' not in response.headers
+            assert json.loads(response.get_data().decode('utf-8')) == data
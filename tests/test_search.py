@@ -0,0 +1,68 @@
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Member
+from membership.util.search import MemberSearchIndex
+
+
+class TestSearch:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        session.add_all([
+            Member(first_name='Rosa', last_name='Luxemburg', email_address='rosa@example.com'),
+            Member(first_name='Eugene', last_name='Debs', email_address='gene@example.com'),
+            Member(first_name='Ambrose', last_name='Bierce', email_address='ab@example.com'),
+            Member(first_name='Rose', last_name='Schneiderman', email_address='rs@example.com'),
+        ])
+        session.commit()
+        cls.index = MemberSearchIndex()
+        cls.index.refresh(session)
+        session.close()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def names(self, query, limit=20):
+        return [m.name for m in self.index.search(query, limit)]
+
+    def test_prefix_ranks_above_substring(self):
+        assert self.names('ros') == ['Rosa Luxemburg', 'Rose Schneiderman', 'Ambrose Bierce']
+        assert self.names('ros', limit=1) == ['Rosa Luxemburg']
+
+    def test_short_queries_match_prefixes(self):
+        assert self.names('de') == ['Eugene Debs']
+        assert self.names('e')[0] == 'Eugene Debs'
+
+    def test_full_name_and_email(self):
+        assert self.names('rosa  LUX') == ['Rosa Luxemburg']
+        assert self.names('gene@ex') == ['Eugene Debs']
+        assert self.names('xyz') == []
+
+    def test_incremental_updates(self):
+        session = Session()
+        member = Member(first_name='Lucy', last_name='Parsons', email_address='lucy@example.com')
+        session.add(member)
+        session.commit()
+        self.index.refresh(session)
+        assert self.names('parsons') == ['Lucy Parsons']
+
+        self.index.add(member.id, 'Lucy', 'Gonzalez', 'lucy@example.com')
+        assert self.names('parsons') == []
+        assert self.names('gonz') == ['Lucy Gonzalez']
+        session.close()
+
+    def test_changes_from_other_processes(self):
+        # another worker's index, loaded before the change
+        other = MemberSearchIndex()
+        session = Session()
+        other.refresh(session)
+        member = session.query(Member).filter_by(email_address='ab@example.com').one()
+        member.last_name = 'Bierce-Smith'
+        session.add(Member(first_name='Mother', last_name='Jones', email_address='mj@example.com'))
+        session.commit()
+
+        other.refresh(session)
+        assert [m.name for m in other.search('bierce')] == ['Ambrose Bierce-Smith']
+        assert [m.name for m in other.search('jones')] == ['Mother Jones']
+        session.close()
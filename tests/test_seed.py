@@ -0,0 +1,36 @@
+from membership.database.base import create_engine_from_settings, metadata
+from membership.database.models import AttendanceSummary, Attendee, EligibleVoter, Member, Vote
+from membership.util.seed import seed_dataset
+from sqlalchemy import func, select
+
+
+def seeded(path, **kwargs):
+    engine = create_engine_from_settings({'name_or_url': 'sqlite:///{}'.format(path)})
+    metadata.create_all(engine)
+    return engine, seed_dataset(engine, **kwargs)
+
+
+def test_seed_is_deterministic(tmpdir):
+    first, counts = seeded(tmpdir.join('first.db'), members=300, seed=7, chunk_size=100)
+    second, _ = seeded(tmpdir.join('second.db'), members=300, seed=7, chunk_size=100)
+    other, _ = seeded(tmpdir.join('other.db'), members=300, seed=8, chunk_size=100)
+    assert counts['members'] == 300
+    for table in (Member.__table__, Attendee.__table__, Vote.__table__):
+        # except when the rows were written
+        columns = [column for column in table.c if column.name != 'updated_at']
+        query = select(columns).order_by(table.c.id)
+        assert first.execute(query).fetchall() == second.execute(query).fetchall()
+    query = Attendee.__table__.select().order_by(Attendee.id)
+    assert first.execute(query).fetchall() != other.execute(query).fetchall()
+
+
+def test_seed_is_consistent(tmpdir):
+    engine, counts = seeded(tmpdir.join('seed.db'), members=500, elections=2)
+    # seeding again adds to what is there
+    more = seed_dataset(engine, 100, elections=1, seed=1)
+    assert engine.scalar(select([func.count()]).select_from(Member.__table__)) == 600
+    assert engine.scalar(select([func.sum(AttendanceSummary.count)])) == \
+        counts['attendees'] + more['attendees']
+    voted = engine.scalar(select([func.count()]).select_from(EligibleVoter.__table__)
+                          .where(EligibleVoter.voted))
+    assert voted == counts['votes'] + more['votes']
@@ -0,0 +1,45 @@
+import json
+
+from membership.database.base import get_engine, metadata, Session
+from membership.database.models import Committee, Member, Role
+from membership.util.metrics import track_queries
+from membership.web.util import new_alchemy_encoder, serialization_plan
+
+
+class TestSerializer:
+    @classmethod
+    def setup_class(cls):
+        metadata.create_all(get_engine())
+        session = Session()
+        member = Member(first_name='Rosa', last_name='L', email_address='rosa@example.com')
+        session.add(Role(member=member, committee=Committee(name='Housing'), role='admin'))
+        session.commit()
+        session.close()
+
+    @classmethod
+    def teardown_class(cls):
+        metadata.drop_all(get_engine())
+
+    def test_plan(self):
+        plan = serialization_plan(Member)
+        assert plan.columns == ('id', 'first_name', 'last_name', 'email_address', 'biography',
+                                'updated_at')
+        assert plan.properties == ('name',)
+        assert plan.relationships == {'eligible_votes': True, 'meetings_attended': True,
+                                      'roles': True}
+
+    def test_only_expanded_relationships_are_loaded(self):
+        session = Session()
+        member = session.query(Member).one()
+        with track_queries() as queries:
+            encoded = json.loads(json.dumps(member, cls=new_alchemy_encoder()))
+        assert encoded.pop('updated_at') == member.updated_at.isoformat()
+        assert encoded == {'id': 1, 'first_name': 'Rosa', 'last_name': 'L', 'name': 'Rosa L',
+                           'email_address': 'rosa@example.com', 'biography': None}
+        assert queries.count == 0
+
+        encoded = json.loads(json.dumps([member], cls=new_alchemy_encoder(['roles', 'member'])))
+        # the role's member is the member being serialized
+        assert encoded[0]['roles'] == [{'id': 1, 'committee_id': 1, 'member_id': 1,
+                                        'role': 'admin', 'member': None}]
+        session.close()
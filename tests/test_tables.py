@@ -1,12 +1,12 @@
 from membership.database import models
-from membership.database.base import engine, metadata, Base
+from membership.database.base import get_engine, metadata, Base
 
 
 class TestTables:
 
     def test_tables(self):
-        metadata.create_all(engine)
-        metadata.drop_all(engine)
+        metadata.create_all(get_engine())
+        metadata.drop_all(get_engine())
 
     def test_constructors(self):
         """